@@ -0,0 +1,22 @@
+import asyncio
+import sys
+sys.path.insert(0, '.')
+
+from server.database.config import init_db, close_db
+from server.services import prompt_overrides
+
+async def migrate_user_prompts():
+    await init_db()
+    
+    dry_run = "--dry-run" in sys.argv
+    result = await prompt_overrides.compact_all(dry_run=dry_run)
+    print(f"{'🔍 预览' if dry_run else '✅ 用户提示词已压缩为覆盖条目'}")
+    print(f"   扫描记录: {result['scanned']}")
+    print(f"   改写记录: {result['updated']}")
+    print(f"   压缩前: {result['bytes_before']} 字节")
+    print(f"   压缩后: {result['bytes_after']} 字节")
+    print(f"   节省: {result['bytes_saved']} 字节")
+    
+    await close_db()
+
+asyncio.run(migrate_user_prompts())
@@ -13,6 +13,13 @@ from .user_config import router as user_config_router
 from .user_local_data import router as user_local_data_router
 from .prompts import router as prompts_router
 from .user_prompts import router as user_prompts_router
+from .tokens import router as tokens_router
+from .embeddings import router as embeddings_router
+from .memories import router as memories_router
+from .presence import router as presence_router
+from .push import router as push_router
+from .worlds import router as worlds_router
+from .travel import router as travel_router
 
 
 api_v1_router = APIRouter(prefix="/api/v1")
@@ -30,3 +37,10 @@ api_v1_router.include_router(user_config_router)
 api_v1_router.include_router(user_local_data_router)
 api_v1_router.include_router(prompts_router)
 api_v1_router.include_router(user_prompts_router)
+api_v1_router.include_router(tokens_router)
+api_v1_router.include_router(embeddings_router)
+api_v1_router.include_router(memories_router)
+api_v1_router.include_router(presence_router)
+api_v1_router.include_router(push_router)
+api_v1_router.include_router(worlds_router)
+api_v1_router.include_router(travel_router)
@@ -1,13 +1,17 @@
 """
 管理员路由 - 用户管理、数据管理等
 """
-from fastapi import APIRouter, HTTPException, status, Depends
+from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from fastapi.responses import Response
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
 
-from ...models import User, Character, World, Talent, Origin, SpiritRoot, TalentTier, UserLocalData, DefaultPromptConfig, UserPromptConfig
+from ...models import User, Character, World, Talent, Origin, SpiritRoot, TalentTier, UserLocalData, UserPromptConfig, TravelPointLedger, AdminJob, AdminAuditLog
 from ...core.security import require_admin, get_password_hash
+from ...services import travel_points as travel_points_service
+from ...services import catalog, stats, admin_jobs, cascade_delete, bulk_users, user_cache, prompt_defaults, prompt_overrides, llm_gateway, ai_cache, ai_coalesce, prompt_assembly, embeddings, vector_memory, presence, push, travel, event_log, map_graph, world_directory, world_state
+from .prompts import default_prompts_response
 import json
 from urllib.parse import quote
 
@@ -87,32 +91,65 @@ async def update_user(user_id: int, data: UserUpdateRequest):
         if existing:
             raise HTTPException(status_code=400, detail="该账号ID已被占用")
     
+    if data.travel_points is not None and data.travel_points < 0:
+        raise HTTPException(status_code=400, detail="穿越点数不能为负数")
+    
     user.user_name = data.user_name
     user.account_id = data.account_id
     user.email = data.email
     user.is_admin = data.is_admin
-    if data.travel_points is not None:
-        if data.travel_points < 0:
-            raise HTTPException(status_code=400, detail="穿越点数不能为负数")
-        user.travel_points = data.travel_points
+    update_fields = ["user_name", "account_id", "email", "is_admin", "updated_at"]
     
     if data.password:
         user.password_hash = get_password_hash(data.password)
+        update_fields.append("password_hash")
     
-    await user.save()
+    # 点数不随整行写回，走流水以免覆盖并发扣减
+    await user.save(update_fields=update_fields)
+    user_cache.invalidate([user_id])
+    if data.travel_points is not None:
+        await travel_points_service.set_points(user_id, data.travel_points, reason="管理员修改用户信息")
     return {"message": "更新成功"}
 
 
 @router.put("/users/{user_id}/travel_points", dependencies=[Depends(require_admin)])
 async def update_user_travel_points(user_id: int, points: int):
     """更新用户穿越点数"""
-    user = await User.filter(id=user_id).first()
-    if not user:
+    if points < 0:
+        raise HTTPException(status_code=400, detail="穿越点数不能为负数")
+    balance = await travel_points_service.set_points(user_id, points, reason="管理员调整")
+    if balance is None:
         raise HTTPException(status_code=404, detail="用户不存在")
-    
-    user.travel_points = points
-    await user.save()
-    return {"message": "更新成功", "travel_points": user.travel_points}
+    return {"message": "更新成功", "travel_points": balance}
+
+
+class TravelPointLedgerItem(BaseModel):
+    id: int
+    kind: str
+    delta: int
+    balance_after: int
+    reason: Optional[str]
+    created_at: str
+
+
+@router.get("/users/{user_id}/travel_points/ledger", response_model=List[TravelPointLedgerItem], dependencies=[Depends(require_admin)])
+async def list_user_travel_point_ledger(user_id: int, before_id: Optional[int] = None, limit: int = 50):
+    """获取用户穿越点数流水（按ID倒序，before_id 翻页）"""
+    query = TravelPointLedger.filter(user_id=user_id)
+    if before_id is not None:
+        query = query.filter(id__lt=before_id)
+    entries = await query.order_by("-id").limit(min(max(limit, 1), 200))
+    return [
+        TravelPointLedgerItem(
+            id=e.id,
+            kind=e.kind,
+            delta=e.delta,
+            balance_after=e.balance_after,
+            reason=e.reason,
+            created_at=e.created_at.isoformat()
+        )
+        for e in entries
+    ]
 
 
 @router.put("/users/{user_id}/active", dependencies=[Depends(require_admin)])
@@ -122,24 +159,231 @@ async def toggle_user_active(user_id: int, is_active: bool):
     if not user:
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    user.is_active = is_active
-    await user.save()
+    if user.is_active != is_active:
+        user.is_active = is_active
+        await user.save(update_fields=["is_active", "updated_at"])
+        stats.incr(stats.USERS_ENABLED, 1 if is_active else -1)
+        user_cache.set_active([user_id], is_active)
     return {"message": "更新成功", "is_active": user.is_active}
 
 
-@router.delete("/users/{user_id}", dependencies=[Depends(require_admin)])
-async def delete_user(user_id: int):
-    """删除用户"""
-    user = await User.filter(id=user_id).first()
-    if not user:
+class UserFilter(BaseModel):
+    """批量操作的用户筛选条件（各条件之间为“且”，管理员账号始终排除）"""
+    user_name_contains: Optional[str] = None
+    email_contains: Optional[str] = None
+    is_active: Optional[bool] = None
+    registered_after: Optional[datetime] = None
+    registered_before: Optional[datetime] = None
+    last_login_before: Optional[datetime] = None
+    never_logged_in: Optional[bool] = None
+
+
+class BulkUserTarget(BaseModel):
+    user_ids: Optional[List[int]] = None
+    filter: Optional[UserFilter] = None
+
+
+def _filter_users_query(target: BulkUserTarget):
+    """根据ID列表或筛选条件构造用户查询（筛选条件全部为空时拒绝，避免命中全部用户）"""
+    if target.user_ids is None and target.filter is None:
+        raise HTTPException(status_code=400, detail="必须提供 user_ids 或 filter")
+    query = User.filter(is_admin=False)
+    if target.user_ids is not None:
+        query = query.filter(id__in=target.user_ids)
+    f = target.filter
+    if f:
+        conditions = 0
+        if f.user_name_contains and f.user_name_contains.strip():
+            query = query.filter(user_name__icontains=f.user_name_contains.strip())
+            conditions += 1
+        if f.email_contains and f.email_contains.strip():
+            query = query.filter(email__icontains=f.email_contains.strip())
+            conditions += 1
+        if f.is_active is not None:
+            query = query.filter(is_active=f.is_active)
+            conditions += 1
+        if f.registered_after:
+            query = query.filter(created_at__gte=f.registered_after)
+            conditions += 1
+        if f.registered_before:
+            query = query.filter(created_at__lt=f.registered_before)
+            conditions += 1
+        if f.last_login_before:
+            query = query.filter(last_login__lt=f.last_login_before)
+            conditions += 1
+        if f.never_logged_in is not None:
+            query = query.filter(last_login__isnull=f.never_logged_in)
+            conditions += 1
+        if not conditions and target.user_ids is None:
+            raise HTTPException(status_code=400, detail="筛选条件不能为空")
+    return query
+
+
+@router.delete("/users/{user_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_user(user_id: int, admin: Dict[str, Any] = Depends(require_admin)):
+    """删除用户（提交后台级联删除任务）"""
+    if not await User.filter(id=user_id).exists():
         raise HTTPException(status_code=404, detail="用户不存在")
     
-    # 删除用户的所有角色/存档
-    await Character.filter(user_id=user_id).delete()
-    
-    # 删除用户
-    await user.delete()
-    return {"message": "删除成功"}
+    job = await cascade_delete.submit_delete_users([user_id], created_by=admin.get("user_id"))
+    return {"message": "删除任务已提交", "job_id": job.id}
+
+
+class BulkDeleteRequest(BulkUserTarget):
+    # 须与命中的用户数一致才会删除；不一致时返回实际命中数
+    confirm_count: Optional[int] = None
+
+
+@router.post("/users/bulk-delete", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_delete_users(target: BulkDeleteRequest, admin: Dict[str, Any] = Depends(require_admin)):
+    """批量删除用户（按ID列表或筛选条件，确认命中数后提交后台级联删除任务）"""
+    user_ids = await _filter_users_query(target).order_by("id").values_list("id", flat=True)
+    if not user_ids:
+        raise HTTPException(status_code=400, detail="没有符合条件的用户")
+    if target.confirm_count != len(user_ids):
+        raise HTTPException(status_code=400, detail=f"将删除 {len(user_ids)} 个用户，请提交 confirm_count={len(user_ids)} 确认")
+    job = await cascade_delete.submit_delete_users(list(user_ids), created_by=admin.get("user_id"))
+    return {"message": "删除任务已提交", "job_id": job.id, "total": len(user_ids)}
+
+
+class BulkTravelPointsRequest(BulkUserTarget):
+    amount: int
+    reason: Optional[str] = None
+
+
+class BulkActiveRequest(BulkUserTarget):
+    is_active: bool
+
+
+@router.post("/users/bulk/travel_points")
+async def bulk_grant_travel_points(payload: BulkTravelPointsRequest, admin: Dict[str, Any] = Depends(require_admin)):
+    """批量发放穿越点数（按ID列表或筛选条件）"""
+    if payload.amount <= 0:
+        raise HTTPException(status_code=400, detail="发放点数必须大于0")
+    user_ids = await _filter_users_query(payload).order_by("id").values_list("id", flat=True)
+    result = await bulk_users.grant_travel_points(list(user_ids), payload.amount, admin.get("user_id"), payload.reason)
+    return {"message": "更新成功", **result}
+
+
+@router.post("/users/bulk/active")
+async def bulk_set_user_active(payload: BulkActiveRequest, admin: Dict[str, Any] = Depends(require_admin)):
+    """批量启用/禁用用户（按ID列表或筛选条件）"""
+    user_ids = await _filter_users_query(payload).order_by("id").values_list("id", flat=True)
+    result = await bulk_users.set_active(list(user_ids), payload.is_active, admin.get("user_id"))
+    return {"message": "更新成功", **result}
+
+
+@router.get("/audit-logs", dependencies=[Depends(require_admin)])
+async def list_audit_logs(action: str = "", skip: int = 0, limit: int = 50):
+    """获取管理员操作审计记录"""
+    query = AdminAuditLog.all()
+    if action:
+        query = query.filter(action=action)
+    logs = await query.order_by("-id").offset(skip).limit(limit)
+    return [
+        {
+            "id": log.id,
+            "admin_id": log.admin_id,
+            "action": log.action,
+            "params": log.params,
+            "target_count": len(log.target_ids or []),
+            "affected": log.affected,
+            "created_at": log.created_at.isoformat(),
+        }
+        for log in logs
+    ]
+
+
+@router.get("/ai/gateway", dependencies=[Depends(require_admin)])
+async def get_ai_gateway_metrics():
+    """AI 生成网关各提供商的请求统计"""
+    return {
+        "http2": llm_gateway.HTTP2_AVAILABLE,
+        "providers": llm_gateway.get_metrics(),
+        "cache": ai_cache.get_metrics(),
+        "coalesce": ai_coalesce.get_metrics(),
+        "prompt_assembly": prompt_assembly.get_metrics(),
+        "embeddings": embeddings.get_metrics(),
+        "vector_memory": vector_memory.get_metrics(),
+    }
+
+
+@router.delete("/ai/cache", dependencies=[Depends(require_admin)])
+async def clear_ai_cache():
+    """清空 AI 响应缓存"""
+    return {"message": "已清空", "removed": await ai_cache.clear()}
+
+
+@router.delete("/ai/embeddings/cache", dependencies=[Depends(require_admin)])
+async def clear_embedding_cache():
+    """清空 Embedding 向量缓存"""
+    return {"message": "已清空", "removed": embeddings.clear()}
+
+
+# === 后台任务 ===
+@router.get("/jobs", dependencies=[Depends(require_admin)])
+async def list_admin_jobs(kind: str = "", skip: int = 0, limit: int = 50):
+    """获取后台任务列表"""
+    query = AdminJob.all()
+    if kind:
+        query = query.filter(kind=kind)
+    jobs = await query.order_by("-id").offset(skip).limit(limit)
+    return [admin_jobs.serialize(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}", dependencies=[Depends(require_admin)])
+async def get_admin_job(job_id: int):
+    """获取后台任务进度"""
+    job = await AdminJob.get_or_none(id=job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return admin_jobs.serialize(job)
+
+
+@router.post("/jobs/{job_id}/cancel", dependencies=[Depends(require_admin)])
+async def cancel_admin_job(job_id: int):
+    """取消未完成的后台任务"""
+    if not await admin_jobs.cancel(job_id):
+        raise HTTPException(status_code=400, detail="任务不存在或已结束")
+    return {"message": "任务已取消"}
+
+
+# === 统计 ===
+@router.get("/stats", dependencies=[Depends(require_admin)])
+async def get_admin_stats():
+    """获取后台统计（读取增量维护的计数器）"""
+    return await stats.get_stats()
+
+
+@router.post("/stats/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_admin_stats():
+    """全量重算统计计数器"""
+    await stats.reconcile()
+    return await stats.get_stats()
+
+
+@router.get("/presence", dependencies=[Depends(require_admin)])
+async def get_presence_metrics():
+    """在线人数与心跳统计"""
+    return presence.get_metrics()
+
+
+@router.get("/push", dependencies=[Depends(require_admin)])
+async def get_push_metrics():
+    """推送通道连接数、订阅主题数与队列统计"""
+    return push.get_metrics()
+
+
+@router.get("/travel", dependencies=[Depends(require_admin)])
+async def get_travel_metrics():
+    """进行中的穿越会话数、状态落库、事件日志、地图缓存、世界列表缓存与世界数据更新统计"""
+    return {
+        **travel.get_metrics(),
+        "event_log": event_log.get_metrics(),
+        "map_graph": map_graph.get_metrics(),
+        "world_directory": world_directory.get_metrics(),
+        "world_state": world_state.get_metrics(),
+    }
 
 
 # === 存档管理 ===
@@ -245,8 +489,10 @@ async def update_save(save_id: int, payload: Dict[str, Any]):
         raise HTTPException(status_code=404, detail="存档不存在")
     if not isinstance(payload, dict):
         raise HTTPException(status_code=400, detail="请求体必须为JSON对象")
+    size_delta = stats.json_size(payload) - stats.json_size(character.save_data)
     character.save_data = payload
     await character.save()
+    stats.incr(stats.SAVE_BYTES, size_delta)
     return {"message": "更新成功"}
 
 
@@ -258,6 +504,8 @@ async def delete_save(save_id: int):
         raise HTTPException(status_code=404, detail="存档不存在")
     
     await character.delete()
+    stats.incr(stats.SAVES_TOTAL, -1)
+    stats.incr(stats.SAVE_BYTES, -stats.json_size(character.save_data))
     return {"message": "删除成功"}
 
 
@@ -308,9 +556,13 @@ async def update_local_data(user_id: int, payload: Dict[str, Any]):
     saves = payload.get("saves")
     if not isinstance(characters, dict) or not isinstance(saves, dict):
         raise HTTPException(status_code=400, detail="characters/saves 必须为JSON对象")
+    size_delta = (stats.json_size(characters) + stats.json_size(saves)) - (
+        stats.json_size(record.characters_json) + stats.json_size(record.saves_json)
+    )
     record.characters_json = characters
     record.saves_json = saves
     await record.save()
+    stats.incr(stats.SAVE_BYTES, size_delta)
     return {"message": "更新成功"}
 
 
@@ -340,27 +592,23 @@ async def delete_local_data(user_id: int):
     if not record:
         raise HTTPException(status_code=404, detail="本地存档数据不存在")
     await record.delete()
+    stats.incr(stats.LOCAL_DATA_TOTAL, -1)
+    stats.incr(stats.SAVE_BYTES, -(stats.json_size(record.characters_json) + stats.json_size(record.saves_json)))
     return {"message": "删除成功"}
 
 
 # === 默认提示词配置（管理员） ===
 @router.get("/default-prompts", dependencies=[Depends(require_admin)])
-async def get_default_prompts():
-    record = await DefaultPromptConfig.first()
-    return {"prompts": record.prompts_json if record else {}}
+async def get_default_prompts(request: Request):
+    return await default_prompts_response(request)
 
 
 @router.put("/default-prompts", dependencies=[Depends(require_admin)])
 async def update_default_prompts(payload: DefaultPromptsPayload):
     if not isinstance(payload.prompts, dict):
         raise HTTPException(status_code=400, detail="prompts 必须为JSON对象")
-    record = await DefaultPromptConfig.first()
-    if record:
-        record.prompts_json = payload.prompts
-        await record.save()
-    else:
-        await DefaultPromptConfig.create(prompts_json=payload.prompts)
-    return {"message": "更新成功"}
+    defaults = await prompt_defaults.save(payload.prompts)
+    return {"message": "更新成功", "version": defaults.version}
 
 
 # === 用户提示词配置（管理员） ===
@@ -382,38 +630,42 @@ async def list_user_prompts(user_name: str = "", skip: int = 0, limit: int = 100
     ]
 
 
+@router.post("/user-prompts/compact", dependencies=[Depends(require_admin)])
+async def compact_user_prompts(dry_run: bool = False):
+    """把用户提示词压缩为仅存与默认提示词不同的条目，返回节省的字节数"""
+    return await prompt_overrides.compact_all(dry_run=dry_run)
+
+
 @router.get("/user-prompts/{user_id}", dependencies=[Depends(require_admin)])
 async def get_user_prompts_detail(user_id: int):
     record = await UserPromptConfig.get_or_none(user_id=user_id).prefetch_related("user")
     if not record:
         raise HTTPException(status_code=404, detail="用户提示词不存在")
+    defaults = await prompt_defaults.get()
     return {
         "user_id": record.user_id,
         "user_name": record.user.user_name if record.user_id else None,
         "created_at": record.created_at.isoformat(),
         "updated_at": record.updated_at.isoformat(),
-        "prompts": record.prompts_json or {},
+        "prompts": prompt_overrides.merge(record.prompts_json, defaults.prompts),
+        "overrides": prompt_overrides.diff(record.prompts_json or {}, defaults.prompts),
     }
 
 
 @router.put("/user-prompts/{user_id}", dependencies=[Depends(require_admin)])
 async def update_user_prompts(user_id: int, payload: DefaultPromptsPayload):
-    record = await UserPromptConfig.get_or_none(user_id=user_id)
-    if not record:
+    if not await UserPromptConfig.filter(user_id=user_id).exists():
         raise HTTPException(status_code=404, detail="用户提示词不存在")
     if not isinstance(payload.prompts, dict):
         raise HTTPException(status_code=400, detail="prompts 必须为JSON对象")
-    record.prompts_json = payload.prompts
-    await record.save()
+    await prompt_overrides.save_prompts(user_id, payload.prompts)
     return {"message": "更新成功"}
 
 
 @router.delete("/user-prompts/{user_id}", dependencies=[Depends(require_admin)])
 async def delete_user_prompts(user_id: int):
-    record = await UserPromptConfig.get_or_none(user_id=user_id)
-    if not record:
+    if not await prompt_overrides.clear_prompts(user_id):
         raise HTTPException(status_code=404, detail="用户提示词不存在")
-    await record.delete()
     return {"message": "删除成功"}
 
 
@@ -422,6 +674,7 @@ async def delete_user_prompts(user_id: int):
 async def create_world(name: str, description: str, order: int = 0):
     """创建世界"""
     world = await World.create(name=name, description=description, order=order)
+    catalog.bump_version()
     return {"message": "创建成功", "id": world.id}
 
 
@@ -437,6 +690,8 @@ async def update_world(world_id: int, name: str, description: str, is_active: bo
     world.is_active = is_active
     world.order = order
     await world.save()
+    await catalog.forget_object("world", world_id)
+    catalog.bump_version()
     return {"message": "更新成功"}
 
 
@@ -448,4 +703,15 @@ async def delete_world(world_id: int):
         raise HTTPException(status_code=404, detail="世界不存在")
     
     await world.delete()
+    await catalog.forget_object("world", world_id)
+    catalog.bump_version()
     return {"message": "删除成功"}
+
+
+@router.post("/catalog/fold-duplicates", dependencies=[Depends(require_admin)])
+async def fold_catalog_duplicates(content_type: Optional[str] = None, dry_run: bool = False):
+    """合并世界/出身/改造核心/天赋中的重复内容并补齐去重索引"""
+    if content_type is not None and content_type not in catalog.DEDUPE_MODELS:
+        raise HTTPException(status_code=400, detail="不支持的内容类型")
+    types = [content_type] if content_type else list(catalog.DEDUPE_MODELS)
+    return {t: await catalog.fold_duplicates(t, dry_run=dry_run) for t in types}
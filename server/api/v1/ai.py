@@ -1,31 +1,66 @@
 """
-AI 生成内容保存与兑换码消耗
+AI 生成网关、生成内容保存与兑换码消耗
 """
+from collections import defaultdict
 from fastapi import APIRouter, HTTPException, status, Depends
-from pydantic import BaseModel
-from typing import Literal, Optional, Dict, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, Dict, Any, List, Tuple, Type
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F, Q
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
 
 from ...models import World, TalentTier, Origin, SpiritRoot, Talent, RedemptionCode
 from ...core.security import get_current_user_id, get_beijing_time
+from ...core.config import settings
+from ...services import catalog, stats, llm_gateway, ai_cache, ai_coalesce, prompt_assembly
 
 
 router = APIRouter(prefix="/ai", tags=["ai"])
 
+ContentType = Literal["world", "talent_tier", "origin", "spirit_root", "talent"]
+
+# 单次批量保存的最大条目数
+MAX_BATCH_ITEMS = 100
+
+
+class GenerateMessage(BaseModel):
+    role: Literal["system", "user", "assistant"]
+    content: str
+
+
+class GenerateRequest(BaseModel):
+    messages: List[GenerateMessage] = Field(min_length=1)
+    api_id: Optional[str] = None  # 用户 API 配置中的条目ID
+    usage: Optional[str] = None  # 功能类型（按 apiAssignments 选择 API）
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = Field(default=None, gt=0)
+    stream: bool = True
+    cache: Optional[bool] = None  # 是否使用响应缓存；默认仅 temperature=0 的确定性请求使用
+    system_prompt_hash: Optional[str] = None  # 引用 /prompts/assembled 组装好的系统提示词
+    system_prompt_vars: Optional[Dict[str, str]] = None  # 替换系统提示词中的 {{变量}}
+
 
 class AISaveRequest(BaseModel):
     code: str
-    type: Literal["world", "talent_tier", "origin", "spirit_root", "talent"]
+    type: ContentType
     content: Dict[str, Any]
 
 
-@router.post("/save", status_code=status.HTTP_201_CREATED)
-async def save_ai_content(
-    payload: AISaveRequest,
-    user_id: int = Depends(get_current_user_id)
-):
-    """保存 AI 生成内容并消耗兑换码"""
-    # 验证兑换码
-    code = payload.code.strip()
+class AISaveItem(BaseModel):
+    type: ContentType
+    content: Dict[str, Any]
+
+
+class AIBatchSaveRequest(BaseModel):
+    code: str
+    items: List[AISaveItem] = Field(min_length=1, max_length=MAX_BATCH_ITEMS)
+
+
+async def _get_valid_code(raw_code: str) -> RedemptionCode:
+    """校验兑换码（不消耗次数）"""
+    code = raw_code.strip()
     if not code:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="兑换码不能为空")
 
@@ -39,109 +74,291 @@ async def save_ai_content(
     if item.max_uses != -1 and item.times_used >= item.max_uses:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="兑换码已用完")
 
-    content = payload.content or {}
-    content_type = payload.type
-
-    if content_type == "world":
-        name = str(
-            content.get("name")
-            or content.get("world_name")
-            or content.get("title")
-            or content.get("世界名称")
-            or ""
-        ).strip()
-        description = str(
-            content.get("description")
-            or content.get("desc")
-            or content.get("世界描述")
-            or content.get("background")
-            or ""
-        ).strip()
-        if not name or not description:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="世界内容缺少 name 或 description")
-        order = int(content.get("order", 0) or 0)
-        created = await World.create(
-            name=name,
-            description=description,
-            is_active=True,
-            order=order
-        )
-        saved_id = created.id
-    elif content_type == "talent_tier":
-        name = str(content.get("name", "")).strip()
-        if not name:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天资等级缺少 name")
-        description = content.get("description")
-        multiplier = float(content.get("multiplier", 1.0) or 1.0)
-        order = int(content.get("order", 0) or 0)
-        created = await TalentTier.create(
-            name=name,
-            description=description,
-            multiplier=multiplier,
-            order=order
-        )
-        saved_id = created.id
-    elif content_type == "origin":
-        name = str(content.get("name", "")).strip()
-        description = str(content.get("description", "")).strip()
-        if not name or not description:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="出身内容缺少 name 或 description")
-        effects = content.get("effects") if isinstance(content.get("effects"), dict) else None
-        order = int(content.get("order", 0) or 0)
-        created = await Origin.create(
-            name=name,
-            description=description,
-            effects=effects,
-            is_active=True,
-            order=order
-        )
-        saved_id = created.id
-    elif content_type == "spirit_root":
-        name = str(content.get("name", "")).strip()
-        description = str(content.get("description", "")).strip()
-        if not name or not description:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="改造核心内容缺少 name 或 description")
-        elements = content.get("elements") if isinstance(content.get("elements"), dict) else {}
-        order = int(content.get("order", 0) or 0)
-        created = await SpiritRoot.create(
-            name=name,
-            description=description,
-            elements=elements,
-            is_active=True,
-            order=order
-        )
-        saved_id = created.id
-    elif content_type == "talent":
-        name = str(content.get("name", "")).strip()
-        if not name:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天赋内容缺少 name")
-        description = content.get("description")
-        talent_cost = int(content.get("talent_cost", 1) or 1)
-        rarity = int(content.get("rarity", 1) or 1)
-        tier_id = content.get("tier_id")
-        tier = None
-        if tier_id is not None:
-            tier = await TalentTier.filter(id=tier_id).first()
-            if not tier:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天赋 tier_id 不存在")
-        source = str(content.get("source", "ai")).strip() or "ai"
-        effects = content.get("effects") if isinstance(content.get("effects"), dict) else None
-        created = await Talent.create(
-            name=name,
-            description=description,
-            talent_cost=talent_cost,
-            rarity=rarity,
-            tier=tier,
-            source=source,
-            effects=effects,
-            is_active=True
-        )
-        saved_id = created.id
-    else:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="未知内容类型")
-
-    # 消耗兑换码
-    item.times_used += 1
-    await item.save()
-
-    return {"message": "保存成功", "saved_id": saved_id}
+    return item
+
+
+async def _consume_code(item: RedemptionCode, conn) -> None:
+    """原子消耗一次兑换码，并发用尽时回滚整个事务"""
+    updated = await RedemptionCode.filter(
+        Q(max_uses=-1) | Q(times_used__lt=F("max_uses")),
+        id=item.id
+    ).using_db(conn).update(times_used=F("times_used") + 1)
+    if not updated:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="兑换码已用完")
+
+
+def _normalize_world(content: Dict[str, Any]) -> Dict[str, Any]:
+    name = str(
+        content.get("name")
+        or content.get("world_name")
+        or content.get("title")
+        or content.get("世界名称")
+        or ""
+    ).strip()
+    description = str(
+        content.get("description")
+        or content.get("desc")
+        or content.get("世界描述")
+        or content.get("background")
+        or ""
+    ).strip()
+    if not name or not description:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="世界内容缺少 name 或 description")
+    order = int(content.get("order", 0) or 0)
+    return {"name": name, "description": description, "is_active": True, "order": order}
+
+
+def _normalize_talent_tier(content: Dict[str, Any]) -> Dict[str, Any]:
+    name = str(content.get("name", "")).strip()
+    if not name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天资等级缺少 name")
+    description = content.get("description")
+    multiplier = float(content.get("multiplier", 1.0) or 1.0)
+    order = int(content.get("order", 0) or 0)
+    return {"name": name, "description": description, "multiplier": multiplier, "order": order}
+
+
+def _normalize_origin(content: Dict[str, Any]) -> Dict[str, Any]:
+    name = str(content.get("name", "")).strip()
+    description = str(content.get("description", "")).strip()
+    if not name or not description:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="出身内容缺少 name 或 description")
+    effects = content.get("effects") if isinstance(content.get("effects"), dict) else None
+    order = int(content.get("order", 0) or 0)
+    return {"name": name, "description": description, "effects": effects, "is_active": True, "order": order}
+
+
+def _normalize_spirit_root(content: Dict[str, Any]) -> Dict[str, Any]:
+    name = str(content.get("name", "")).strip()
+    description = str(content.get("description", "")).strip()
+    if not name or not description:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="改造核心内容缺少 name 或 description")
+    elements = content.get("elements") if isinstance(content.get("elements"), dict) else {}
+    order = int(content.get("order", 0) or 0)
+    return {"name": name, "description": description, "elements": elements, "is_active": True, "order": order}
+
+
+def _normalize_talent(content: Dict[str, Any]) -> Dict[str, Any]:
+    """天赋字段规范化；tier_id 是否存在由调用方统一校验"""
+    name = str(content.get("name", "")).strip()
+    if not name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天赋内容缺少 name")
+    description = content.get("description")
+    talent_cost = int(content.get("talent_cost", 1) or 1)
+    rarity = int(content.get("rarity", 1) or 1)
+    tier_id = content.get("tier_id")
+    source = str(content.get("source", "ai")).strip() or "ai"
+    effects = content.get("effects") if isinstance(content.get("effects"), dict) else None
+    return {
+        "name": name,
+        "description": description,
+        "talent_cost": talent_cost,
+        "rarity": rarity,
+        "tier_id": tier_id,
+        "source": source,
+        "effects": effects,
+        "is_active": True
+    }
+
+
+# 内容类型 -> (模型, 规范化函数)
+CONTENT_HANDLERS: Dict[str, Tuple[Type[Model], Any]] = {
+    "world": (World, _normalize_world),
+    "talent_tier": (TalentTier, _normalize_talent_tier),
+    "origin": (Origin, _normalize_origin),
+    "spirit_root": (SpiritRoot, _normalize_spirit_root),
+    "talent": (Talent, _normalize_talent),
+}
+
+
+async def _check_tier_ids(tier_ids: List[Any]) -> None:
+    """一次查询校验天赋引用的 tier_id 均存在"""
+    wanted = {tid for tid in tier_ids if tid is not None}
+    if not wanted:
+        return
+    found = set(await TalentTier.filter(id__in=list(wanted)).values_list("id", flat=True))
+    if wanted - found:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="天赋 tier_id 不存在")
+
+
+async def _insert_rows(model: Type[Model], rows: List[Dict[str, Any]], conn) -> List[int]:
+    """
+    在事务内逐条插入同类型内容并按输入顺序返回ID。
+    每批条目不多，逐条 create 直接拿到自增主键，不必插入后再按名称回查（并发事务可能插入同名行）。
+    """
+    return [(await model.create(**row, using_db=conn)).id for row in rows]
+
+
+async def _save_items_once(
+    item: RedemptionCode,
+    rows_by_type: Dict[str, List[Dict[str, Any]]]
+) -> Tuple[Dict[str, List[Tuple[int, bool]]], bool]:
+    """
+    在一个事务内保存各类型内容并消耗兑换码。
+    已存在相同规范化内容的条目直接返回已有ID，批内重复的条目只插入一次。
+    返回 ({类型: [(ID, 是否重复)]}, 是否有新增)。
+    """
+    results: Dict[str, List[Tuple[int, bool]]] = {}
+    created_any = False
+    async with in_transaction() as conn:
+        for content_type, rows in rows_by_type.items():
+            model, _ = CONTENT_HANDLERS[content_type]
+            hashes = [catalog.content_hash(content_type, row) for row in rows]
+            existing = await catalog.find_existing(content_type, hashes, conn)
+
+            # 只插入库中不存在、且在本批中首次出现的内容
+            new_rows, new_hashes, first_seen = [], [], {}
+            for row, digest in zip(rows, hashes):
+                if digest is None or (digest not in existing and digest not in first_seen):
+                    if digest is not None:
+                        first_seen[digest] = len(new_rows)
+                    new_rows.append(row)
+                    new_hashes.append(digest)
+
+            new_ids = await _insert_rows(model, new_rows, conn)
+            created_any = created_any or bool(new_ids)
+            await catalog.register_hashes(
+                content_type,
+                [(digest, oid) for digest, oid in zip(new_hashes, new_ids) if digest is not None],
+                conn
+            )
+
+            type_results, cursor = [], 0
+            for digest in hashes:
+                if digest is not None and digest in existing:
+                    type_results.append((existing[digest], True))
+                elif digest is not None and first_seen[digest] < cursor:
+                    type_results.append((new_ids[first_seen[digest]], True))
+                else:
+                    type_results.append((new_ids[cursor], False))
+                    cursor += 1
+            results[content_type] = type_results
+        await _consume_code(item, conn)
+    stats.incr(stats.REDEMPTION_USES)
+    return results, created_any
+
+
+async def _save_items(
+    item: RedemptionCode,
+    rows_by_type: Dict[str, List[Dict[str, Any]]]
+) -> Dict[str, List[Tuple[int, bool]]]:
+    """保存内容；与并发请求插入了相同内容时重试一次，届时按重复内容处理"""
+    try:
+        results, created_any = await _save_items_once(item, rows_by_type)
+    except IntegrityError:
+        results, created_any = await _save_items_once(item, rows_by_type)
+    if created_any:
+        catalog.bump_version()
+    return results
+
+
+@router.post("/save", status_code=status.HTTP_201_CREATED)
+async def save_ai_content(
+    payload: AISaveRequest,
+    user_id: int = Depends(get_current_user_id)
+):
+    """保存 AI 生成内容并消耗兑换码；内容重复时返回已有ID"""
+    item = await _get_valid_code(payload.code)
+
+    _, normalize = CONTENT_HANDLERS[payload.type]
+    fields = normalize(payload.content or {})
+    if payload.type == "talent":
+        await _check_tier_ids([fields["tier_id"]])
+
+    results = await _save_items(item, {payload.type: [fields]})
+    saved_id, duplicate = results[payload.type][0]
+    return {"message": "保存成功", "saved_id": saved_id, "duplicate": duplicate}
+
+
+@router.post("/save/batch", status_code=status.HTTP_201_CREATED)
+async def save_ai_content_batch(
+    payload: AIBatchSaveRequest,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    批量保存 AI 生成内容：兑换码只校验并消耗一次，
+    各类型内容在同一事务内批量插入，按请求顺序返回保存的ID。
+    """
+    item = await _get_valid_code(payload.code)
+
+    rows_by_type: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    positions: Dict[str, List[int]] = defaultdict(list)
+    for index, entry in enumerate(payload.items):
+        _, normalize = CONTENT_HANDLERS[entry.type]
+        try:
+            fields = normalize(entry.content or {})
+        except HTTPException as e:
+            raise HTTPException(status_code=e.status_code, detail=f"第 {index + 1} 项：{e.detail}")
+        rows_by_type[entry.type].append(fields)
+        positions[entry.type].append(index)
+
+    await _check_tier_ids([row["tier_id"] for row in rows_by_type.get("talent", [])])
+
+    results = await _save_items(item, rows_by_type)
+    saved: List[Optional[Dict[str, Any]]] = [None] * len(payload.items)
+    for content_type, type_results in results.items():
+        for index, (saved_id, duplicate) in zip(positions[content_type], type_results):
+            saved[index] = {"type": content_type, "saved_id": saved_id, "duplicate": duplicate}
+    return {"message": "保存成功", "items": saved}
+
+
+# === 生成网关 ===
+@router.post("/generate")
+async def generate(payload: GenerateRequest, user_id: int = Depends(get_current_user_id)):
+    """
+    使用用户保存的 API 配置生成内容。
+    stream=true 时以 SSE 逐段下发 {"type": "delta" | "done" | "error", ...}；否则返回完整文本。
+    """
+    try:
+        api = await llm_gateway.resolve_user_api(user_id, payload.api_id, payload.usage)
+        messages = [message.model_dump() for message in payload.messages]
+        if payload.system_prompt_hash:
+            assembled = await prompt_assembly.resolve_hash(user_id, payload.system_prompt_hash)
+            if assembled is None:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="系统提示词已更新，请重新获取")
+            content = prompt_assembly.render(assembled.content, payload.system_prompt_vars)
+            messages.insert(0, {"role": "system", "content": content})
+        temperature = payload.temperature if payload.temperature is not None else api.get("temperature", 0.7)
+        max_tokens = payload.max_tokens or api.get("maxTokens") or 4096
+
+        def upstream():
+            return llm_gateway.generate(api, messages, temperature, max_tokens)
+
+        key = llm_gateway.request_hash(api, messages, temperature, max_tokens)
+
+        def cached_upstream():
+            return ai_cache.cached(key, upstream)
+
+        use_cache = payload.cache if payload.cache is not None else temperature == 0
+        source = cached_upstream if use_cache and settings.AI_CACHE_ENABLED else upstream
+        # 相同请求的并发调用合并为一次上游调用；只与使用同一密钥的调用合并，避免借用他人凭据与额度
+        flight_key = f"{key}:{llm_gateway.key_fingerprint(api)}"
+        events = ai_coalesce.coalesced(flight_key, source) if settings.AI_COALESCE_ENABLED else source()
+        if not payload.stream:
+            parts, finish_reason = [], None
+            async for event in events:
+                if event["type"] == "delta":
+                    parts.append(event["text"])
+                else:
+                    finish_reason = event.get("finish_reason")
+            return {"text": "".join(parts), "finish_reason": finish_reason}
+        # 先取到第一个事件，连接或配置错误仍可按普通 HTTP 错误返回
+        first = await events.__anext__()
+    except llm_gateway.GatewayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    async def body():
+        try:
+            yield llm_gateway.sse_event(first)
+            async for event in events:
+                yield llm_gateway.sse_event(event)
+        except llm_gateway.GatewayError as e:
+            yield llm_gateway.sse_event({"type": "error", "message": e.message})
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
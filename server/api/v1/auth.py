@@ -12,10 +12,14 @@ from ...core.security import (
     get_current_user_id, get_current_user_info, get_beijing_time
 )
 from ...core.config import settings
+from ...services import travel_points, stats
 
 
 router = APIRouter(prefix="/auth", tags=["认证"])
 
+# 新用户赠送的穿越点数
+NEW_USER_TRAVEL_POINTS = 100
+
 
 class RegisterRequest(BaseModel):
     user_name: str
@@ -135,8 +139,11 @@ async def register(data: RegisterRequest):
         email=data.email,
         password_hash=password_hash,
         is_admin=False,
-        travel_points=100  # 新用户赠送100穿越点数
+        travel_points=NEW_USER_TRAVEL_POINTS
     )
+    await travel_points.record_initial_grant(user.id, NEW_USER_TRAVEL_POINTS, reason="注册赠送")
+    stats.incr(stats.USERS_TOTAL)
+    stats.incr(stats.USERS_ENABLED)
     
     # 更新邀请码使用次数
     if data.invitation_code:
@@ -179,8 +186,10 @@ async def login(data: LoginRequest):
         )
     
     # 更新最后登录-北京时间时间
+    previous_login = user.last_login
     user.last_login = get_beijing_time()
-    await user.save()
+    await user.save(update_fields=["last_login"])
+    stats.record_login(previous_login)
     
     # TODO: 验证 Turnstile token
     
@@ -232,20 +241,16 @@ async def consume_travel_points(
             detail="扣减点数必须大于0"
         )
 
-    user = await User.filter(id=user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="用户不存在"
-        )
-
-    if user.travel_points < payload.amount:
+    balance = await travel_points.consume_points(user_id, payload.amount)
+    if balance is None:
+        if not await User.filter(id=user_id).exists():
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="用户不存在"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="穿越点数不足"
         )
 
-    user.travel_points -= payload.amount
-    await user.save()
-
-    return ConsumeTravelPointsResponse(travel_points=user.travel_points)
+    return ConsumeTravelPointsResponse(travel_points=balance)
@@ -7,6 +7,7 @@ from typing import Optional
 
 from ...models import Character, User
 from ...core.security import get_current_user_id
+from ...services import stats
 
 
 router = APIRouter(prefix="/characters", tags=["角色管理"])
@@ -40,6 +41,8 @@ async def create_character(
         world_id=data.world_id,
         save_data=data.save_data
     )
+    stats.incr(stats.SAVES_TOTAL)
+    stats.incr(stats.SAVE_BYTES, stats.json_size(data.save_data))
     
     return {
         "message": "角色创建成功",
@@ -85,7 +88,9 @@ async def update_character_save(
             detail="角色不存在"
         )
     
+    size_delta = stats.json_size(save_data) - stats.json_size(character.save_data)
     character.save_data = save_data
     await character.save()
+    stats.incr(stats.SAVE_BYTES, size_delta)
     
     return {"message": "存档更新成功"}
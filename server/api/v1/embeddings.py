@@ -0,0 +1,56 @@
+"""
+Embedding 代理（微批合并 + 向量缓存）
+"""
+import base64
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from typing import List, Literal, Optional, Union
+
+from ...core.security import get_current_user_id
+from ...services import embeddings, llm_gateway
+
+router = APIRouter(prefix="/embeddings", tags=["embeddings"])
+
+# 单次请求的最大文本数
+MAX_INPUTS = 2048
+
+
+class EmbeddingRequest(BaseModel):
+    input: Union[str, List[str]]
+    api_id: Optional[str] = None  # 用户 API 配置中的条目ID
+    usage: Optional[str] = "embedding"  # 功能类型（按 apiAssignments 选择 API）
+    encoding_format: Literal["float", "base64"] = "float"  # base64 为小端 float32 字节
+
+
+def _encode(vector: bytes, encoding_format: str):
+    if encoding_format == "base64":
+        return base64.b64encode(vector).decode("ascii")
+    return embeddings.to_list(vector)
+
+
+@router.post("")
+async def create_embeddings(payload: EmbeddingRequest, user_id: int = Depends(get_current_user_id)):
+    """
+    使用用户保存的 Embedding API 生成向量（OpenAI 兼容响应格式）。
+    并发请求会合并为批量上游调用，已嵌入过的文本直接返回缓存结果。
+    """
+    texts = [payload.input] if isinstance(payload.input, str) else payload.input
+    if not texts:
+        raise HTTPException(status_code=400, detail="输入不能为空")
+    if len(texts) > MAX_INPUTS:
+        raise HTTPException(status_code=400, detail=f"单次最多 {MAX_INPUTS} 条文本")
+    try:
+        api = await llm_gateway.resolve_user_api(user_id, payload.api_id, payload.usage)
+        vectors, cached = await embeddings.embed(api, texts)
+    except llm_gateway.GatewayError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.message)
+
+    return {
+        "object": "list",
+        "model": api.get("model"),
+        "data": [
+            {"object": "embedding", "index": index, "embedding": _encode(vector, payload.encoding_format)}
+            for index, vector in enumerate(vectors)
+        ],
+        "cached": cached,
+    }
@@ -1,17 +1,37 @@
 """
 游戏数据路由 - 世界、天赋、改造核心等
 """
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, List, Optional
 
 from ...models import World, TalentTier, Origin, SpiritRoot, Talent
 from ...core.security import require_admin
+from ...services import catalog
 
 
 router = APIRouter(tags=["游戏数据"])
 
 
+async def _catalog_response(request: Request, key: str, loader: Callable[[], Awaitable[Any]]) -> Response:
+    """按目录版本缓存列表，并支持 If-None-Match 条件请求"""
+    etag = catalog.get_etag()
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    data = catalog.get_cached(key)
+    if data is None:
+        data = catalog.set_cached(key, await loader())
+    return JSONResponse(content=data, headers=headers)
+
+
+@router.get("/catalog/version")
+async def get_catalog_version():
+    """获取游戏目录版本号"""
+    return {"version": catalog.get_version()}
+
+
 # === 世界相关 ===
 class WorldOut(BaseModel):
     id: int
@@ -25,10 +45,12 @@ class WorldOut(BaseModel):
 
 
 @router.get("/worlds/", response_model=List[WorldOut])
-async def list_worlds():
+async def list_worlds(request: Request):
     """获取世界列表"""
-    worlds = await World.filter(is_active=True).order_by("order")
-    return [WorldOut.model_validate(w) for w in worlds]
+    async def load():
+        worlds = await World.filter(is_active=True).order_by("order")
+        return [WorldOut.model_validate(w).model_dump() for w in worlds]
+    return await _catalog_response(request, "worlds", load)
 
 
 # === 天资等级相关 ===
@@ -44,10 +66,12 @@ class TalentTierOut(BaseModel):
 
 
 @router.get("/talent_tiers/", response_model=List[TalentTierOut])
-async def list_talent_tiers():
+async def list_talent_tiers(request: Request):
     """获取天资等级列表"""
-    tiers = await TalentTier.all().order_by("order")
-    return [TalentTierOut.model_validate(t) for t in tiers]
+    async def load():
+        tiers = await TalentTier.all().order_by("order")
+        return [TalentTierOut.model_validate(t).model_dump() for t in tiers]
+    return await _catalog_response(request, "talent_tiers", load)
 
 
 # === 出身相关 ===
@@ -64,10 +88,12 @@ class OriginOut(BaseModel):
 
 
 @router.get("/origins/", response_model=List[OriginOut])
-async def list_origins():
+async def list_origins(request: Request):
     """获取出身列表"""
-    origins = await Origin.filter(is_active=True).order_by("order")
-    return [OriginOut.model_validate(o) for o in origins]
+    async def load():
+        origins = await Origin.filter(is_active=True).order_by("order")
+        return [OriginOut.model_validate(o).model_dump() for o in origins]
+    return await _catalog_response(request, "origins", load)
 
 
 # === 改造核心相关 ===
@@ -84,10 +110,12 @@ class SpiritRootOut(BaseModel):
 
 
 @router.get("/spirit_roots/", response_model=List[SpiritRootOut])
-async def list_spirit_roots():
+async def list_spirit_roots(request: Request):
     """获取改造核心列表"""
-    roots = await SpiritRoot.filter(is_active=True).order_by("order")
-    return [SpiritRootOut.model_validate(r) for r in roots]
+    async def load():
+        roots = await SpiritRoot.filter(is_active=True).order_by("order")
+        return [SpiritRootOut.model_validate(r).model_dump() for r in roots]
+    return await _catalog_response(request, "spirit_roots", load)
 
 
 # === 天赋相关 ===
@@ -107,21 +135,12 @@ class TalentOut(BaseModel):
 
 
 @router.get("/talents/", response_model=List[TalentOut])
-async def list_talents():
+async def list_talents(request: Request):
     """获取天赋列表"""
-    talents = await Talent.filter(is_active=True).prefetch_related("tier")
-    result = []
-    for t in talents:
-        tier_id = t.tier.id if t.tier else None
-        result.append({
-            "id": t.id,
-            "name": t.name,
-            "description": t.description,
-            "talent_cost": t.talent_cost,
-            "rarity": t.rarity,
-            "tier_id": tier_id,
-            "source": t.source,
-            "effects": t.effects,
-            "is_active": t.is_active
-        })
-    return result
+    async def load():
+        talents = await Talent.filter(is_active=True).values(
+            "id", "name", "description", "talent_cost", "rarity",
+            "tier_id", "source", "effects", "is_active"
+        )
+        return [TalentOut(**t).model_dump() for t in talents]
+    return await _catalog_response(request, "talents", load)
@@ -0,0 +1,297 @@
+"""
+向量记忆（按存档保存，跨设备检索）
+"""
+import time
+from array import array
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from ...models import VectorMemory
+from ...core.security import get_current_user_id
+from ...services import embeddings, keyword_index, llm_gateway, vector_memory
+
+router = APIRouter(prefix="/memories", tags=["memories"])
+
+# 单次写入/检索的最大条目数
+MAX_BATCH_ENTRIES = 500
+MAX_BATCH_QUERIES = 32
+MAX_TOP_K = 100
+
+
+class MemoryEntryIn(BaseModel):
+    id: str = Field(min_length=1, max_length=64)
+    content: str = Field(min_length=1)
+    tags: List[str] = []
+    category: str = "other"
+    importance: float = Field(default=5, ge=0, le=10)
+    timestamp: Optional[int] = None  # 毫秒时间戳，默认为当前时间
+    metadata: Optional[Dict[str, Any]] = None
+    vector: Optional[List[float]] = None  # 不提供时由服务端按用户的 Embedding API 生成
+
+
+class MemoryAddRequest(BaseModel):
+    entries: List[MemoryEntryIn] = Field(min_length=1, max_length=MAX_BATCH_ENTRIES)
+    model: Optional[str] = None  # 客户端自带向量时必填
+    api_id: Optional[str] = None
+
+
+class MemoryQuery(BaseModel):
+    text: Optional[str] = None
+    vector: Optional[List[float]] = None
+
+
+class MemorySearchRequest(BaseModel):
+    queries: List[MemoryQuery] = Field(min_length=1, max_length=MAX_BATCH_QUERIES)
+    k: int = Field(default=10, ge=1, le=MAX_TOP_K)
+    importance_weight: float = 0.0
+    recency_weight: float = 0.0
+    recency_half_life_hours: float = Field(default=168.0, gt=0)
+    now: Optional[int] = None  # 计算时效的参考时间（毫秒），默认为当前时间
+    min_score: Optional[float] = None
+    api_id: Optional[str] = None
+
+
+class MemoryHybridQuery(BaseModel):
+    text: str = Field(min_length=1)
+    vector: Optional[List[float]] = None  # 可选：客户端已有的查询向量
+
+
+class MemoryHybridSearchRequest(BaseModel):
+    queries: List[MemoryHybridQuery] = Field(min_length=1, max_length=MAX_BATCH_QUERIES)
+    k: int = Field(default=10, ge=1, le=MAX_TOP_K)
+    vector_weight: float = Field(default=0.6, ge=0)
+    keyword_weight: float = Field(default=0.4, ge=0)
+    tags: Optional[List[str]] = None  # 命中任一标签
+    categories: Optional[List[str]] = None  # 属于任一分类
+    importance_weight: float = 0.0
+    recency_weight: float = 0.0
+    recency_half_life_hours: float = Field(default=168.0, gt=0)
+    now: Optional[int] = None
+    min_score: Optional[float] = None
+    api_id: Optional[str] = None
+
+
+class MemoryDeleteRequest(BaseModel):
+    ids: List[str] = Field(min_length=1, max_length=MAX_BATCH_ENTRIES)
+
+
+def _raise(e: Union[vector_memory.MemoryStoreError, llm_gateway.GatewayError]):
+    raise HTTPException(status_code=e.status_code, detail=e.message)
+
+
+def _to_bytes(vector: List[float]) -> bytes:
+    if not vector:
+        raise HTTPException(status_code=400, detail="向量不能为空")
+    return array("f", vector).tobytes()
+
+
+async def _embed_missing(
+    user_id: int, api_id: Optional[str], texts: List[Optional[str]]
+) -> Tuple[Dict[int, bytes], Optional[str]]:
+    """为 texts 中非 None 的条目生成向量，返回 ({下标: 向量}, 所用模型)"""
+    missing = [index for index, text in enumerate(texts) if text is not None]
+    if not missing:
+        return {}, None
+    api = await llm_gateway.resolve_user_api(user_id, api_id, "embedding")
+    vectors, _ = await embeddings.embed(api, [texts[index] for index in missing])
+    return dict(zip(missing, vectors)), api.get("model")
+
+
+async def _hits_response(
+    user_id: int,
+    slot: str,
+    hits: List[List[Tuple[str, float, float]]],
+    keyword: Optional[List[Dict[str, float]]] = None
+) -> Dict[str, Any]:
+    """按检索结果批量取回记忆内容"""
+    entry_ids = {entry_id for query_hits in hits for entry_id, _, _ in query_hits}
+    records = {
+        record.entry_id: record
+        for record in await VectorMemory.filter(user_id=user_id, slot=slot, entry_id__in=list(entry_ids))
+    }
+    results = []
+    for query_index, query_hits in enumerate(hits):
+        items = []
+        for entry_id, score, similarity in query_hits:
+            if entry_id not in records:
+                continue
+            item = {"entry": _entry_dict(records[entry_id]), "score": score, "similarity": similarity}
+            if keyword is not None:
+                item["keyword"] = keyword[query_index].get(entry_id, 0.0)
+            items.append(item)
+        results.append(items)
+    return {"results": results}
+
+
+def _entry_dict(record: VectorMemory) -> Dict[str, Any]:
+    return {
+        "id": record.entry_id,
+        "content": record.content,
+        "tags": record.tags,
+        "category": record.category,
+        "importance": record.importance,
+        "timestamp": record.timestamp,
+        "metadata": record.metadata,
+    }
+
+
+@router.get("/{slot}")
+async def get_memories(
+    slot: str,
+    skip: int = 0,
+    limit: int = 100,
+    user_id: int = Depends(get_current_user_id)
+):
+    """存档向量记忆概况与条目列表（不含向量，按时间倒序）"""
+    try:
+        async with vector_memory.open_store(user_id, slot) as store:
+            summary = {"count": store.count, "model": store.model, "dimensions": store.dim}
+    except vector_memory.MemoryStoreError as e:
+        _raise(e)
+    records = await VectorMemory.filter(user_id=user_id, slot=slot).order_by("-timestamp").offset(skip).limit(min(limit, 500))
+    return {**summary, "entries": [_entry_dict(record) for record in records]}
+
+
+@router.post("/{slot}")
+async def add_memories(slot: str, payload: MemoryAddRequest, user_id: int = Depends(get_current_user_id)):
+    """批量写入记忆（同ID覆盖）"""
+    # 同一批次内重复的ID以最后一条为准
+    entries = list({entry.id: entry for entry in payload.entries}.values())
+    if any(entry.vector is not None for entry in entries) and not payload.model:
+        raise HTTPException(status_code=400, detail="自带向量时需提供 model")
+    try:
+        async with vector_memory.open_store(user_id, slot) as store:
+            if all(entry.vector is not None for entry in entries):
+                embedded, model = {}, payload.model
+            else:
+                embedded, model = await _embed_missing(
+                    user_id, payload.api_id, [None if entry.vector is not None else entry.content for entry in entries]
+                )
+                if payload.model and payload.model != model:
+                    raise HTTPException(status_code=400, detail="自带向量的模型与 Embedding API 的模型不一致")
+            now = int(time.time() * 1000)
+            vectors = [embedded[index] if index in embedded else _to_bytes(entry.vector) for index, entry in enumerate(entries)]
+            await store.add(model, [
+                {
+                    "entry_id": entry.id,
+                    "content": entry.content,
+                    "tags": entry.tags,
+                    "category": entry.category,
+                    "importance": entry.importance,
+                    "timestamp": entry.timestamp or now,
+                    "metadata": entry.metadata,
+                }
+                for entry in entries
+            ], vectors)
+            count = store.count
+    except (vector_memory.MemoryStoreError, llm_gateway.GatewayError) as e:
+        _raise(e)
+    return {"message": "保存成功", "added": len(entries), "count": count}
+
+
+@router.post("/{slot}/search")
+async def search_memories(slot: str, payload: MemorySearchRequest, user_id: int = Depends(get_current_user_id)):
+    """批量检索：每个查询以文本（服务端生成向量）或向量给出，返回 top-k 记忆"""
+    if any((query.text is None) == (query.vector is None) for query in payload.queries):
+        raise HTTPException(status_code=400, detail="每个查询需且只需提供 text 或 vector")
+    try:
+        async with vector_memory.open_store(user_id, slot) as store:
+            if not store.count:
+                return {"results": [[] for _ in payload.queries]}
+            embedded, model = await _embed_missing(user_id, payload.api_id, [query.text for query in payload.queries])
+            if model and model != store.model:
+                raise HTTPException(status_code=409, detail=f"当前 Embedding 模型与记忆库（{store.model}）不一致")
+            queries = [
+                embedded[index] if index in embedded else _to_bytes(query.vector)
+                for index, query in enumerate(payload.queries)
+            ]
+            hits = await store.search(
+                queries, payload.k,
+                importance_weight=payload.importance_weight,
+                recency_weight=payload.recency_weight,
+                recency_half_life_hours=payload.recency_half_life_hours,
+                now_ms=payload.now,
+                min_score=payload.min_score,
+            )
+    except (vector_memory.MemoryStoreError, llm_gateway.GatewayError) as e:
+        _raise(e)
+    return await _hits_response(user_id, slot, hits)
+
+
+@router.post("/{slot}/hybrid")
+async def hybrid_search_memories(
+    slot: str,
+    payload: MemoryHybridSearchRequest,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    混合检索：BM25 关键词分数（按每个查询的最高分归一化）与向量相似度加权融合。
+    tags / categories 过滤直接取倒排表；vector_weight 为 0 时只做关键词检索，不调用 Embedding。
+    """
+    try:
+        async with vector_memory.open_store(user_id, slot) as store:
+            if not store.count:
+                return {"results": [[] for _ in payload.queries]}
+            only = store.keywords.filter(payload.tags, payload.categories)
+            keyword = [keyword_index.normalize(store.keywords.scores(query.text, only)) for query in payload.queries]
+            if payload.vector_weight:
+                embedded, model = await _embed_missing(
+                    user_id, payload.api_id,
+                    [query.text if query.vector is None else None for query in payload.queries]
+                )
+                if model and model != store.model:
+                    raise HTTPException(status_code=409, detail=f"当前 Embedding 模型与记忆库（{store.model}）不一致")
+                queries = [
+                    embedded[index] if index in embedded else _to_bytes(query.vector)
+                    for index, query in enumerate(payload.queries)
+                ]
+            else:
+                # 只做关键词检索时，候选限定为至少命中一个词项的记忆
+                queries = [None] * len(payload.queries)
+                matched = set().union(*keyword)
+                only = matched if only is None else only & matched
+            hits = await store.search(
+                queries, payload.k,
+                importance_weight=payload.importance_weight,
+                recency_weight=payload.recency_weight,
+                recency_half_life_hours=payload.recency_half_life_hours,
+                now_ms=payload.now,
+                min_score=payload.min_score,
+                vector_weight=payload.vector_weight,
+                keyword_scores=[
+                    {entry_id: payload.keyword_weight * value for entry_id, value in scores.items()}
+                    for scores in keyword
+                ],
+                only=only,
+            )
+    except (vector_memory.MemoryStoreError, llm_gateway.GatewayError) as e:
+        _raise(e)
+    if not payload.vector_weight:
+        hits = [
+            [hit for hit in query_hits if hit[0] in scores]
+            for query_hits, scores in zip(hits, keyword)
+        ]
+    return await _hits_response(user_id, slot, hits, keyword)
+
+
+@router.post("/{slot}/delete")
+async def delete_memories(slot: str, payload: MemoryDeleteRequest, user_id: int = Depends(get_current_user_id)):
+    """批量删除记忆"""
+    try:
+        async with vector_memory.open_store(user_id, slot) as store:
+            removed = await store.delete(payload.ids)
+            count = store.count
+    except vector_memory.MemoryStoreError as e:
+        _raise(e)
+    return {"message": "删除成功", "removed": removed, "count": count}
+
+
+@router.delete("/{slot}")
+async def clear_memories(slot: str, user_id: int = Depends(get_current_user_id)):
+    """清空存档的全部向量记忆"""
+    try:
+        removed = await vector_memory.clear(user_id, slot)
+    except vector_memory.MemoryStoreError as e:
+        _raise(e)
+    return {"message": "已清空", "removed": removed}
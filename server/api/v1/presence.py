@@ -0,0 +1,84 @@
+"""
+在线状态（心跳只更新内存）
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Optional
+
+from ...core.security import get_current_user_id, get_beijing_time
+from ...services import presence
+
+router = APIRouter(prefix="/presence", tags=["presence"])
+
+# 批量查询的最大用户数
+MAX_BATCH_USERS = 500
+
+
+class PresenceBatchRequest(BaseModel):
+    user_ids: List[int] = Field(default=[], max_length=MAX_BATCH_USERS)
+    user_names: List[str] = Field(default=[], max_length=MAX_BATCH_USERS)
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+async def _status(user_id: int, user_name: str):
+    return {
+        "user_name": user_name,
+        "is_online": presence.is_online(user_id),
+        "last_heartbeat_at": _iso(await presence.last_seen(user_id)),
+        "server_time": get_beijing_time().isoformat(),
+    }
+
+
+@router.post("/heartbeat")
+async def heartbeat(user_id: int = Depends(get_current_user_id)):
+    """上报心跳"""
+    seen = presence.heartbeat(user_id)
+    return {
+        "user_name": await presence.get_user_name(user_id),
+        "server_time": seen.isoformat(),
+        "last_heartbeat_at": seen.isoformat(),
+    }
+
+
+@router.get("/me")
+async def get_my_presence(user_id: int = Depends(get_current_user_id)):
+    return await _status(user_id, await presence.get_user_name(user_id))
+
+
+@router.get("/status/{user_name}")
+async def get_presence_status(user_name: str, user_id: int = Depends(get_current_user_id)):
+    """查询指定用户的在线状态"""
+    target_id = await presence.get_user_id(user_name)
+    if target_id is None:
+        raise HTTPException(status_code=404, detail="用户不存在")
+    return await _status(target_id, user_name)
+
+
+@router.post("/batch")
+async def get_presence_batch(payload: PresenceBatchRequest, user_id: int = Depends(get_current_user_id)):
+    """批量查询在线状态（按用户ID和/或用户名），在线状态只读内存"""
+    if len(payload.user_ids) + len(payload.user_names) > MAX_BATCH_USERS:
+        raise HTTPException(status_code=400, detail=f"单次最多查询 {MAX_BATCH_USERS} 个用户")
+    ids_by_name = await presence.get_user_ids(list(dict.fromkeys(payload.user_names)))
+    names = await presence.get_user_names(list(dict.fromkeys(payload.user_ids)))
+    names.update({target_id: name for name, target_id in ids_by_name.items()})
+    statuses = await presence.statuses(list(names))
+    return {
+        "statuses": [
+            {
+                "user_id": target_id,
+                "user_name": name,
+                "is_online": statuses[target_id][0],
+                "last_heartbeat_at": _iso(statuses[target_id][1]),
+            }
+            for target_id, name in names.items()
+        ],
+        "not_found": {
+            "user_ids": [target_id for target_id in payload.user_ids if target_id not in names],
+            "user_names": [name for name in payload.user_names if name not in ids_by_name],
+        },
+        "server_time": get_beijing_time().isoformat(),
+    }
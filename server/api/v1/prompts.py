@@ -1,14 +1,91 @@
 """
 默认提示词配置（用户侧）
 """
-from fastapi import APIRouter, Depends
-from ...models import DefaultPromptConfig
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel
+from typing import List
 from ...core.security import get_current_user_id
+from ...services import prompt_defaults, prompt_assembly
 
 router = APIRouter(prefix="/prompts", tags=["prompts"])
 
+# 单次批量获取的最大条目数
+MAX_BATCH_KEYS = 500
+
+
+class PromptBatchRequest(BaseModel):
+    keys: List[str]
+
+
+def _encoded_response(request: Request, encoded: prompt_defaults.EncodedBody) -> Response:
+    """返回预编码的响应体，支持 If-None-Match 条件请求与 gzip"""
+    headers = {"ETag": encoded.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == encoded.etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = encoded.body
+    if encoded.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        body = encoded.gzip_body
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def default_prompts_response(request: Request) -> Response:
+    """返回缓存的默认提示词"""
+    defaults = await prompt_defaults.get()
+    return _encoded_response(request, defaults.full)
+
 
 @router.get("/defaults")
-async def get_default_prompts(user_id: int = Depends(get_current_user_id)):
-    record = await DefaultPromptConfig.first()
-    return {"prompts": record.prompts_json if record else {}}
+async def get_default_prompts(request: Request, user_id: int = Depends(get_current_user_id)):
+    return await default_prompts_response(request)
+
+
+@router.get("/config")
+async def get_prompt_config(request: Request, user_id: int = Depends(get_current_user_id)):
+    """完整提示词配置（每个条目附带内容哈希与版本号）"""
+    defaults = await prompt_defaults.get()
+    return _encoded_response(request, defaults.config)
+
+
+@router.get("/config/manifest")
+async def get_prompt_manifest(request: Request, user_id: int = Depends(get_current_user_id)):
+    """提示词清单：只含各条目的内容哈希与版本号"""
+    defaults = await prompt_defaults.get()
+    return _encoded_response(request, defaults.manifest)
+
+
+@router.post("/config/batch")
+async def batch_get_prompts(payload: PromptBatchRequest, user_id: int = Depends(get_current_user_id)):
+    """按键批量获取提示词内容"""
+    if len(payload.keys) > MAX_BATCH_KEYS:
+        raise HTTPException(status_code=400, detail=f"单次最多获取 {MAX_BATCH_KEYS} 个提示词")
+    defaults = await prompt_defaults.get()
+    return defaults.batch(payload.keys)
+
+
+@router.get("/assembled")
+async def list_prompt_templates(user_id: int = Depends(get_current_user_id)):
+    """可组装的系统提示词模板及其包含的条目"""
+    return {"templates": prompt_assembly.TEMPLATES}
+
+
+@router.get("/assembled/{template_id}")
+async def get_assembled_prompt(
+    template_id: str,
+    request: Request,
+    include_content: bool = True,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    获取组装好的系统提示词及其 token 数。
+    客户端可只保存 hash，生成时以 system_prompt_hash 引用，无需每次上传全文。
+    """
+    if template_id not in prompt_assembly.TEMPLATES:
+        raise HTTPException(status_code=404, detail="模板不存在")
+    assembled = await prompt_assembly.assemble(user_id, template_id)
+    etag = f'"{assembled.hash}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=assembled.to_dict(include_content), headers=headers)
@@ -0,0 +1,123 @@
+"""
+推送通道（WebSocket，按主题订阅）
+
+连接：/api/v1/push/ws，建立后的第一条消息须为 {"op": "auth", "token": "<访问令牌>"}
+（令牌不放在 URL 中，避免被访问日志记录），成功后服务端回复 {"type": "authenticated"}
+客户端消息须为文本帧，收到二进制帧时以 1003 关闭连接：
+  {"op": "subscribe", "topics": ["presence:<用户名>", ...]}
+  {"op": "unsubscribe", "topics": [...]}
+  {"op": "ping"}  同时作为在线心跳
+服务端消息：
+  {"type": "event", "topic": ..., "event": ..., "data": {...}}
+  {"type": "subscribed", "topics": [...], "rejected": {主题: 原因}}
+  {"type": "overflow", "dropped": n}  发送队列溢出，客户端应通过 HTTP 接口重新拉取
+"""
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.websockets import WebSocketState
+
+from ...core.config import settings
+from ...core.security import decode_access_token
+from ...services import presence, push, user_cache
+
+router = APIRouter(prefix="/push", tags=["push"])
+
+# 不支持的数据类型（RFC 6455）
+CLOSE_UNSUPPORTED_DATA = 1003
+
+
+async def _receive_text(websocket: WebSocket) -> Optional[str]:
+    """读取一条文本消息；连接断开时返回 None，收到二进制帧时以 1003 关闭并返回 None"""
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect":
+        return None
+    if message.get("text") is None:
+        await websocket.close(code=CLOSE_UNSUPPORTED_DATA)
+        return None
+    return message["text"]
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[int]:
+    """等待首条 auth 消息并校验令牌，返回用户ID（超时、格式错误或令牌无效时返回 None）"""
+    try:
+        text = await asyncio.wait_for(_receive_text(websocket), settings.PUSH_AUTH_TIMEOUT)
+        message = json.loads(text) if text is not None else None
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    if not isinstance(message, dict) or message.get("op") != "auth" or not isinstance(message.get("token"), str):
+        return None
+    try:
+        return decode_access_token(message["token"]).get("user_id")
+    except HTTPException:
+        return None
+
+
+async def _receive(connection: push.Connection, websocket: WebSocket):
+    """读取客户端指令，直到断开"""
+    while True:
+        try:
+            text = await _receive_text(websocket)
+            if text is None:
+                return
+            message = json.loads(text)
+        except WebSocketDisconnect:
+            return
+        except ValueError:
+            push.send_direct(connection, {"type": "error", "message": "消息须为 JSON"})
+            continue
+        op = message.get("op") if isinstance(message, dict) else None
+        topics = message.get("topics") if isinstance(message, dict) else None
+        if op in ("subscribe", "unsubscribe"):
+            if (
+                not isinstance(topics, list)
+                or not all(isinstance(topic, str) for topic in topics)
+                or len(topics) > settings.PUSH_MAX_TOPICS
+            ):
+                push.send_direct(connection, {"type": "error", "message": "topics 须为字符串列表"})
+                continue
+            if op == "subscribe":
+                accepted, rejected = await push.subscribe(connection, topics)
+                push.send_direct(connection, {"type": "subscribed", "topics": accepted, "rejected": rejected})
+            else:
+                removed = await push.unsubscribe(connection, topics)
+                push.send_direct(connection, {"type": "unsubscribed", "topics": removed})
+        elif op == "ping":
+            seen = presence.heartbeat(connection.user_id)
+            push.send_direct(connection, {"type": "pong", "server_time": seen.isoformat()})
+        else:
+            push.send_direct(connection, {"type": "error", "message": f"未知指令: {op}"})
+
+
+@router.websocket("/ws")
+async def push_socket(websocket: WebSocket):
+    await websocket.accept()
+    try:
+        user_id = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if user_id is None:
+        if websocket.application_state == WebSocketState.CONNECTED:
+            await websocket.close(code=push.CLOSE_UNAUTHORIZED)
+        return
+    if user_cache.is_disabled(user_id):
+        await websocket.close(code=push.CLOSE_FORBIDDEN)
+        return
+    try:
+        connection = push.connect(user_id, websocket)
+    except push.PushError:
+        await websocket.close(code=push.CLOSE_TOO_MANY)
+        return
+    push.send_direct(connection, {"type": "authenticated"})
+
+    sender = asyncio.create_task(push.run_sender(connection))
+    receiver = asyncio.create_task(_receive(connection, websocket))
+    try:
+        await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        push.disconnect(connection)
+        for task in (sender, receiver):
+            task.cancel()
+        await asyncio.gather(sender, receiver, return_exceptions=True)
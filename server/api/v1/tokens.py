@@ -0,0 +1,76 @@
+"""
+Token 计数与上下文预算裁剪
+"""
+import asyncio
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
+
+from ...core.security import get_current_user_id
+from ...services import tokens
+
+router = APIRouter(prefix="/tokens", tags=["tokens"])
+
+# 单次请求的最大消息条数
+MAX_MESSAGES = 20000
+
+
+class TokenMessage(BaseModel):
+    role: str = "user"
+    content: str
+    importance: Optional[float] = None  # 按重要度裁剪时使用，越小越先移除
+
+
+class TokenCountRequest(BaseModel):
+    model: Optional[str] = None
+    provider: Optional[str] = None
+    messages: List[TokenMessage] = Field(max_length=MAX_MESSAGES)
+
+
+class TokenTrimRequest(TokenCountRequest):
+    budget: Optional[int] = Field(default=None, gt=0)  # 默认为上下文窗口减去 reserve_output
+    reserve_output: int = Field(default=4096, ge=0)
+    keep_last: int = Field(default=1, ge=0)
+    strategy: Literal["oldest", "importance"] = "oldest"
+    include_messages: bool = True
+
+
+@router.post("/count")
+async def count_tokens(payload: TokenCountRequest, user_id: int = Depends(get_current_user_id)):
+    """批量计算消息 token 数"""
+    family, window = tokens.resolve_family(payload.model, payload.provider)
+    messages = [m.model_dump() for m in payload.messages]
+    counts = await asyncio.to_thread(tokens.count_messages, messages, family)
+    return {
+        "family": family,
+        "exact": tokens.is_exact(family),
+        "context_window": window,
+        "total": sum(counts),
+        "counts": counts,
+    }
+
+
+@router.post("/trim")
+async def trim_messages(payload: TokenTrimRequest, user_id: int = Depends(get_current_user_id)):
+    """按预算裁剪历史消息（system 消息与最后 keep_last 条始终保留）"""
+    family, window = tokens.resolve_family(payload.model, payload.provider)
+    budget = payload.budget or max(window - payload.reserve_output, 0)
+    messages = [m.model_dump() for m in payload.messages]
+    counts = await asyncio.to_thread(tokens.count_messages, messages, family)
+    kept, total = tokens.trim_to_budget(messages, counts, budget, payload.keep_last, payload.strategy)
+    kept_set = set(kept)
+    result = {
+        "family": family,
+        "exact": tokens.is_exact(family),
+        "context_window": window,
+        "budget": budget,
+        "total": total,
+        "fits": total <= budget,
+        "kept": kept,
+        "dropped": [i for i in range(len(messages)) if i not in kept_set],
+    }
+    if payload.include_messages:
+        result["messages"] = [
+            {"role": messages[i]["role"], "content": messages[i]["content"]} for i in kept
+        ]
+    return result
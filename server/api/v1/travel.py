@@ -0,0 +1,131 @@
+"""
+联机穿越（进行中的会话状态只读内存）
+"""
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from typing import Optional
+
+from ...models import User
+from ...core.config import settings
+from ...core.security import get_current_user_id
+from ...services import event_log, travel, travel_points
+
+router = APIRouter(prefix="/travel", tags=["travel"])
+
+MAX_LOG_EVENTS = 1000
+MAX_LOG_WAIT = 30
+
+
+class TravelStartRequest(BaseModel):
+    target_username: str = Field(min_length=1)
+    invite_code: Optional[str] = None
+
+
+class TravelEndRequest(BaseModel):
+    session_id: int
+
+
+def _raise(e: travel.TravelError):
+    raise HTTPException(status_code=e.status_code, detail=e.message)
+
+
+def _start_response(session, points_left: int):
+    return {
+        "session_id": session.id,
+        "target_world_instance_id": session.world_instance_id,
+        "entry_map_id": session.data.get("entry_map_id"),
+        "entry_poi_id": session.data.get("entry_poi_id"),
+        # 原世界由客户端自行备份，服务端不记录返回位置
+        "return_anchor": {},
+        "travel_points_left": points_left,
+        "owner_offline_agent_prompt": session.owner_prompt,
+        "owner_character_info": session.owner_character,
+    }
+
+
+async def _points(user_id: int) -> int:
+    return await User.filter(id=user_id).first().values_list("travel_points", flat=True) or 0
+
+
+@router.get("/profile")
+async def get_travel_profile(user_id: int = Depends(get_current_user_id)):
+    """穿越点与今日签到状态"""
+    signed_in = await travel_points.signed_in_today(user_id)
+    return {
+        "travel_points": await _points(user_id),
+        "signed_in": signed_in,
+        "message": "今日已签到" if signed_in else "今日尚未签到",
+    }
+
+
+@router.post("/signin")
+async def signin_travel(user_id: int = Depends(get_current_user_id)):
+    """每日签到"""
+    balance = await travel_points.signin(user_id, settings.TRAVEL_SIGNIN_POINTS)
+    if balance is None:
+        raise HTTPException(status_code=400, detail="今日已签到")
+    return {
+        "travel_points": balance,
+        "signed_in": True,
+        "message": f"签到成功，获得 {settings.TRAVEL_SIGNIN_POINTS} 穿越点",
+    }
+
+
+@router.post("/start")
+async def start_travel(payload: TravelStartRequest, user_id: int = Depends(get_current_user_id)):
+    """开始穿越到指定用户的世界"""
+    try:
+        session, points_left = await travel.start(user_id, payload.target_username.strip(), payload.invite_code)
+    except travel.TravelError as e:
+        _raise(e)
+    return _start_response(session, points_left)
+
+
+@router.get("/active")
+async def get_active_travel(user_id: int = Depends(get_current_user_id)):
+    """当前进行中的穿越会话（没有时返回 null）"""
+    session = travel.get_active(user_id)
+    if session is None:
+        return None
+    return _start_response(session, await _points(user_id))
+
+
+@router.get("/status/{session_id}")
+async def get_travel_status(session_id: int, user_id: int = Depends(get_current_user_id)):
+    """会话状态（轮询用；进行中的会话只读内存，已结束并移出内存的从数据库读取）"""
+    session = await travel.find(session_id)
+    if session is None or user_id not in (session.traveler_id, session.target_id):
+        raise HTTPException(status_code=404, detail="穿越会话不存在")
+    return travel.status_payload(session)
+
+
+@router.post("/end")
+async def end_travel(payload: TravelEndRequest, user_id: int = Depends(get_current_user_id)):
+    """结束穿越，返回原世界"""
+    try:
+        travel.end_by_traveler(user_id, payload.session_id)
+    except travel.TravelError as e:
+        _raise(e)
+    return {"success": True, "message": "已返回原世界"}
+
+
+@router.get("/logs/{session_id}")
+async def get_travel_logs(
+    session_id: int,
+    after_seq: int = -1,
+    limit: int = 500,
+    wait: float = 0,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    会话事件日志：返回序号大于 after_seq 的事件，按 next_seq 继续读取。
+    wait > 0 且暂无新事件时最多等待 wait 秒（实时查看）。
+    """
+    session = await travel.find(session_id)
+    if session is None or user_id not in (session.traveler_id, session.target_id):
+        raise HTTPException(status_code=404, detail="穿越会话不存在")
+    info = travel.status_payload(session)
+    if wait > 0:
+        await event_log.wait(session_id, after_seq, min(wait, MAX_LOG_WAIT))
+    events, next_seq = await event_log.read(session_id, after_seq, min(max(limit, 1), MAX_LOG_EVENTS))
+    return {**info, "events": events, "next_seq": next_seq}
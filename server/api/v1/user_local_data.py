@@ -7,6 +7,7 @@ from typing import Any, Dict
 
 from ...models import UserLocalData
 from ...core.security import get_current_user_id
+from ...services import stats
 
 
 router = APIRouter(prefix="/user", tags=["user-local-data"])
@@ -33,17 +34,22 @@ async def save_user_local_data(
     payload: UserLocalDataPayload,
     user_id: int = Depends(get_current_user_id)
 ):
+    new_size = stats.json_size(payload.characters) + stats.json_size(payload.saves)
     record = await UserLocalData.get_or_none(user_id=user_id)
     if record:
+        old_size = stats.json_size(record.characters_json) + stats.json_size(record.saves_json)
         record.characters_json = payload.characters
         record.saves_json = payload.saves
         await record.save()
+        stats.incr(stats.SAVE_BYTES, new_size - old_size)
     else:
         await UserLocalData.create(
             user_id=user_id,
             characters_json=payload.characters,
             saves_json=payload.saves
         )
+        stats.incr(stats.LOCAL_DATA_TOTAL)
+        stats.incr(stats.SAVE_BYTES, new_size)
     return {"message": "保存成功"}
 
 
@@ -52,4 +58,6 @@ async def clear_user_local_data(user_id: int = Depends(get_current_user_id)):
     record = await UserLocalData.get_or_none(user_id=user_id)
     if record:
         await record.delete()
+        stats.incr(stats.LOCAL_DATA_TOTAL, -1)
+        stats.incr(stats.SAVE_BYTES, -(stats.json_size(record.characters_json) + stats.json_size(record.saves_json)))
     return None
@@ -5,8 +5,8 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from typing import Dict
 
-from ...models import UserPromptConfig
 from ...core.security import get_current_user_id
+from ...services import prompt_overrides
 
 router = APIRouter(prefix="/user", tags=["user-prompts"])
 
@@ -17,8 +17,8 @@ class UserPromptsPayload(BaseModel):
 
 @router.get("/prompts")
 async def get_user_prompts(user_id: int = Depends(get_current_user_id)):
-    record = await UserPromptConfig.get_or_none(user_id=user_id)
-    return {"prompts": record.prompts_json if record else {}}
+    prompts = await prompt_overrides.get_prompts(user_id)
+    return {"prompts": prompts or {}}
 
 
 @router.put("/prompts", status_code=status.HTTP_200_OK)
@@ -29,19 +29,11 @@ async def save_user_prompts(
     if not isinstance(payload.prompts, dict):
         raise HTTPException(status_code=400, detail="prompts 必须为JSON对象")
 
-    record = await UserPromptConfig.get_or_none(user_id=user_id)
-    if record:
-        record.prompts_json = payload.prompts
-        await record.save()
-    else:
-        await UserPromptConfig.create(user_id=user_id, prompts_json=payload.prompts)
-
-    return {"message": "保存成功"}
+    overrides = await prompt_overrides.save_prompts(user_id, payload.prompts)
+    return {"message": "保存成功", "overrides": len(overrides)}
 
 
 @router.delete("/prompts", status_code=status.HTTP_204_NO_CONTENT)
 async def clear_user_prompts(user_id: int = Depends(get_current_user_id)):
-    record = await UserPromptConfig.get_or_none(user_id=user_id)
-    if record:
-        await record.delete()
+    await prompt_overrides.clear_prompts(user_id)
     return None
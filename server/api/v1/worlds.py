@@ -0,0 +1,308 @@
+"""
+世界实例（联机穿越）
+"""
+import secrets
+from fastapi import APIRouter, Depends, HTTPException, Response
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Optional, Union
+
+from ...models import Character, WorldInstance
+from ...core.security import get_current_user_id
+from ...services import map_graph, presence, travel, world_directory, world_state
+
+router = APIRouter(prefix="/worlds/instance", tags=["worlds"])
+
+VISIBILITY_MODES = ("public", "hidden", "locked")
+MAX_LIST_LIMIT = 100
+MAX_OFFLINE_PROMPT_LENGTH = 4000
+MAX_PATCH_OPS = 100
+
+
+class VisibilityUpdateRequest(BaseModel):
+    visibility_mode: str
+
+
+class PolicyUpdateRequest(BaseModel):
+    allow_offline_travel: bool
+
+
+class OfflinePromptUpdateRequest(BaseModel):
+    offline_agent_prompt: str = Field(max_length=MAX_OFFLINE_PROMPT_LENGTH)
+
+
+class DataOperation(BaseModel):
+    op: str
+    path: List[Union[int, str]]
+    value: Any = None
+
+
+class DataPatchRequest(BaseModel):
+    ops: List[DataOperation] = Field(min_length=1, max_length=MAX_PATCH_OPS)
+    expected_revision: Optional[int] = None
+
+
+class MoveIntent(BaseModel):
+    to_poi_id: int
+
+
+class WorldActionRequest(BaseModel):
+    session_id: int
+    action_type: str
+    intent: MoveIntent
+
+
+class MapUpdateRequest(BaseModel):
+    map_key: Optional[str] = None
+    pois: List[Dict[str, Any]] = Field(default_factory=list)
+    edges: List[Dict[str, Any]] = Field(default_factory=list)
+
+
+def _raise(e: Union[map_graph.MapGraphError, world_state.WorldStateError]):
+    raise HTTPException(status_code=e.status_code, detail=e.message)
+
+
+def _iso(value) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+@router.get("/list")
+async def list_travelable_worlds(
+    response: Response,
+    skip: int = 0,
+    limit: int = 20,
+    visibility: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    可穿越的世界列表（按最近活跃排序），search 按主人名前缀匹配。
+    翻页可用 skip，也可把响应头 X-Next-Cursor 作为下一页的 cursor；主人在线状态取自内存。
+    """
+    limit = min(max(limit, 1), MAX_LIST_LIMIT)
+    try:
+        rows = await world_directory.list_worlds(user_id, max(skip, 0), limit, visibility, search, cursor)
+    except world_directory.CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = world_directory.encode_cursor(rows[-1])
+    worlds = []
+    for row in rows:
+        online, seen = presence.status(row["owner_id"], row["owner__presence__last_seen_at"])
+        worlds.append({
+            "world_instance_id": row["id"],
+            "owner_player_id": row["owner_id"],
+            "owner_username": row["owner__user_name"],
+            "visibility_mode": row["visibility_mode"],
+            "allow_offline_travel": row["allow_offline_travel"],
+            "owner_online": online,
+            "owner_last_heartbeat_at": _iso(seen),
+            "created_at": _iso(row["created_at"]),
+        })
+    return worlds
+
+
+async def _my_instance(user_id: int) -> WorldInstance:
+    # 与开始穿越时选取的实例一致：最近更新的一个
+    instance = await WorldInstance.filter(owner_id=user_id).order_by("-updated_at").first()
+    if instance is None:
+        raise HTTPException(status_code=404, detail="你还没有世界实例")
+    return instance
+
+
+async def _summary(instance: WorldInstance) -> Dict[str, Any]:
+    instance_data = instance.instance_data or {}
+    char_id = await Character.filter(user_id=instance.owner_id, is_active=True).order_by("-updated_at").first().values_list(
+        "id", flat=True
+    )
+    return {
+        "world_instance_id": instance.id,
+        "owner_player_id": instance.owner_id,
+        "owner_char_id": str(char_id) if char_id is not None else None,
+        "visibility_mode": instance.visibility_mode,
+        "allow_offline_travel": instance.allow_offline_travel,
+        "offline_agent_prompt": instance.offline_agent_prompt,
+        "invite_code": instance_data.get("invite_code"),
+        "revision": instance_data.get("revision", 0),
+        "maps": [
+            {"map_id": game_map.get("map_id"), "map_key": game_map.get("map_key"), "revision": game_map.get("revision", 0)}
+            for game_map in instance_data.get("maps") or []
+        ],
+    }
+
+
+@router.get("/me")
+async def get_my_world_instance(user_id: int = Depends(get_current_user_id)):
+    """自己的世界实例"""
+    return await _summary(await _my_instance(user_id))
+
+
+async def _update_mine(user_id: int, ops=(), columns=None, expected_revision: Optional[int] = None) -> Dict[str, Any]:
+    instance = await _my_instance(user_id)
+    try:
+        await world_state.update(instance.id, ops, columns, expected_revision, owner_id=user_id)
+    except world_state.WorldStateError as e:
+        _raise(e)
+    return await _summary(await WorldInstance.get(id=instance.id))
+
+
+@router.post("/me/visibility")
+async def update_my_world_visibility(payload: VisibilityUpdateRequest, user_id: int = Depends(get_current_user_id)):
+    """修改可见性；改为 hidden 时若还没有邀请码则生成一个"""
+    if payload.visibility_mode not in VISIBILITY_MODES:
+        raise HTTPException(status_code=400, detail="无效的可见性")
+    ops, expected_revision = [], None
+    if payload.visibility_mode == "hidden":
+        instance = await _my_instance(user_id)
+        if not (instance.instance_data or {}).get("invite_code"):
+            ops.append((world_state.OP_SET, ["invite_code"], secrets.token_hex(4)))
+            expected_revision = world_state.revision_of(instance.instance_data)
+    return await _update_mine(user_id, ops, {"visibility_mode": payload.visibility_mode}, expected_revision)
+
+
+@router.post("/me/policy")
+async def update_my_world_policy(payload: PolicyUpdateRequest, user_id: int = Depends(get_current_user_id)):
+    """是否允许离线穿越"""
+    return await _update_mine(user_id, columns={"allow_offline_travel": payload.allow_offline_travel})
+
+
+@router.post("/me/offline-prompt")
+async def update_my_world_offline_prompt(payload: OfflinePromptUpdateRequest, user_id: int = Depends(get_current_user_id)):
+    """离线代理提示词"""
+    return await _update_mine(user_id, columns={"offline_agent_prompt": payload.offline_agent_prompt})
+
+
+@router.patch("/me/data")
+async def patch_my_world_data(payload: DataPatchRequest, user_id: int = Depends(get_current_user_id)):
+    """
+    按 JSON 路径局部修改世界数据（路径为键名与数组下标的列表，如 ["maps", 0, "pois", 2, "state"]）。
+    给出 expected_revision 时只在版本一致时生效，否则返回 409。
+    """
+    instance = await _my_instance(user_id)
+    try:
+        revision = await world_state.update(
+            instance.id, [(op.op, op.path, op.value) for op in payload.ops],
+            expected_revision=payload.expected_revision, owner_id=user_id,
+        )
+    except world_state.WorldStateError as e:
+        _raise(e)
+    return {"success": True, "world_instance_id": instance.id, "revision": revision}
+
+
+def _traveler_session(world_instance_id: int, session_id: int, user_id: int):
+    session = travel.get_active(user_id)
+    if session is None or session.id != session_id or session.world_instance_id != world_instance_id:
+        raise HTTPException(status_code=404, detail="穿越会话不存在或已结束")
+    return session
+
+
+async def _graph(world_instance_id: int, map_id: int) -> map_graph.MapGraph:
+    try:
+        return await map_graph.get_graph(world_instance_id, map_id)
+    except map_graph.MapGraphError as e:
+        _raise(e)
+
+
+async def _viewer_poi(world_instance_id: int, map_id: int, session_id: Optional[int], user_id: int) -> Optional[int]:
+    """穿越者返回其所在地点（不在该地图时为 null）；不带会话时只有世界主人可以查看"""
+    if session_id is not None:
+        current_map_id, current_poi_id = travel.position(_traveler_session(world_instance_id, session_id, user_id))
+        return current_poi_id if current_map_id == map_id else None
+    if not await WorldInstance.filter(id=world_instance_id, owner_id=user_id).exists():
+        raise HTTPException(status_code=404, detail="世界不存在")
+    return None
+
+
+@router.get("/{world_instance_id}/map/{map_id}/graph")
+async def get_map_graph(
+    world_instance_id: int,
+    map_id: int,
+    session_id: Optional[int] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """地图的地点与道路（取自编译缓存）"""
+    viewer_poi_id = await _viewer_poi(world_instance_id, map_id, session_id, user_id)
+    graph = await _graph(world_instance_id, map_id)
+    return {**graph.response, "viewer_poi_id": viewer_poi_id}
+
+
+@router.get("/{world_instance_id}/map/{map_id}/path")
+async def get_map_path(
+    world_instance_id: int,
+    map_id: int,
+    to_poi_id: int,
+    from_poi_id: Optional[int] = None,
+    weighted: bool = True,
+    session_id: Optional[int] = None,
+    user_id: int = Depends(get_current_user_id)
+):
+    """最短路径与下一步（weighted=false 时按步数）；起点默认为穿越者当前位置"""
+    viewer_poi_id = await _viewer_poi(world_instance_id, map_id, session_id, user_id)
+    source = from_poi_id if from_poi_id is not None else viewer_poi_id
+    if source is None:
+        raise HTTPException(status_code=400, detail="缺少起点")
+    graph = await _graph(world_instance_id, map_id)
+    try:
+        distance, path = graph.path(source, to_poi_id, weighted)
+    except map_graph.MapGraphError as e:
+        _raise(e)
+    return {
+        "reachable": bool(path),
+        "distance": distance if path else None,
+        "path": path,
+        "next_poi_id": path[1] if len(path) > 1 else None,
+    }
+
+
+@router.post("/{world_instance_id}/action")
+async def world_action(world_instance_id: int, payload: WorldActionRequest, user_id: int = Depends(get_current_user_id)):
+    """穿越者在世界中的行动（目前只有 move：沿道路移动到相邻地点）"""
+    session = _traveler_session(world_instance_id, payload.session_id, user_id)
+    if payload.action_type != "move":
+        raise HTTPException(status_code=400, detail=f"不支持的行动: {payload.action_type}")
+    map_id, poi_id = travel.position(session)
+    graph = await _graph(world_instance_id, map_id)
+    to_poi_id = payload.intent.to_poi_id
+    if not graph.can_move(poi_id, to_poi_id):
+        message = "目标地点不存在" if not graph.has_poi(to_poi_id) else "没有通往该地点的道路"
+        return {"success": False, "message": message, "new_map_id": map_id, "new_poi_id": poi_id}
+    travel.move(session, map_id, to_poi_id)
+    return {"success": True, "message": "移动成功", "new_map_id": map_id, "new_poi_id": to_poi_id}
+
+
+@router.put("/{world_instance_id}/map/{map_id}")
+async def update_map(
+    world_instance_id: int,
+    map_id: int,
+    payload: MapUpdateRequest,
+    user_id: int = Depends(get_current_user_id)
+):
+    """世界主人编辑地图（整张替换），保存前先编译校验"""
+    instance = await WorldInstance.filter(id=world_instance_id, owner_id=user_id).first()
+    if instance is None:
+        raise HTTPException(status_code=404, detail="世界不存在")
+    instance_data = instance.instance_data or {}
+    maps = instance_data.get("maps") or []
+    position = next((i for i, game_map in enumerate(maps) if int(game_map.get("map_id", -1)) == map_id), None)
+    raw = {"map_id": map_id, "pois": payload.pois, "edges": payload.edges}
+    if payload.map_key:
+        raw["map_key"] = payload.map_key
+    try:
+        graph = map_graph.compile_map({**(maps[position] if position is not None else {}), **raw})
+    except map_graph.MapGraphError as e:
+        _raise(e)
+    # 只改这一张地图；以读取时的版本为条件，期间有其他修改则返回 409
+    revision = world_state.revision_of(instance_data)
+    game_map = {**(maps[position] if position is not None else {}), **graph.response, "revision": revision + 1}
+    try:
+        if "maps" not in instance_data:
+            op = (world_state.OP_SET, ["maps"], [game_map])
+        else:
+            op = (world_state.OP_SET, ["maps", len(maps) if position is None else position], game_map)
+        revision = await world_state.update(world_instance_id, [op], expected_revision=revision, owner_id=user_id)
+    except world_state.WorldStateError as e:
+        _raise(e)
+    return {
+        "success": True, "map_id": map_id, "revision": revision,
+        "poi_count": len(graph), "edge_count": len(graph.response["edges"]),
+    }
@@ -0,0 +1,93 @@
+"""
+推送通道压测：建立大量空闲 WebSocket 连接并订阅管理员的在线状态，测量建连耗时、
+服务端内存占用，以及管理员上线事件扇出到全部连接的耗时
+用法（项目根目录，服务端已启动、与本脚本读取同一配置，且管理员当前离线）：
+  python server/bench_push.py [连接数=10000] [服务地址=127.0.0.1:8000] [服务端进程PID]
+连接数较大时需先调高文件描述符上限（ulimit -n 65535），服务端以 --ws-per-message-deflate false 启动。
+"""
+import asyncio
+import json
+import sys
+import time
+
+import httpx
+import websockets
+
+sys.path.insert(0, '.')
+
+from server.core.config import settings
+from server.core.security import create_access_token
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+host = sys.argv[2] if len(sys.argv) > 2 else "127.0.0.1:8000"
+server_pid = sys.argv[3] if len(sys.argv) > 3 else None
+url = f"ws://{host}/api/v1/push/ws"
+topic = f"presence:{settings.ADMIN_USERNAME}"
+# 压测连接使用不存在的用户ID，只需令牌能通过校验
+BENCH_USER_BASE = 10_000_000
+
+
+def rss_mb(pid):
+    if not pid:
+        return None
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+
+
+async def recv_until(socket, predicate):
+    while True:
+        message = json.loads(await socket.recv())
+        if predicate(message):
+            return message
+
+
+async def open_idle(index):
+    socket = await websockets.connect(url)
+    await socket.send(json.dumps({"op": "auth", "token": create_access_token({"user_id": BENCH_USER_BASE + index})}))
+    await recv_until(socket, lambda message: message["type"] == "authenticated")
+    await socket.send(json.dumps({"op": "subscribe", "topics": [topic]}))
+    snapshot = await recv_until(socket, lambda message: message["type"] == "event")
+    if snapshot["data"]["is_online"]:
+        raise SystemExit("管理员当前在线，请等待其超时离线后再运行")
+    return socket
+
+
+async def main():
+    before = rss_mb(server_pid)
+    start = time.perf_counter()
+    sockets = []
+    # 分批建连，避免瞬时打满监听队列
+    for offset in range(0, count, 500):
+        sockets += await asyncio.gather(*(open_idle(index) for index in range(offset, min(offset + 500, count))))
+    print(f"建立 {len(sockets)} 个连接并订阅: {time.perf_counter() - start:.2f} s")
+    if before is not None:
+        after = rss_mb(server_pid)
+        print(f"服务端内存: {before:.1f} MB -> {after:.1f} MB（每连接约 {(after - before) * 1024 / count:.1f} KB）")
+
+    async with httpx.AsyncClient(base_url=f"http://{host}") as client:
+        response = await client.post("/api/v1/auth/token", json={
+            "username": settings.ADMIN_USERNAME, "password": settings.ADMIN_PASSWORD, "is_admin": True,
+        })
+        admin_token = response.json()["access_token"]
+        waiters = [
+            asyncio.create_task(recv_until(socket, lambda message: message["type"] == "event"))
+            for socket in sockets
+        ]
+        received = []
+        for waiter in waiters:
+            waiter.add_done_callback(lambda _: received.append(time.perf_counter()))
+        started = time.perf_counter()
+        await client.post("/api/v1/presence/heartbeat", headers={"Authorization": f"Bearer {admin_token}"})
+        await asyncio.gather(*waiters)
+    print(
+        f"上线事件扇出到 {len(received)} 个连接: 最早 {(min(received) - started) * 1000:.1f} ms，"
+        f"最晚 {(max(received) - started) * 1000:.1f} ms"
+    )
+    if server_pid:
+        print(f"服务端内存（扇出后）: {rss_mb(server_pid):.1f} MB")
+    await asyncio.gather(*(socket.close() for socket in sockets))
+
+
+asyncio.run(main())
@@ -0,0 +1,48 @@
+"""
+Token 计数与裁剪微基准：构造约 10 万 token 的对话历史，分别测量冷计数、缓存命中计数与按预算裁剪耗时
+用法（项目根目录）：python server/bench_tokens.py [模型名]
+"""
+import random
+import sys
+import time
+
+sys.path.insert(0, '.')
+
+from server.services import tokens
+
+model = sys.argv[1] if len(sys.argv) > 1 else "gpt-4o"
+family, window = tokens.resolve_family(model)
+
+random.seed(42)
+words = ["修炼", "灵气", "宗门", "秘境", "丹药", "the", "cultivator", "walks", "into", "a", "quiet", "valley"]
+messages = []
+total = 0
+while total < 100_000:
+    content = " ".join(random.choice(words) for _ in range(random.randint(20, 200)))
+    messages.append({
+        "role": "user" if len(messages) % 2 == 0 else "assistant",
+        "content": content,
+        "importance": random.random(),
+    })
+    total += tokens.estimate_tokens(content) + tokens.MESSAGE_OVERHEAD
+messages.insert(0, {"role": "system", "content": "你是修仙世界的叙事者。"})
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f"{label}: {(time.perf_counter() - start) * 1000:.2f} ms")
+    return result
+
+
+print(f"模型家族: {family}（{'精确分词' if tokens.is_exact(family) else '估算'}），上下文窗口 {window}")
+print(f"消息数: {len(messages)}")
+counts = timed("冷计数", lambda: tokens.count_messages(messages, family))
+timed("缓存计数", lambda: tokens.count_messages(messages, family))
+print(f"总 token: {sum(counts)}")
+for strategy in ("oldest", "importance"):
+    kept, kept_total = timed(
+        f"裁剪到 32000 ({strategy})",
+        lambda: tokens.trim_to_budget(messages, counts, 32_000, keep_last=4, strategy=strategy)
+    )
+    print(f"  保留 {len(kept)} 条，{kept_total} token")
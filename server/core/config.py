@@ -68,6 +68,81 @@ class Settings(BaseSettings):
     RATE_LIMIT_REQUESTS: int = 100
     RATE_LIMIT_PERIOD: int = 60
     
+    # 穿越点数配置
+    TRAVEL_POINTS_SNAPSHOT_INTERVAL: int = 60  # 余额快照汇总间隔（秒）
+    
+    # 统计配置
+    STATS_FLUSH_INTERVAL: int = 5  # 计数增量落库间隔（秒）
+    STATS_RECONCILE_INTERVAL: int = 3600  # 全量对账间隔（秒）
+    
+    # 后台任务配置
+    ADMIN_JOB_CHUNK_SIZE: int = 200  # 每个分块事务处理的行数
+    ADMIN_JOB_CHUNK_PAUSE: float = 0.05  # 分块之间让出写锁的时间（秒）
+    
+    # AI 网关配置
+    AI_GATEWAY_HTTP2: bool = True  # 上游支持时使用 HTTP/2（需安装 h2）
+    AI_GATEWAY_CONNECT_TIMEOUT: float = 10.0  # 上游连接超时（秒）
+    AI_GATEWAY_READ_TIMEOUT: float = 120.0  # 两次收到数据之间的最长等待（秒）
+    AI_GATEWAY_MAX_CONNECTIONS_PER_HOST: int = 32  # 每个上游主机的连接池上限
+    AI_GATEWAY_MAX_CONCURRENCY: int = 16  # 每个提供商同时进行的生成请求数
+    AI_GATEWAY_MAX_RETRIES: int = 2  # 首字节前失败时的重试次数
+    AI_GATEWAY_ALLOW_PRIVATE_HOSTS: bool = False  # 是否允许转发到内网/本机地址（本地桩服务测试时开启）
+    
+    # AI 响应缓存配置
+    AI_CACHE_ENABLED: bool = True
+    AI_CACHE_DIR: str = "./cache/ai_responses"
+    AI_CACHE_TTL: int = 604800  # 缓存有效期（秒），默认 7 天
+    AI_CACHE_MAX_BYTES: int = 268435456  # 磁盘占用上限，默认 256MB
+    AI_CACHE_MAX_ENTRIES: int = 20000
+    AI_COALESCE_ENABLED: bool = True  # 相同请求的并发生成合并为一次上游调用
+    AI_COALESCE_BUFFER_EVENTS: int = 512  # 每个订阅者的待发送队列与重放缓冲的事件数上限
+    AI_COALESCE_LAG_TIMEOUT: float = 30.0  # 订阅者队列满时等待其读取的时间（秒），超时后断开该订阅者
+    
+    # 提示词组装缓存配置
+    PROMPT_ASSEMBLY_CACHE_SIZE: int = 1000  # 缓存的组装结果条数
+    PROMPT_ASSEMBLY_CACHE_USERS: int = 10000  # 缓存覆盖条目的用户数
+    
+    # Token 计数配置
+    TOKENIZER_DIR: str = "./tokenizers"  # 分词器文件目录（<家族>.json，需安装 tokenizers）
+    TOKEN_COUNT_CACHE_SIZE: int = 100000  # 按文本哈希缓存的计数条数
+    
+    # Embedding 代理配置
+    EMBEDDING_BATCH_SIZE: int = 256  # 单次上游请求的最大文本数
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # 合并并发请求的等待窗口（毫秒）
+    EMBEDDING_CACHE_PATH: str = "./cache/embeddings.f32"  # 向量缓存文件，为空则只缓存在内存
+    EMBEDDING_CACHE_MAX_BYTES: int = 268435456  # 内存中向量缓存上限，默认 256MB
+    
+    # 向量记忆配置
+    VECTOR_MEMORY_DIR: str = "./data/vector_memory"  # 按 用户/存档 保存的向量矩阵文件
+    VECTOR_MEMORY_OPEN_STORES: int = 256  # 常驻内存的存档数
+    
+    # 在线状态配置
+    PRESENCE_TIMEOUT: int = 45  # 超过该时长无心跳视为离线（秒，客户端每 15 秒心跳一次）
+    PRESENCE_TICK: float = 1.0  # 时间轮刻度（秒）
+    PRESENCE_FLUSH_INTERVAL: int = 60  # 最后在线时间落库间隔（秒）
+    
+    # 推送通道配置
+    PUSH_QUEUE_SIZE: int = 64  # 每个连接待发送事件上限，超出丢弃最旧的
+    PUSH_SEND_TIMEOUT: float = 10.0  # 单条消息发送超时（秒），超时视为慢消费者并断开
+    PUSH_MAX_TOPICS: int = 64  # 每个连接可订阅的主题数
+    PUSH_MAX_CONNECTIONS_PER_USER: int = 8
+    PUSH_AUTH_TIMEOUT: float = 10.0  # 建连后发送 auth 消息的时限（秒），超时关闭
+    
+    # 联机穿越配置
+    TRAVEL_START_COST: int = 10  # 每次穿越消耗的穿越点
+    TRAVEL_SIGNIN_POINTS: int = 10  # 每日签到获得的穿越点
+    TRAVEL_SESSION_TTL: int = 7200  # 会话最长持续时间（秒）
+    TRAVEL_EXPIRY_TICK: float = 5.0  # 超时检查刻度（秒）
+    TRAVEL_FLUSH_INTERVAL: int = 5  # 会话状态落库间隔（秒）
+    TRAVEL_RECENT_SESSIONS: int = 10000  # 内存中保留的已结束会话数（供结束后的状态查询）
+    TRAVEL_LOG_DIR: str = "./data/travel_logs"  # 会话事件日志（分段与归档）
+    TRAVEL_LOG_SEGMENT_EVENTS: int = 1000  # 每个分段文件的事件数
+    TRAVEL_LOG_TAIL_EVENTS: int = 256  # 每个进行中会话常驻内存的最近事件数
+    TRAVEL_LOG_FLUSH_INTERVAL: float = 1.0  # 事件落盘间隔（秒）
+    MAP_GRAPH_CACHE_SIZE: int = 512  # 缓存编译后地图的世界实例数
+    WORLD_LIST_CACHE_TTL: float = 10.0  # 可穿越世界列表首页缓存时间（秒），0 为不缓存
+    WORLD_LIST_CACHE_ROWS: int = 200  # 缓存的列表行数（翻页超出后直接查库）
+    
     # 日志配置
     LOG_LEVEL: str = "INFO"
     LOG_FILE: str = "./logs/app.log"
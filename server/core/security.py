@@ -9,6 +9,7 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from .config import settings
+from ..services import user_cache
 
 
 # 密码哈希
@@ -72,6 +73,11 @@ async def get_current_user_id(credentials: HTTPAuthorizationCredentials = Depend
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无效的认证凭据"
         )
+    if user_cache.is_disabled(user_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="账号已被禁用"
+        )
     return user_id
 
 
@@ -0,0 +1,133 @@
+"""
+本地 AI 上游桩服务 - 模拟 OpenAI / Claude / Gemini 的流式接口与 Embedding 接口，用于测试 /api/v1/ai/generate 与 /api/v1/embeddings
+
+启动：python -m uvicorn server.llm_stub:app --port 9100
+网关需设置 AI_GATEWAY_ALLOW_PRIVATE_HOSTS=true，API 地址填 http://127.0.0.1:9100
+
+回复内容为最后一条用户消息的回显，按 CHUNK_SIZE 个字符分段下发。
+特殊模型名：
+- error：始终返回 500
+- flaky：每个请求第一次返回 503（用于验证重试），之后正常
+- slow：每段之间等待 0.5 秒（用于验证背压与断开）
+
+Embedding 接口按文本哈希生成 EMBEDDING_DIM 维的确定性向量，GET /stats 返回收到的批次大小（用于验证微批合并）。
+"""
+import asyncio
+import hashlib
+import json
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+CHUNK_SIZE = 4
+EMBEDDING_DIM = 8
+
+app = FastAPI(title="LLM Stub")
+_attempts: Dict[str, int] = defaultdict(int)
+_embedding_batches: List[int] = []
+
+
+def _chunks(text: str) -> List[str]:
+    return [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)] or [""]
+
+
+def _sse(data: Any) -> str:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _failure(model: str, key: str):
+    """按模型名注入故障，返回错误响应或 None"""
+    if model == "error":
+        return JSONResponse({"error": {"message": "stub error"}}, status_code=500)
+    if model == "flaky":
+        _attempts[key] += 1
+        if _attempts[key] % 2 == 1:
+            return JSONResponse({"error": {"message": "stub overloaded"}}, status_code=503, headers={"Retry-After": "0"})
+    return None
+
+
+async def _stream(model: str, frames: List[str]) -> AsyncIterator[str]:
+    for frame in frames:
+        if model == "slow":
+            await asyncio.sleep(0.5)
+        yield frame
+
+
+def _reply(messages: List[Dict[str, Any]]) -> str:
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = message.get("content")
+            if isinstance(content, str):
+                return f"echo: {content}"
+            parts = message.get("parts") or []
+            return "echo: " + "".join(part.get("text", "") for part in parts)
+    return "echo:"
+
+
+@app.post("/v1/chat/completions")
+async def openai_chat(request: Request):
+    body = await request.json()
+    model = body.get("model", "")
+    failure = _failure(model, f"openai:{request.headers.get('authorization')}:{json.dumps(body)}")
+    if failure:
+        return failure
+    frames = [_sse({"choices": [{"delta": {"content": chunk}, "finish_reason": None}]}) for chunk in _chunks(_reply(body["messages"]))]
+    frames.append(_sse({"choices": [{"delta": {}, "finish_reason": "stop"}]}))
+    frames.append("data: [DONE]\n\n")
+    return StreamingResponse(_stream(model, frames), media_type="text/event-stream")
+
+
+@app.post("/v1/messages")
+async def claude_messages(request: Request):
+    body = await request.json()
+    model = body.get("model", "")
+    failure = _failure(model, f"claude:{json.dumps(body)}")
+    if failure:
+        return failure
+    frames = [f"event: message_start\n{_sse({'type': 'message_start', 'message': {'model': model}})}"]
+    for chunk in _chunks(_reply(body["messages"])):
+        frames.append(f"event: content_block_delta\n{_sse({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': chunk}})}")
+    frames.append(f"event: message_delta\n{_sse({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}})}")
+    frames.append(f"event: message_stop\n{_sse({'type': 'message_stop'})}")
+    return StreamingResponse(_stream(model, frames), media_type="text/event-stream")
+
+
+@app.post("/v1beta/models/{target}")
+async def gemini_stream(target: str, request: Request):
+    body = await request.json()
+    model = target.split(":", 1)[0]
+    failure = _failure(model, f"gemini:{json.dumps(body)}")
+    if failure:
+        return failure
+    chunks = _chunks(_reply(body["contents"]))
+    frames = [
+        _sse({"candidates": [{
+            "content": {"role": "model", "parts": [{"text": chunk}]},
+            **({"finishReason": "STOP"} if index == len(chunks) - 1 else {}),
+        }]})
+        for index, chunk in enumerate(chunks)
+    ]
+    return StreamingResponse(_stream(model, frames), media_type="text/event-stream")
+
+
+@app.post("/v1/embeddings")
+async def openai_embeddings(request: Request):
+    body = await request.json()
+    failure = _failure(body.get("model", ""), f"embeddings:{json.dumps(body)}")
+    if failure:
+        return failure
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    _embedding_batches.append(len(inputs))
+    data = []
+    for index, text in enumerate(inputs):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        data.append({"object": "embedding", "index": index, "embedding": [b / 255 for b in digest[:EMBEDDING_DIM]]})
+    return {"object": "list", "model": body.get("model"), "data": data}
+
+
+@app.get("/stats")
+async def stats():
+    return {"embedding_batches": _embedding_batches}
@@ -2,6 +2,7 @@
 FastAPI 主应用
 """
 import os
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,6 +14,7 @@ from .core.config import settings
 from .database.config import init_db, close_db
 from .api.v1 import api_v1_router
 from .models import User
+from .services import travel_points, stats, admin_jobs, user_cache, llm_gateway, ai_cache, embeddings, presence, travel, event_log, cascade_delete  # noqa: F401 注册任务处理函数
 
 
 # 配置日志
@@ -58,6 +60,28 @@ async def lifespan(app: FastAPI):
         logger.error(f"⚠️ 管理员账号创建失败: {e}")
         logger.error(traceback.format_exc())
     
+    # 加载用户级缓存、AI 响应缓存索引、Embedding 向量缓存与进行中的穿越会话
+    await user_cache.load()
+    await cascade_delete.load()
+    await ai_cache.load()
+    await embeddings.load()
+    await travel.load()
+    
+    # 续跑未完成的管理任务
+    await admin_jobs.resume_unfinished()
+    
+    # 启动后台任务
+    background_tasks = [
+        asyncio.create_task(travel_points.run_snapshot_worker()),
+        asyncio.create_task(stats.run_flush_worker()),
+        asyncio.create_task(stats.run_reconcile_worker()),
+        asyncio.create_task(presence.run_expiry_worker()),
+        asyncio.create_task(presence.run_flush_worker()),
+        asyncio.create_task(travel.run_expiry_worker()),
+        asyncio.create_task(travel.run_flush_worker()),
+        asyncio.create_task(event_log.run_flush_worker()),
+    ]
+    
     logger.info(f"🎮 {settings.APP_NAME} v{settings.APP_VERSION} 启动成功")
     logger.info(f"📍 服务地址: http://{settings.HOST}:{settings.PORT}")
     logger.info(f"📖 API文档: http://{settings.HOST}:{settings.PORT}/docs")
@@ -66,6 +90,12 @@ async def lifespan(app: FastAPI):
     yield
     
     # 关闭时
+    await admin_jobs.shutdown()
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await llm_gateway.close()
+    
     logger.info("👋 正在关闭数据库连接...")
     await close_db()
     logger.info("✅ 数据库连接已关闭")
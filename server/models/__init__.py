@@ -1,12 +1,16 @@
 """
 数据库模型初始化
 """
-from .user import User, EmailVerificationCode, RedemptionCode, InvitationCode, UserAPIConfig, UserLocalData
+from .user import (
+    User, EmailVerificationCode, RedemptionCode, InvitationCode, UserAPIConfig, UserLocalData,
+    TravelPointLedger, TravelPointSnapshot, StatCounter, UserPresence
+)
 from .game import (
     World, TalentTier, Origin, SpiritRoot, Talent,
-    Character, WorldInstance, TravelSession
+    Character, WorldInstance, TravelSession, CatalogContentHash, VectorMemory
 )
-from .prompts import DefaultPromptConfig, UserPromptConfig
+from .prompts import DefaultPromptConfig, UserPromptConfig, DefaultPromptVersion
+from .admin import AdminJob, AdminAuditLog
 
 __all__ = [
     "User",
@@ -15,6 +19,10 @@ __all__ = [
     "InvitationCode",
     "UserAPIConfig",
     "UserLocalData",
+    "TravelPointLedger",
+    "TravelPointSnapshot",
+    "StatCounter",
+    "UserPresence",
     "World",
     "TalentTier",
     "Origin",
@@ -23,6 +31,11 @@ __all__ = [
     "Character",
     "WorldInstance",
     "TravelSession",
+    "CatalogContentHash",
+    "VectorMemory",
     "DefaultPromptConfig",
     "UserPromptConfig",
+    "DefaultPromptVersion",
+    "AdminJob",
+    "AdminAuditLog",
 ]
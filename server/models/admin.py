@@ -0,0 +1,38 @@
+"""
+数据库模型 - 后台任务
+"""
+from tortoise import fields
+from tortoise.models import Model
+
+
+class AdminJob(Model):
+    """管理员后台任务（分块执行，进度落库，重启后可续跑）"""
+    id = fields.IntField(pk=True)
+    kind = fields.CharField(max_length=50, description="任务类型")
+    status = fields.CharField(max_length=20, default="pending", index=True, description="状态：pending/running/done/failed/cancelled")
+    params = fields.JSONField(default=dict, description="任务参数")
+    progress = fields.JSONField(default=dict, description="执行进度")
+    total = fields.IntField(default=0, description="总数")
+    processed = fields.IntField(default=0, description="已处理数")
+    error = fields.TextField(null=True, description="错误信息")
+    created_by = fields.IntField(null=True, description="创建者用户ID")
+    created_at = fields.DatetimeField(auto_now_add=True, description="创建时间")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+    finished_at = fields.DatetimeField(null=True, description="结束时间")
+
+    class Meta:
+        table = "admin_jobs"
+
+
+class AdminAuditLog(Model):
+    """管理员操作审计（批量操作每个分块记录一条）"""
+    id = fields.IntField(pk=True)
+    admin_id = fields.IntField(null=True, index=True, description="操作管理员用户ID")
+    action = fields.CharField(max_length=50, description="操作类型")
+    params = fields.JSONField(default=dict, description="操作参数")
+    target_ids = fields.JSONField(default=list, description="本批目标用户ID")
+    affected = fields.IntField(default=0, description="实际影响行数")
+    created_at = fields.DatetimeField(auto_now_add=True, index=True, description="创建时间")
+
+    class Meta:
+        table = "admin_audit_logs"
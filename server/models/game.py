@@ -101,6 +101,7 @@ class WorldInstance(Model):
     
     class Meta:
         table = "world_instances"
+        indexes = (("visibility_mode", "updated_at"),)
 
 
 class TravelSession(Model):
@@ -116,3 +117,39 @@ class TravelSession(Model):
     
     class Meta:
         table = "travel_sessions"
+
+
+class CatalogContentHash(Model):
+    """目录内容去重索引（规范化名称+描述+效果的哈希）"""
+    id = fields.IntField(pk=True)
+    content_type = fields.CharField(max_length=20, description="内容类型：world/origin/spirit_root/talent")
+    content_hash = fields.CharField(max_length=64, description="规范化内容哈希")
+    object_id = fields.IntField(description="对应内容ID")
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "catalog_content_hashes"
+        unique_together = (("content_type", "content_hash"),)
+        indexes = (("content_type", "object_id"),)
+
+
+class VectorMemory(Model):
+    """向量记忆条目（向量本身存放在按存档划分的 float32 矩阵文件中，row 为行号）"""
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="vector_memories")
+    slot = fields.CharField(max_length=64, description="存档槽位")
+    entry_id = fields.CharField(max_length=64, description="客户端记忆ID")
+    row = fields.IntField(description="向量矩阵行号")
+    content = fields.TextField(description="记忆内容")
+    tags = fields.JSONField(default=list, description="标签")
+    category = fields.CharField(max_length=20, default="other", description="分类")
+    importance = fields.FloatField(default=5, description="重要度（0-10）")
+    timestamp = fields.BigIntField(description="记忆时间（毫秒时间戳）")
+    model = fields.CharField(max_length=100, description="Embedding 模型")
+    metadata = fields.JSONField(null=True, description="附加信息（NPC/地点/物品等）")
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "vector_memories"
+        unique_together = (("user", "slot", "entry_id"),)
+        indexes = (("user", "slot", "row"),)
@@ -26,3 +26,15 @@ class UserPromptConfig(Model):
 
     class Meta:
         table = "user_prompt_configs"
+
+
+class DefaultPromptVersion(Model):
+    """默认提示词单个条目的内容哈希与版本号"""
+    id = fields.IntField(pk=True)
+    key = fields.CharField(max_length=200, unique=True, description="提示词键")
+    content_hash = fields.CharField(max_length=64, description="内容哈希")
+    version = fields.IntField(default=1, description="版本号（内容变化时递增）")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "default_prompt_versions"
@@ -93,3 +93,51 @@ class InvitationCode(Model):
     
     class Meta:
         table = "invitation_codes"
+
+
+class TravelPointLedger(Model):
+    """穿越点数流水（只追加）"""
+    id = fields.BigIntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="travel_point_entries")
+    kind = fields.CharField(max_length=20, description="类型：grant/consume/redeem/signin/adjust")
+    delta = fields.IntField(description="变动值（扣减为负数）")
+    balance_after = fields.IntField(description="变动后余额")
+    reason = fields.CharField(max_length=255, null=True, description="备注")
+    created_at = fields.DatetimeField(auto_now_add=True, index=True, description="创建时间")
+
+    class Meta:
+        table = "travel_point_ledger"
+        indexes = (("user_id", "id"),)
+
+
+class TravelPointSnapshot(Model):
+    """穿越点数余额快照（由后台任务从流水汇总）"""
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="travel_point_snapshot", unique=True)
+    balance = fields.IntField(description="快照余额")
+    last_entry_id = fields.BigIntField(description="已汇总的最后一条流水ID")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "travel_point_snapshots"
+
+
+class StatCounter(Model):
+    """统计计数器（由写路径增量维护，定期对账）"""
+    id = fields.IntField(pk=True)
+    key = fields.CharField(max_length=64, unique=True, description="计数键")
+    value = fields.BigIntField(default=0, description="计数值")
+    updated_at = fields.DatetimeField(auto_now=True, description="更新时间")
+
+    class Meta:
+        table = "stat_counters"
+
+
+class UserPresence(Model):
+    """最后在线时间（在线状态只保存在进程内存，此表由后台任务批量写入）"""
+    id = fields.IntField(pk=True)
+    user = fields.ForeignKeyField("models.User", related_name="presence", unique=True)
+    last_seen_at = fields.DatetimeField(description="最后心跳-北京时间")
+
+    class Meta:
+        table = "user_presence"
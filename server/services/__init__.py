@@ -0,0 +1 @@
+# 空文件
@@ -0,0 +1,116 @@
+"""
+后台任务调度 - 管理员批量任务的提交、续跑与取消
+任务串行执行，进度随每个分块事务一起落库；服务重启后未完成的任务自动续跑。
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from loguru import logger
+
+from ..models import AdminJob
+from ..core.security import get_beijing_time
+
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+UNFINISHED_STATUSES = (JOB_PENDING, JOB_RUNNING)
+
+JobHandler = Callable[[AdminJob], Awaitable[None]]
+
+_handlers: Dict[str, JobHandler] = {}
+_tasks: Dict[int, asyncio.Task] = {}
+_lock = asyncio.Lock()
+
+
+def register(kind: str):
+    """注册任务处理函数"""
+    def decorator(handler: JobHandler) -> JobHandler:
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+
+def serialize(job: AdminJob) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "total": job.total,
+        "processed": job.processed,
+        "progress": job.progress or {},
+        "error": job.error,
+        "created_by": job.created_by,
+        "created_at": job.created_at.isoformat(),
+        "updated_at": job.updated_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+async def submit(kind: str, params: Dict[str, Any], total: int = 0, created_by: Optional[int] = None) -> AdminJob:
+    """创建任务并加入执行队列"""
+    if kind not in _handlers:
+        raise ValueError(f"未知任务类型: {kind}")
+    job = await AdminJob.create(kind=kind, params=params, total=total, created_by=created_by)
+    _schedule(job.id)
+    return job
+
+
+async def cancel(job_id: int) -> bool:
+    """取消未完成的任务；正在执行的分块会整体回滚"""
+    updated = await AdminJob.filter(id=job_id, status__in=UNFINISHED_STATUSES).update(
+        status=JOB_CANCELLED, finished_at=get_beijing_time()
+    )
+    task = _tasks.get(job_id)
+    if task:
+        task.cancel()
+    return bool(updated)
+
+
+async def resume_unfinished() -> None:
+    """启动时续跑上次未完成的任务"""
+    job_ids = await AdminJob.filter(status__in=UNFINISHED_STATUSES).order_by("id").values_list("id", flat=True)
+    for job_id in job_ids:
+        logger.info(f"🔁 续跑后台任务 #{job_id}")
+        _schedule(job_id)
+
+
+async def shutdown() -> None:
+    """关闭时中断执行中的任务，状态保持不变以便下次启动续跑"""
+    tasks = list(_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def _schedule(job_id: int) -> None:
+    if job_id not in _tasks:
+        _tasks[job_id] = asyncio.create_task(_run(job_id))
+
+
+async def _run(job_id: int) -> None:
+    try:
+        async with _lock:
+            job = await AdminJob.get_or_none(id=job_id)
+            if not job or job.status not in UNFINISHED_STATUSES:
+                return
+            job.status = JOB_RUNNING
+            await job.save(update_fields=["status", "updated_at"])
+            try:
+                await _handlers[job.kind](job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"⚠️ 后台任务 #{job_id} 执行失败: {e}")
+                await AdminJob.filter(id=job_id, status=JOB_RUNNING).update(
+                    status=JOB_FAILED, error=str(e), finished_at=get_beijing_time()
+                )
+            else:
+                await AdminJob.filter(id=job_id, status=JOB_RUNNING).update(
+                    status=JOB_DONE, finished_at=get_beijing_time()
+                )
+    finally:
+        _tasks.pop(job_id, None)
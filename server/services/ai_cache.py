@@ -0,0 +1,177 @@
+"""
+AI 响应缓存 - 按规范化请求哈希缓存确定性生成的完整输出
+索引常驻内存（LRU + TTL），输出分段落盘，命中时按原分段重放为 SSE；磁盘总量超过上限时按最久未用淘汰。
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from ..core.config import settings
+
+
+class CacheEntry:
+    def __init__(self, path: str, size: int, expires_at: float):
+        self.path = path
+        self.size = size
+        self.expires_at = expires_at
+
+
+_index: "OrderedDict[str, CacheEntry]" = OrderedDict()
+_total_bytes = 0
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def _path(key: str) -> str:
+    return os.path.join(settings.AI_CACHE_DIR, key[:2], f"{key}.json")
+
+
+def _forget(key: str) -> Optional[CacheEntry]:
+    """只从索引中移除"""
+    global _total_bytes
+    entry = _index.pop(key, None)
+    if entry is not None:
+        _total_bytes -= entry.size
+    return entry
+
+
+def _remove(key: str) -> None:
+    """从索引和磁盘中移除"""
+    entry = _forget(key)
+    if entry is None:
+        return
+    try:
+        os.remove(entry.path)
+    except OSError:
+        pass
+
+
+def _evict() -> None:
+    """淘汰过期条目，再按最久未用淘汰到容量以内"""
+    now = time.time()
+    for key in [k for k, entry in _index.items() if entry.expires_at <= now]:
+        _remove(key)
+        _metrics["evictions"] += 1
+    while _index and (_total_bytes > settings.AI_CACHE_MAX_BYTES or len(_index) > settings.AI_CACHE_MAX_ENTRIES):
+        _remove(next(iter(_index)))
+        _metrics["evictions"] += 1
+
+
+def _scan() -> None:
+    """启动时从磁盘重建索引（按修改时间排列近似 LRU 顺序）"""
+    global _total_bytes
+    _index.clear()
+    _total_bytes = 0
+    if not os.path.isdir(settings.AI_CACHE_DIR):
+        return
+    found = []
+    for root, _, files in os.walk(settings.AI_CACHE_DIR):
+        for name in files:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                stat = os.stat(path)
+                found.append((stat.st_mtime, name[:-5], path, stat.st_size))
+    for mtime, key, path, size in sorted(found):
+        _index[key] = CacheEntry(path, size, mtime + settings.AI_CACHE_TTL)
+        _total_bytes += size
+    _evict()
+
+
+async def load() -> None:
+    """加载磁盘上的缓存索引"""
+    if settings.AI_CACHE_ENABLED:
+        await asyncio.to_thread(_scan)
+        logger.info(f"🗂️ AI 响应缓存已加载 {len(_index)} 条")
+
+
+def _read(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write(path: str, data: bytes) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+async def get(key: str) -> Optional[Dict[str, Any]]:
+    """读取缓存的输出 {"chunks": [...], "finish_reason": ...}；未命中或已过期返回 None"""
+    entry = _index.get(key)
+    if entry is None or entry.expires_at <= time.time():
+        if entry is not None:
+            _remove(key)
+        return None
+    try:
+        data = await asyncio.to_thread(_read, entry.path)
+    except (OSError, ValueError):
+        _remove(key)
+        return None
+    _index.move_to_end(key)
+    return data
+
+
+async def put(key: str, chunks: List[str], finish_reason: Optional[str]) -> None:
+    """写入一条完整输出"""
+    global _total_bytes
+    data = json.dumps(
+        {"chunks": chunks, "finish_reason": finish_reason, "created_at": time.time()},
+        ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    if len(data) > settings.AI_CACHE_MAX_BYTES:
+        return
+    path = _path(key)
+    await asyncio.to_thread(_write, path, data)
+    _forget(key)
+    _index[key] = CacheEntry(path, len(data), time.time() + settings.AI_CACHE_TTL)
+    _total_bytes += len(data)
+    _metrics["stores"] += 1
+    _evict()
+
+
+async def cached(
+    key: str,
+    factory: Callable[[], AsyncIterator[Dict[str, Any]]]
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    命中时按原分段重放缓存事件；未命中时调用 factory() 生成并透传，
+    只有完整结束（收到 done 事件）的输出才会写入缓存。
+    """
+    data = await get(key)
+    if data is not None:
+        _metrics["hits"] += 1
+        for chunk in data["chunks"]:
+            yield {"type": "delta", "text": chunk}
+        yield {"type": "done", "finish_reason": data.get("finish_reason"), "cached": True}
+        return
+
+    _metrics["misses"] += 1
+    chunks: List[str] = []
+    events = factory()
+    try:
+        async for event in events:
+            if event["type"] == "delta":
+                chunks.append(event["text"])
+            elif event["type"] == "done":
+                await put(key, chunks, event.get("finish_reason"))
+            yield event
+    finally:
+        await events.aclose()
+
+
+async def clear() -> int:
+    """清空全部缓存，返回删除条数"""
+    count = len(_index)
+    for key in list(_index):
+        _remove(key)
+    return count
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {**_metrics, "entries": len(_index), "bytes": _total_bytes}
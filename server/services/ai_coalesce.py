@@ -0,0 +1,131 @@
+"""
+AI 请求合并 - 相同规范化请求哈希的并发生成共享同一个上游调用
+首个请求发起上游调用，后到的请求先重放已收到的事件再接收后续事件；
+只有最后一个订阅者断开时才取消上游调用。
+每个订阅者的队列有上限：队列满时上游读取暂停等待，超过 AI_COALESCE_LAG_TIMEOUT 仍未读取的订阅者被断开；
+重放缓冲超过上限后该调用不再接受新的订阅者（之后的相同请求另行发起调用）。
+"""
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from loguru import logger
+
+from ..core.config import settings
+from .llm_gateway import GatewayError
+
+
+_END = object()
+
+
+class _Flight:
+    """一次进行中的上游调用及其订阅者"""
+
+    def __init__(self, key: str):
+        self.key = key
+        # 超过上限后为 None，不再接受新的订阅者
+        self.buffer: Optional[List[Any]] = []
+        self.queues: List[asyncio.Queue] = []
+        self.finished = False
+        self.task: asyncio.Task = None
+
+    async def publish(self, item: Any) -> None:
+        if self.buffer is not None:
+            if len(self.buffer) < settings.AI_COALESCE_BUFFER_EVENTS:
+                self.buffer.append(item)
+            else:
+                self.buffer = None
+                _release(self)
+        for queue in list(self.queues):
+            if queue.full():
+                try:
+                    await asyncio.wait_for(queue.put(item), settings.AI_COALESCE_LAG_TIMEOUT)
+                except asyncio.TimeoutError:
+                    _drop(self, queue)
+            else:
+                queue.put_nowait(item)
+
+
+_flights: Dict[str, _Flight] = {}
+_metrics: Dict[str, int] = {"upstream_calls": 0, "coalesced": 0, "cancelled": 0, "dropped": 0}
+
+
+def _release(flight: _Flight) -> None:
+    if _flights.get(flight.key) is flight:
+        del _flights[flight.key]
+
+
+def _drop(flight: _Flight, queue: asyncio.Queue) -> None:
+    """断开读取过慢的订阅者：清空其队列，只留下错误"""
+    if queue in flight.queues:
+        flight.queues.remove(queue)
+    while not queue.empty():
+        queue.get_nowait()
+    queue.put_nowait(GatewayError("接收过慢，已断开", 503))
+    _metrics["dropped"] += 1
+
+
+async def _produce(flight: _Flight, factory: Callable[[], AsyncIterator[Dict[str, Any]]]) -> None:
+    events = factory()
+    outcome: Any = _END
+    try:
+        async for event in events:
+            await flight.publish(event)
+            if not flight.queues:
+                # 订阅者均因过慢被断开
+                break
+    except GatewayError as e:
+        outcome = e
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"⚠️ AI 生成失败: {e}")
+        outcome = GatewayError(f"生成失败: {e}")
+    finally:
+        # 先标记结束，订阅者此后离开不会在关闭上游时取消本任务
+        flight.finished = True
+        _release(flight)
+        await events.aclose()
+    await flight.publish(outcome)
+
+
+async def coalesced(
+    key: str,
+    factory: Callable[[], AsyncIterator[Dict[str, Any]]]
+) -> AsyncIterator[Dict[str, Any]]:
+    """订阅 key 对应的生成；没有可加入的进行中调用时以 factory() 发起"""
+    flight = _flights.get(key)
+    if flight is None or flight.buffer is None:
+        flight = _flights[key] = _Flight(key)
+        flight.task = asyncio.create_task(_produce(flight, factory))
+        _metrics["upstream_calls"] += 1
+    else:
+        _metrics["coalesced"] += 1
+
+    queue: asyncio.Queue = asyncio.Queue(maxsize=settings.AI_COALESCE_BUFFER_EVENTS)
+    for item in flight.buffer:
+        queue.put_nowait(item)
+    flight.queues.append(queue)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END:
+                return
+            if isinstance(item, GatewayError):
+                raise GatewayError(item.message, item.status_code)
+            yield item
+    finally:
+        if queue in flight.queues:
+            flight.queues.remove(queue)
+        # 清空队列，唤醒可能正在等待向其写入的上游读取
+        while not queue.empty():
+            queue.get_nowait()
+        if not flight.queues and not flight.finished:
+            # 最后一个订阅者离开，取消上游调用
+            flight.task.cancel()
+            _release(flight)
+            _metrics["cancelled"] += 1
+
+
+def get_metrics() -> Dict[str, int]:
+    """upstream_calls 为实际发起的上游调用数，coalesced 为合并节省的调用数，dropped 为因读取过慢被断开的订阅者数"""
+    return {**_metrics, "in_flight": len(_flights)}
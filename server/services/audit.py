@@ -0,0 +1,25 @@
+"""
+管理员操作审计
+"""
+from typing import Any, Dict, List, Optional
+
+from ..models import AdminAuditLog
+
+
+async def record(
+    admin_id: Optional[int],
+    action: str,
+    params: Dict[str, Any],
+    target_ids: List[int],
+    affected: int,
+    conn=None
+) -> None:
+    """写入一条审计记录（可与业务写入处于同一事务）"""
+    await AdminAuditLog.create(
+        admin_id=admin_id,
+        action=action,
+        params=params,
+        target_ids=target_ids,
+        affected=affected,
+        using_db=conn
+    )
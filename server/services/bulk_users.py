@@ -0,0 +1,56 @@
+"""
+批量用户操作 - 按分块执行集合式 UPDATE，每个分块一条审计记录
+"""
+from typing import Any, Dict, List, Optional
+
+from tortoise.transactions import in_transaction
+
+from ..models import User
+from ..core.config import settings
+from . import audit, stats, travel_points, user_cache
+
+
+def _chunks(user_ids: List[int]):
+    size = settings.ADMIN_JOB_CHUNK_SIZE
+    for start in range(0, len(user_ids), size):
+        yield user_ids[start:start + size]
+
+
+async def grant_travel_points(
+    user_ids: List[int],
+    amount: int,
+    admin_id: Optional[int],
+    reason: Optional[str] = None
+) -> Dict[str, Any]:
+    """为一批用户发放穿越点数"""
+    affected = 0
+    batches = 0
+    params = {"amount": amount, "reason": reason}
+    for chunk in _chunks(user_ids):
+        async with in_transaction() as conn:
+            updated = await travel_points.grant_points_bulk(
+                chunk, amount, conn, reason=reason or "管理员批量发放"
+            )
+            await audit.record(admin_id, "bulk_grant_travel_points", params, chunk, updated, conn)
+        affected += updated
+        batches += 1
+    user_cache.invalidate(user_ids)
+    return {"matched": len(user_ids), "affected": affected, "batches": batches}
+
+
+async def set_active(user_ids: List[int], is_active: bool, admin_id: Optional[int]) -> Dict[str, Any]:
+    """批量启用/禁用用户（只更新状态确实变化的行）"""
+    affected = 0
+    batches = 0
+    params = {"is_active": is_active}
+    for chunk in _chunks(user_ids):
+        async with in_transaction() as conn:
+            updated = await User.filter(id__in=chunk, is_active=not is_active).using_db(conn).update(
+                is_active=is_active
+            )
+            await audit.record(admin_id, "bulk_set_active", params, chunk, updated, conn)
+        affected += updated
+        batches += 1
+    stats.incr(stats.USERS_ENABLED, affected if is_active else -affected)
+    user_cache.set_active(user_ids, is_active)
+    return {"matched": len(user_ids), "affected": affected, "batches": batches}
@@ -0,0 +1,153 @@
+"""
+级联删除 - 以分块事务删除用户及其全部关联数据
+每个分块独立提交并同时记录任务进度，分块之间主动让出写锁，避免长时间阻塞其他写入。
+"""
+import asyncio
+from typing import Callable, List, Optional, Tuple, Type
+
+from tortoise.expressions import Q
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from ..models import (
+    User, Character, UserLocalData, UserAPIConfig, UserPromptConfig, UserPresence,
+    WorldInstance, TravelSession, TravelPointLedger, TravelPointSnapshot, VectorMemory, AdminJob
+)
+from ..core.config import settings
+from ..core.security import get_beijing_time
+from . import admin_jobs, stats, user_cache, vector_memory, presence, travel, event_log
+
+
+JOB_KIND = "delete_users"
+
+
+class CascadeStep:
+    """一类关联数据的删除步骤"""
+
+    def __init__(
+        self,
+        name: str,
+        model: Type[Model],
+        condition: Callable[[int], Q],
+        size_fields: Tuple[str, ...] = (),
+        count_key: Optional[str] = None
+    ):
+        self.name = name
+        self.model = model
+        self.condition = condition
+        # 需要计入存档字节统计的 JSON 字段
+        self.size_fields = size_fields
+        # 删除时需要同步递减的计数键
+        self.count_key = count_key
+
+
+def _travel_sessions_of(uid: int) -> Q:
+    return Q(traveler_id=uid) | Q(target_user_id=uid) | Q(world_instance__owner_id=uid)
+
+
+# 按依赖顺序排列：先删引用方，再删被引用方，最后删除用户本身
+CASCADE_STEPS: List[CascadeStep] = [
+    CascadeStep("travel_sessions", TravelSession, _travel_sessions_of),
+    CascadeStep("world_instances", WorldInstance, lambda uid: Q(owner_id=uid)),
+    CascadeStep(
+        "characters", Character, lambda uid: Q(user_id=uid),
+        size_fields=("save_data",), count_key=stats.SAVES_TOTAL
+    ),
+    CascadeStep(
+        "local_data", UserLocalData, lambda uid: Q(user_id=uid),
+        size_fields=("characters_json", "saves_json"), count_key=stats.LOCAL_DATA_TOTAL
+    ),
+    CascadeStep("api_configs", UserAPIConfig, lambda uid: Q(user_id=uid)),
+    CascadeStep("prompt_configs", UserPromptConfig, lambda uid: Q(user_id=uid)),
+    CascadeStep("travel_point_ledger", TravelPointLedger, lambda uid: Q(user_id=uid)),
+    CascadeStep("travel_point_snapshots", TravelPointSnapshot, lambda uid: Q(user_id=uid)),
+    CascadeStep("vector_memories", VectorMemory, lambda uid: Q(user_id=uid)),
+    CascadeStep("presence", UserPresence, lambda uid: Q(user_id=uid)),
+]
+
+
+async def _save_progress(job: AdminJob, conn, **fields) -> None:
+    await AdminJob.filter(id=job.id).using_db(conn).update(
+        progress=job.progress, updated_at=get_beijing_time(), **fields
+    )
+
+
+async def _delete_chunk(step: CascadeStep, user_id: int, job: AdminJob) -> int:
+    """删除一个分块并在同一事务内记录进度，返回删除行数"""
+    async with in_transaction() as conn:
+        rows = await step.model.filter(step.condition(user_id)).using_db(conn).limit(
+            settings.ADMIN_JOB_CHUNK_SIZE
+        ).values_list("id", *step.size_fields)
+        if not rows:
+            return 0
+        await step.model.filter(id__in=[row[0] for row in rows]).using_db(conn).delete()
+        deleted = job.progress.setdefault("deleted", {})
+        deleted[step.name] = deleted.get(step.name, 0) + len(rows)
+        await _save_progress(job, conn)
+
+    if step.count_key:
+        stats.incr(step.count_key, -len(rows))
+    if step.size_fields:
+        stats.incr(stats.SAVE_BYTES, -sum(stats.json_size(value) for row in rows for value in row[1:]))
+    return len(rows)
+
+
+async def delete_user_cascade(user_id: int, job: AdminJob) -> None:
+    """删除单个用户的全部数据；重复执行是安全的（已删除的部分会被跳过）"""
+    # 先禁用账号，删除过程中无法再登录写入
+    if await User.filter(id=user_id, is_active=True).update(is_active=False):
+        stats.incr(stats.USERS_ENABLED, -1)
+    user_cache.set_active([user_id], False)
+    presence.forget(user_id)
+    travel.forget_user(user_id)
+    # 会话事件日志在行删除后按ID清理；ID随第一个分块的进度一并落库，续跑时会话行已删除也能找回
+    if job.progress.get("sessions_of") != user_id:
+        job.progress["sessions_of"] = user_id
+        job.progress["session_ids"] = list(
+            await TravelSession.filter(_travel_sessions_of(user_id)).values_list("id", flat=True)
+        )
+    session_ids = job.progress["session_ids"]
+
+    for step in CASCADE_STEPS:
+        job.progress["step"] = step.name
+        while await _delete_chunk(step, user_id, job):
+            await asyncio.sleep(settings.ADMIN_JOB_CHUNK_PAUSE)
+    vector_memory.drop_user(user_id)
+    await event_log.drop(list(session_ids))
+
+    job.progress["step"] = "user"
+    job.progress.pop("sessions_of", None)
+    job.progress.pop("session_ids", None)
+    job.processed += 1
+    async with in_transaction() as conn:
+        removed = await User.filter(id=user_id).using_db(conn).delete()
+        await _save_progress(job, conn, processed=job.processed)
+    if removed:
+        stats.incr(stats.USERS_TOTAL, -1)
+    # 保留在禁用集合中：该用户仍有效的旧令牌继续被拒绝
+    user_cache.invalidate([user_id])
+
+
+@admin_jobs.register(JOB_KIND)
+async def run_delete_users(job: AdminJob) -> None:
+    """任务处理：按顺序删除 params.user_ids 中的用户，从已处理位置续跑"""
+    user_ids = job.params.get("user_ids", [])
+    job.progress = job.progress or {}
+    for user_id in user_ids[job.processed:]:
+        job.progress["user_id"] = user_id
+        await delete_user_cascade(user_id, job)
+
+
+async def load() -> None:
+    """启动时把已删除用户的ID加入禁用集合（禁用集合只从现存用户加载，已删除的ID需从删除任务中恢复）"""
+    user_ids = set()
+    for params in await AdminJob.filter(kind=JOB_KIND).values_list("params", flat=True):
+        user_ids.update((params or {}).get("user_ids", []))
+    if user_ids:
+        existing = set(await User.filter(id__in=list(user_ids)).values_list("id", flat=True))
+        user_cache.set_active(user_ids - existing, False)
+
+
+async def submit_delete_users(user_ids: List[int], created_by: Optional[int] = None) -> AdminJob:
+    """提交级联删除任务"""
+    return await admin_jobs.submit(JOB_KIND, {"user_ids": user_ids}, total=len(user_ids), created_by=created_by)
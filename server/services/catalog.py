@@ -0,0 +1,170 @@
+"""
+游戏目录服务 - 公共列表的版本号与缓存、AI 内容去重索引
+"""
+import hashlib
+import json
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from tortoise.models import Model
+from tortoise.transactions import in_transaction
+
+from ..models import World, Origin, SpiritRoot, Talent, Character, WorldInstance, CatalogContentHash
+
+
+# 以启动时间作为初始值，重启后的版本号不会与之前的 ETag 冲突
+_version = int(time.time() * 1000)
+_cache: Dict[str, Any] = {}
+
+
+def get_version() -> int:
+    """获取当前目录版本号"""
+    return _version
+
+
+def bump_version() -> int:
+    """目录内容变更后递增版本号并清空列表缓存"""
+    global _version
+    _version += 1
+    _cache.clear()
+    return _version
+
+
+def get_etag() -> str:
+    """当前目录版本对应的 ETag"""
+    return f'W/"catalog-{_version}"'
+
+
+def get_cached(key: str) -> Optional[Any]:
+    """读取当前版本下缓存的列表"""
+    return _cache.get(key)
+
+
+def set_cached(key: str, value: Any) -> Any:
+    """缓存当前版本下的列表"""
+    _cache[key] = value
+    return value
+
+
+# === 内容去重 ===
+# 参与去重的类型 -> (模型, 计入哈希的效果字段)
+DEDUPE_MODELS: Dict[str, tuple] = {
+    "world": (World, None),
+    "origin": (Origin, "effects"),
+    "spirit_root": (SpiritRoot, "elements"),
+    "talent": (Talent, "effects"),
+}
+
+FOLD_CHUNK_SIZE = 500
+
+
+def _fold_text(value: Any) -> str:
+    """NFKC 归一、转小写，并去掉空白与标点"""
+    text = unicodedata.normalize("NFKC", str(value or "")).lower()
+    return "".join(ch for ch in text if unicodedata.category(ch)[0] not in ("P", "Z", "C"))
+
+
+def content_hash(content_type: str, fields: Dict[str, Any]) -> Optional[str]:
+    """计算规范化内容哈希；不参与去重的类型返回 None"""
+    if content_type not in DEDUPE_MODELS:
+        return None
+    _, effects_field = DEDUPE_MODELS[content_type]
+    effects = fields.get(effects_field) if effects_field else None
+    canonical = "\x1f".join([
+        _fold_text(fields.get("name")),
+        _fold_text(fields.get("description")),
+        json.dumps(effects or {}, ensure_ascii=False, sort_keys=True, separators=(",", ":")),
+    ])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+async def find_existing(content_type: str, hashes: Iterable[str], conn=None) -> Dict[str, int]:
+    """按哈希批量查找已存在的内容ID"""
+    wanted = [h for h in set(hashes) if h]
+    if not wanted:
+        return {}
+    rows = await CatalogContentHash.filter(
+        content_type=content_type, content_hash__in=wanted
+    ).using_db(conn).values_list("content_hash", "object_id")
+    return dict(rows)
+
+
+async def register_hashes(content_type: str, pairs: List[tuple], conn=None) -> None:
+    """登记 (哈希, 内容ID)；并发插入同一内容时由唯一索引报错回滚"""
+    if not pairs:
+        return
+    await CatalogContentHash.bulk_create(
+        [CatalogContentHash(content_type=content_type, content_hash=h, object_id=oid) for h, oid in pairs],
+        using_db=conn
+    )
+
+
+async def forget_object(content_type: str, object_id: int) -> None:
+    """内容被修改或删除后移除其去重索引"""
+    await CatalogContentHash.filter(content_type=content_type, object_id=object_id).delete()
+
+
+async def _remap_references(model: Type[Model], duplicate_to_canonical: Dict[int, int], conn) -> None:
+    """把外键引用从重复项改指向保留项"""
+    if model is not World:
+        return
+    for dup_id, keep_id in duplicate_to_canonical.items():
+        await Character.filter(world_id=dup_id).using_db(conn).update(world_id=keep_id)
+        await WorldInstance.filter(world_id=dup_id).using_db(conn).update(world_id=keep_id)
+
+
+async def fold_duplicates(content_type: str, dry_run: bool = False) -> Dict[str, int]:
+    """
+    合并表中已有的重复内容：每组保留ID最小的一条，
+    补齐去重索引，迁移外键引用后删除其余重复行。
+    """
+    model, effects_field = DEDUPE_MODELS[content_type]
+    columns = ["id", "name", "description"] + ([effects_field] if effects_field else [])
+
+    canonical: Dict[str, int] = {}
+    duplicates: Dict[int, int] = {}
+    scanned = 0
+    last_id = 0
+    while True:
+        rows = await model.filter(id__gt=last_id).order_by("id").limit(FOLD_CHUNK_SIZE).values(*columns)
+        if not rows:
+            break
+        for row in rows:
+            digest = content_hash(content_type, row)
+            if digest in canonical:
+                duplicates[row["id"]] = canonical[digest]
+            else:
+                canonical[digest] = row["id"]
+        scanned += len(rows)
+        last_id = rows[-1]["id"]
+
+    result = {"scanned": scanned, "duplicates": len(duplicates), "removed": 0}
+    if dry_run:
+        return result
+
+    async with in_transaction() as conn:
+        # 索引若指向了即将删除的重复项，改为指向保留项
+        indexed = await find_existing(content_type, canonical.keys(), conn)
+        stale = [h for h, oid in indexed.items() if oid != canonical[h]]
+        if stale:
+            await CatalogContentHash.filter(
+                content_type=content_type, content_hash__in=stale
+            ).using_db(conn).delete()
+        await register_hashes(
+            content_type,
+            [(h, oid) for h, oid in canonical.items() if indexed.get(h) != oid],
+            conn
+        )
+        dup_ids = list(duplicates)
+        for start in range(0, len(dup_ids), FOLD_CHUNK_SIZE):
+            chunk = {dup: duplicates[dup] for dup in dup_ids[start:start + FOLD_CHUNK_SIZE]}
+            await _remap_references(model, chunk, conn)
+            await CatalogContentHash.filter(
+                content_type=content_type, object_id__in=list(chunk)
+            ).using_db(conn).delete()
+            result["removed"] += await model.filter(id__in=list(chunk)).using_db(conn).delete()
+
+    if result["removed"]:
+        bump_version()
+    return result
@@ -0,0 +1,274 @@
+"""
+Embedding 代理 - 把并发的单条请求在几毫秒内合并为上游批量请求，并按文本哈希缓存向量
+缓存键为 (上游地址, 模型, 规范化文本) 的哈希，向量以 float32 紧凑存储；
+缓存文件只追加写入，启动时加载，重复嵌入未变化的文本不再请求上游。
+"""
+import asyncio
+import hashlib
+import os
+import re
+import struct
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from ..core.config import settings
+from . import llm_gateway
+from .llm_gateway import GatewayError
+
+
+# 仅 OpenAI 兼容接口提供 /v1/embeddings（与前端 embeddingService 一致）
+SUPPORTED_PROVIDERS = {"openai", "deepseek", "custom"}
+
+# 缓存文件记录头：16 字节键 + 维度
+_RECORD_HEADER = struct.Struct("<16sI")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Unicode NFC 规范化并折叠空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def _key(base_url: str, model: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{base_url}\n{model}\n{text}".encode("utf-8"), digest_size=16).digest()
+
+
+# === 向量缓存 ===
+_vectors: "OrderedDict[bytes, bytes]" = OrderedDict()
+_cache_bytes = 0
+_metrics: Dict[str, int] = {
+    "requests": 0, "texts": 0, "cache_hits": 0, "deduplicated": 0,
+    "upstream_batches": 0, "upstream_texts": 0, "errors": 0,
+}
+
+
+def _remember(key: bytes, vector: bytes) -> None:
+    global _cache_bytes
+    previous = _vectors.pop(key, None)
+    if previous is not None:
+        _cache_bytes -= len(previous)
+    _vectors[key] = vector
+    _cache_bytes += len(vector)
+    while _vectors and _cache_bytes > settings.EMBEDDING_CACHE_MAX_BYTES:
+        _, evicted = _vectors.popitem(last=False)
+        _cache_bytes -= len(evicted)
+
+
+def _read_records(path: str) -> List[Tuple[bytes, bytes]]:
+    records = []
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _RECORD_HEADER.size <= len(data):
+        key, dim = _RECORD_HEADER.unpack_from(data, offset)
+        end = offset + _RECORD_HEADER.size + dim * 4
+        if end > len(data):
+            break  # 末尾记录写入不完整
+        records.append((key, data[offset + _RECORD_HEADER.size:end]))
+        offset = end
+    return records
+
+
+def _write_records(path: str, records: List[Tuple[bytes, bytes]], mode: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp" if mode == "wb" else path
+    with open(tmp, mode) as f:
+        for key, vector in records:
+            f.write(_RECORD_HEADER.pack(key, len(vector) // 4))
+            f.write(vector)
+    if tmp != path:
+        os.replace(tmp, path)
+
+
+def _load_file() -> None:
+    global _cache_bytes
+    _vectors.clear()
+    _cache_bytes = 0
+    path = settings.EMBEDDING_CACHE_PATH
+    if not path or not os.path.isfile(path):
+        return
+    records = _read_records(path)
+    for key, vector in records:
+        _remember(key, vector)
+    # 重复与已淘汰的记录过多时重写文件
+    if len(records) > 2 * len(_vectors):
+        _write_records(path, list(_vectors.items()), "wb")
+
+
+async def load() -> None:
+    """加载磁盘上的向量缓存"""
+    await asyncio.to_thread(_load_file)
+    if _vectors:
+        logger.info(f"🧭 Embedding 缓存已加载 {len(_vectors)} 条")
+
+
+# 并发批次的追加写入必须串行，否则记录头与向量交错，加载时其后的记录全部丢失
+_persist_lock = asyncio.Lock()
+
+
+async def _persist(records: List[Tuple[bytes, bytes]]) -> None:
+    if not settings.EMBEDDING_CACHE_PATH:
+        return
+    try:
+        async with _persist_lock:
+            await asyncio.to_thread(_write_records, settings.EMBEDDING_CACHE_PATH, records, "ab")
+    except OSError as e:
+        logger.error(f"⚠️ Embedding 缓存写入失败: {e}")
+
+
+# === 微批合并 ===
+BatchKey = Tuple[str, str, str]
+
+
+class _Batch:
+    """同一上游 (地址, 密钥, 模型) 下等待发送的文本"""
+
+    def __init__(self, key: BatchKey, api: Dict[str, Any]):
+        self.key = key
+        self.api = api
+        self.items: "OrderedDict[bytes, str]" = OrderedDict()
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+_batches: Dict[BatchKey, _Batch] = {}
+# 已排队或已发出但尚未返回的文本，同一上游与密钥下的相同文本共享结果（不跨密钥，避免沿用他人的鉴权错误）
+_inflight: Dict[Tuple[BatchKey, bytes], asyncio.Future] = {}
+
+
+def _base_url(api: Dict[str, Any]) -> str:
+    return llm_gateway.get_adapter("openai").base_url(api)
+
+
+def _flush(batch_key: BatchKey) -> None:
+    batch = _batches.pop(batch_key, None)
+    if batch is None:
+        return
+    if batch.timer is not None:
+        batch.timer.cancel()
+    asyncio.create_task(_send(batch))
+
+
+def _fail(batch: _Batch, keys: List[bytes], error: GatewayError) -> None:
+    _metrics["errors"] += 1
+    for key in keys:
+        future = _inflight.pop((batch.key, key), None)
+        if future is not None and not future.done():
+            future.set_exception(error)
+
+
+async def _send(batch: _Batch) -> None:
+    keys = list(batch.items)
+    texts = list(batch.items.values())
+    api = batch.api
+    _metrics["upstream_batches"] += 1
+    _metrics["upstream_texts"] += len(texts)
+    try:
+        data = await llm_gateway.post_json(
+            f"{_base_url(api)}/v1/embeddings",
+            {"Authorization": f"Bearer {api.get('apiKey', '')}"},
+            {"model": api.get("model"), "input": texts, "encoding_format": "float"},
+            "embeddings",
+        )
+        items = sorted(data.get("data") or [], key=lambda item: item.get("index", 0))
+        if len(items) != len(texts):
+            raise GatewayError("Embedding 响应条数与请求不一致")
+        vectors = [array("f", item["embedding"]).tobytes() for item in items]
+    except GatewayError as e:
+        _fail(batch, keys, e)
+        return
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        _fail(batch, keys, GatewayError(f"Embedding 响应格式异常: {e}"))
+        return
+    except Exception as e:
+        logger.error(f"⚠️ Embedding 请求失败: {e}")
+        _fail(batch, keys, GatewayError(f"Embedding 请求失败: {e}"))
+        return
+
+    for key, vector in zip(keys, vectors):
+        _remember(key, vector)
+        future = _inflight.pop((batch.key, key), None)
+        if future is not None and not future.done():
+            future.set_result(vector)
+    await _persist(list(zip(keys, vectors)))
+
+
+def _enqueue(api: Dict[str, Any], key: bytes, text: str) -> asyncio.Future:
+    batch_key = (_base_url(api), api.get("apiKey", ""), api.get("model"))
+    future = _inflight.get((batch_key, key))
+    if future is not None:
+        _metrics["deduplicated"] += 1
+        return future
+
+    loop = asyncio.get_running_loop()
+    future = _inflight[(batch_key, key)] = loop.create_future()
+    batch = _batches.get(batch_key)
+    if batch is None:
+        batch = _batches[batch_key] = _Batch(batch_key, api)
+        batch.timer = loop.call_later(settings.EMBEDDING_BATCH_WINDOW_MS / 1000, _flush, batch_key)
+    batch.items[key] = text
+    if len(batch.items) >= settings.EMBEDDING_BATCH_SIZE:
+        _flush(batch_key)
+    return future
+
+
+async def embed(api: Dict[str, Any], texts: List[str]) -> Tuple[List[bytes], int]:
+    """
+    返回 (每条文本的 float32 向量字节, 缓存命中条数)。
+    未命中的文本进入当前批次，与同一上游的并发请求一起发送。
+    """
+    provider = api.get("provider") or "openai"
+    if provider not in SUPPORTED_PROVIDERS:
+        raise GatewayError(f"当前 provider 不支持 Embedding：{provider}", status_code=400)
+    base_url = _base_url(api)
+    llm_gateway.get_client(base_url)  # 提前校验上游地址
+    model = api.get("model")
+    normalized = [normalize_text(text) for text in texts]
+    if not all(normalized):
+        raise GatewayError("输入文本不能为空", status_code=400)
+    _metrics["requests"] += 1
+    _metrics["texts"] += len(texts)
+
+    result: List[Optional[bytes]] = [None] * len(texts)
+    pending: List[Tuple[int, asyncio.Future]] = []
+    hits = 0
+    for index, text in enumerate(normalized):
+        key = _key(base_url, model, text)
+        vector = _vectors.get(key)
+        if vector is not None:
+            _vectors.move_to_end(key)
+            result[index] = vector
+            hits += 1
+        else:
+            pending.append((index, _enqueue(api, key, text)))
+    _metrics["cache_hits"] += hits
+
+    if pending:
+        vectors = await asyncio.gather(*(asyncio.shield(future) for _, future in pending))
+        for (index, _), vector in zip(pending, vectors):
+            result[index] = vector
+    return result, hits
+
+
+def to_list(vector: bytes) -> List[float]:
+    return array("f", vector).tolist()
+
+
+def clear() -> int:
+    """清空向量缓存（含缓存文件），返回删除条数"""
+    global _cache_bytes
+    count = len(_vectors)
+    _vectors.clear()
+    _cache_bytes = 0
+    path = settings.EMBEDDING_CACHE_PATH
+    if path and os.path.isfile(path):
+        os.remove(path)
+    return count
+
+
+def get_metrics() -> Dict[str, int]:
+    """upstream_batches / upstream_texts 为实际发出的上游请求数与文本数"""
+    return {**_metrics, "entries": len(_vectors), "bytes": _cache_bytes, "pending_batches": len(_batches)}
@@ -0,0 +1,308 @@
+"""
+会话事件日志 - 按会话追加写入的 NDJSON 分段文件，每条事件带递增序号
+追加只写内存（最近事件常驻内存供实时查看），由后台任务批量写入分段文件；按序号区间读取时先查内存再读文件，
+会话结算后各分段合并为一个 gzip 归档并删除分段目录。
+"""
+import asyncio
+import bisect
+import gzip
+import json
+import os
+import shutil
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from ..core.config import settings
+from ..core.security import get_beijing_time
+
+
+class _Log:
+    """一个会话的日志：已落盘分段 [(起始序号, 条数)] 与内存中的最近事件"""
+
+    __slots__ = ("session_id", "segments", "next_seq", "tail", "unwritten", "waiter", "lock")
+
+    def __init__(self, session_id: int, segments: List[List[int]], next_seq: int):
+        self.session_id = session_id
+        self.segments = segments
+        self.next_seq = next_seq
+        # 最近事件（末尾 unwritten 条尚未落盘）
+        self.tail: Deque[Dict[str, Any]] = deque()
+        self.unwritten = 0
+        self.waiter: Optional[asyncio.Event] = None
+        self.lock = asyncio.Lock()
+
+    def wake(self) -> None:
+        if self.waiter is not None:
+            self.waiter.set()
+            self.waiter = None
+
+
+_logs: Dict[int, _Log] = {}
+_metrics: Dict[str, int] = {"appended": 0, "written": 0, "archived": 0, "tail_reads": 0, "disk_reads": 0}
+
+
+def _session_dir(session_id: int) -> str:
+    return os.path.join(settings.TRAVEL_LOG_DIR, str(session_id))
+
+
+def _archive_path(session_id: int) -> str:
+    return os.path.join(settings.TRAVEL_LOG_DIR, f"{session_id}.ndjson.gz")
+
+
+def _segment_path(directory: str, first_seq: int) -> str:
+    return os.path.join(directory, f"{first_seq:010d}.ndjson")
+
+
+def _encode(event: Dict[str, Any]) -> str:
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+
+
+def _scan_segments(directory: str) -> List[List[int]]:
+    """列出分段并统计条数；最后一个分段末尾的残缺行（写入中断）被截掉"""
+    if not os.path.isdir(directory):
+        return []
+    firsts = sorted(int(name.split(".")[0]) for name in os.listdir(directory) if name.endswith(".ndjson"))
+    segments = []
+    for index, first_seq in enumerate(firsts):
+        path = _segment_path(directory, first_seq)
+        if index < len(firsts) - 1:
+            segments.append([first_seq, settings.TRAVEL_LOG_SEGMENT_EVENTS])
+            continue
+        with open(path, "rb+") as f:
+            data = f.read()
+            complete = data.rfind(b"\n") + 1
+            if complete < len(data):
+                f.truncate(complete)
+        segments.append([first_seq, data[:complete].count(b"\n")])
+    return segments
+
+
+def _append_segments(directory: str, writes: List[Tuple[int, List[str]]]) -> None:
+    os.makedirs(directory, exist_ok=True)
+    for first_seq, lines in writes:
+        with open(_segment_path(directory, first_seq), "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+
+
+def _read_segments(directory: str, segments: List[List[int]], start: int, count: int) -> List[Dict[str, Any]]:
+    """从分段文件读取序号 [start, start + count) 的事件"""
+    events: List[Dict[str, Any]] = []
+    index = max(bisect.bisect_right([first for first, _ in segments], start) - 1, 0)
+    for first_seq, _ in segments[index:]:
+        if len(events) >= count:
+            break
+        with open(_segment_path(directory, first_seq), "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f):
+                if first_seq + line_no < start:
+                    continue
+                events.append(json.loads(line))
+                if len(events) >= count:
+                    break
+    return events
+
+
+def _read_closed(session_id: int, start: int, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+    """读取未载入内存的日志（已归档，或上次运行遗留的分段），返回 (事件, 下一个序号)"""
+    archive = _archive_path(session_id)
+    if os.path.exists(archive):
+        with gzip.open(archive, "rt", encoding="utf-8") as f:
+            lines = f.readlines()
+        return [json.loads(line) for line in lines[start:start + limit]], len(lines)
+    directory = _session_dir(session_id)
+    segments = _scan_segments(directory)
+    if not segments:
+        return [], 0
+    total = segments[-1][0] + segments[-1][1]
+    return _read_segments(directory, segments, start, limit), total
+
+
+def _compact(session_id: int) -> bool:
+    """把分段合并为 gzip 归档（先写临时文件再替换），成功后删除分段目录"""
+    directory = _session_dir(session_id)
+    segments = _scan_segments(directory)
+    if not segments:
+        return False
+    archive = _archive_path(session_id)
+    tmp = f"{archive}.tmp"
+    with gzip.open(tmp, "wb") as out:
+        for first_seq, _ in segments:
+            with open(_segment_path(directory, first_seq), "rb") as f:
+                shutil.copyfileobj(f, out)
+    os.replace(tmp, archive)
+    shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+def _remove(session_ids: List[int]) -> None:
+    for session_id in session_ids:
+        shutil.rmtree(_session_dir(session_id), ignore_errors=True)
+        try:
+            os.remove(_archive_path(session_id))
+        except FileNotFoundError:
+            pass
+
+
+def create(session_id: int) -> None:
+    """为新会话建立空日志"""
+    _logs[session_id] = _Log(session_id, [], 0)
+
+
+async def open_log(session_id: int) -> None:
+    """载入已有会话的日志（重启后续写）"""
+    if session_id in _logs:
+        return
+    segments = await asyncio.to_thread(_scan_segments, _session_dir(session_id))
+    next_seq = segments[-1][0] + segments[-1][1] if segments else 0
+    _logs[session_id] = _Log(session_id, segments, next_seq)
+
+
+def append(
+    session_id: int,
+    event_type: str,
+    map_id: Optional[int] = None,
+    poi_id: Optional[int] = None,
+    payload: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """追加一条事件（只写内存），返回带序号的事件；日志未载入时返回 None"""
+    log = _logs.get(session_id)
+    if log is None:
+        logger.warning(f"⚠️ 会话日志未载入，事件已丢弃: session_id={session_id}, event_type={event_type}")
+        return None
+    event = {
+        "seq": log.next_seq,
+        "created_at": get_beijing_time().isoformat(),
+        "event_type": event_type,
+        "map_id": map_id,
+        "poi_id": poi_id,
+        "payload": payload,
+    }
+    log.next_seq += 1
+    log.tail.append(event)
+    log.unwritten += 1
+    _metrics["appended"] += 1
+    log.wake()
+    return event
+
+
+async def _flush_log(log: _Log) -> int:
+    async with log.lock:
+        count = log.unwritten
+        if not count:
+            return 0
+        pending = list(log.tail)[len(log.tail) - count:]
+        # 按分段容量切分：先填满当前分段，再新建分段
+        segments = [list(segment) for segment in log.segments]
+        writes: List[Tuple[int, List[str]]] = []
+        position = 0
+        while position < count:
+            if not segments or segments[-1][1] >= settings.TRAVEL_LOG_SEGMENT_EVENTS:
+                segments.append([pending[position]["seq"], 0])
+            room = settings.TRAVEL_LOG_SEGMENT_EVENTS - segments[-1][1]
+            chunk = pending[position:position + room]
+            writes.append((segments[-1][0], [_encode(event) for event in chunk]))
+            segments[-1][1] += len(chunk)
+            position += len(chunk)
+        await asyncio.to_thread(_append_segments, _session_dir(log.session_id), writes)
+        log.segments = segments
+        log.unwritten -= count
+        while len(log.tail) > max(settings.TRAVEL_LOG_TAIL_EVENTS, log.unwritten):
+            log.tail.popleft()
+        _metrics["written"] += count
+        return count
+
+
+async def flush() -> int:
+    """把所有日志中未落盘的事件写入分段文件，返回写入条数"""
+    written = 0
+    for log in list(_logs.values()):
+        if log.unwritten:
+            written += await _flush_log(log)
+    return written
+
+
+async def read(session_id: int, after_seq: int = -1, limit: int = 500) -> Tuple[List[Dict[str, Any]], int]:
+    """读取序号大于 after_seq 的最多 limit 条事件，返回 (事件, 下一个序号)"""
+    start = max(after_seq + 1, 0)
+    log = _logs.get(session_id)
+    if log is None:
+        _metrics["disk_reads"] += 1
+        return await asyncio.to_thread(_read_closed, session_id, start, limit)
+    tail_first = log.next_seq - len(log.tail)
+    events: List[Dict[str, Any]] = []
+    if start < tail_first:
+        # 早于内存窗口的部分一定已经落盘
+        _metrics["disk_reads"] += 1
+        events = await asyncio.to_thread(
+            _read_segments, _session_dir(session_id), [list(segment) for segment in log.segments],
+            start, min(limit, tail_first - start)
+        )
+        start = tail_first
+    else:
+        _metrics["tail_reads"] += 1
+    # 读文件期间内存窗口可能已前移，此时只返回文件部分，客户端按 next_seq 继续读取
+    offset = start - (log.next_seq - len(log.tail))
+    if len(events) < limit and offset >= 0:
+        events.extend(list(log.tail)[offset:offset + limit - len(events)])
+    return events, log.next_seq
+
+
+async def wait(session_id: int, after_seq: int, timeout: float) -> None:
+    """等待序号大于 after_seq 的新事件（实时查看的长轮询），超时或日志关闭时返回"""
+    log = _logs.get(session_id)
+    if log is None or log.next_seq > after_seq + 1:
+        return
+    if log.waiter is None:
+        log.waiter = asyncio.Event()
+    waiter = log.waiter
+    try:
+        await asyncio.wait_for(waiter.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def archive(session_id: int) -> None:
+    """会话结算：落盘剩余事件，合并分段为归档，并从内存移除"""
+    log = _logs.get(session_id)
+    if log is not None:
+        await _flush_log(log)
+    if await asyncio.to_thread(_compact, session_id):
+        _metrics["archived"] += 1
+    log = _logs.pop(session_id, None)
+    if log is not None:
+        log.wake()
+
+
+async def drop(session_ids: List[int]) -> None:
+    """删除会话的全部日志文件（删除用户时调用）"""
+    for session_id in session_ids:
+        log = _logs.pop(session_id, None)
+        if log is not None:
+            log.wake()
+    if session_ids:
+        await asyncio.to_thread(_remove, session_ids)
+
+
+async def run_flush_worker():
+    """后台任务：定期批量落盘新事件"""
+    try:
+        while True:
+            await asyncio.sleep(settings.TRAVEL_LOG_FLUSH_INTERVAL)
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"⚠️ 会话事件日志落盘失败: {e}")
+    finally:
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"⚠️ 会话事件日志落盘失败: {e}")
+
+
+def get_metrics() -> Dict[str, int]:
+    return {
+        **_metrics,
+        "open_logs": len(_logs),
+        "unwritten": sum(log.unwritten for log in _logs.values()),
+    }
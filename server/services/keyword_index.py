@@ -0,0 +1,118 @@
+"""
+关键词倒排索引 - 向量记忆的 BM25 检索与标签/分类过滤
+中日韩文字按相邻二字切分（单字成词时保留单字），其余按字母数字连续串切分；
+索引随记忆写入/删除增量更新，标签与分类的过滤直接取倒排表求交集。
+"""
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+# BM25 参数
+K1 = 1.2
+B = 0.75
+
+# 假名、CJK 扩展A、CJK 统一汉字、谚文、兼容汉字
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN = re.compile(f"[{_CJK}]+|[a-z0-9]+")
+_CJK_RUN = re.compile(f"[{_CJK}]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(unicodedata.normalize("NFKC", text or "").lower()):
+        run = match.group()
+        if _CJK_RUN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+class KeywordIndex:
+    """单个存档的倒排索引（文档ID为记忆ID）"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_len: Dict[str, int] = {}
+        self.total_len = 0
+        self.tags: Dict[str, Set[str]] = defaultdict(set)
+        self.categories: Dict[str, Set[str]] = defaultdict(set)
+        self.doc_labels: Dict[str, tuple] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_terms)
+
+    def add(self, doc_id: str, content: str, tags: Iterable[str] = (), category: str = "other") -> None:
+        """写入或替换一条记忆（标签同时计入正文词项）"""
+        self.remove(doc_id)
+        tags = tuple(tags or ())
+        terms = Counter(tokenize(content))
+        for tag in tags:
+            terms.update(tokenize(tag))
+        for term, tf in terms.items():
+            self.postings[term][doc_id] = tf
+        self.doc_terms[doc_id] = terms
+        self.doc_len[doc_id] = sum(terms.values())
+        self.total_len += self.doc_len[doc_id]
+        for tag in tags:
+            self.tags[tag].add(doc_id)
+        self.categories[category].add(doc_id)
+        self.doc_labels[doc_id] = (tags, category)
+
+    def remove(self, doc_id: str) -> None:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self.postings[term]
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc_id)
+        tags, category = self.doc_labels.pop(doc_id)
+        for label, index in [(tag, self.tags) for tag in tags] + [(category, self.categories)]:
+            members = index[label]
+            members.discard(doc_id)
+            if not members:
+                del index[label]
+
+    def filter(self, tags: Optional[List[str]] = None, categories: Optional[List[str]] = None) -> Optional[Set[str]]:
+        """按标签（任一匹配）与分类（任一匹配）过滤，返回候选记忆ID；无过滤条件时返回 None"""
+        result: Optional[Set[str]] = None
+        for labels, index in ((tags, self.tags), (categories, self.categories)):
+            if not labels:
+                continue
+            matched = set().union(*(index.get(label, ()) for label in labels))
+            result = matched if result is None else result & matched
+        return result
+
+    def scores(self, query: str, only: Optional[Set[str]] = None) -> Dict[str, float]:
+        """返回所有命中文档的 BM25 分数（term-at-a-time 累加）"""
+        count = len(self.doc_terms)
+        if not count:
+            return {}
+        avg_len = self.total_len / count or 1.0
+        result: Dict[str, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = math.log(1 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            for doc_id, tf in posting.items():
+                if only is not None and doc_id not in only:
+                    continue
+                length = self.doc_len[doc_id]
+                result[doc_id] += idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+        return dict(result)
+
+
+def normalize(scores: Dict[str, float]) -> Dict[str, float]:
+    """按最高分缩放到 [0, 1]，便于与余弦相似度加权融合"""
+    top = max(scores.values(), default=0.0)
+    return {doc_id: score / top for doc_id, score in scores.items()} if top > 0 else {}
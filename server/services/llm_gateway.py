@@ -0,0 +1,424 @@
+"""
+AI 生成网关 - 以共享连接池转发 OpenAI / Claude / Gemini 兼容接口的流式请求
+每个上游主机一个长连接客户端（支持时使用 HTTP/2），每个提供商限制并发；
+首字节之前的失败会自动重试，三种上游流格式统一归一为同一种 SSE 事件。
+"""
+import asyncio
+import hashlib
+import ipaddress
+import json
+import socket
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpcore
+import httpx
+from loguru import logger
+
+from ..models import UserAPIConfig
+from ..core.config import settings
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# 可重试的上游状态码
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+RETRY_BACKOFF = 0.5
+MAX_RETRY_AFTER = 10.0
+# 上游出错时最多读取的错误正文字节数
+ERROR_BODY_LIMIT = 2000
+
+
+class GatewayError(Exception):
+    """网关错误（配置无效或上游失败）"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+# === 提供商适配 ===
+class ProviderAdapter:
+    """把统一的消息格式转换为上游请求，并从上游 SSE 事件中提取文本增量"""
+    name = "openai"
+    default_url = "https://api.openai.com"
+
+    def build(self, api: Dict[str, Any], messages: List[Dict[str, str]], temperature: float, max_tokens: int):
+        url = f"{self.base_url(api)}/v1/chat/completions"
+        headers = {"Authorization": f"Bearer {api.get('apiKey', '')}"}
+        body = {
+            "model": api.get("model"),
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        return url, headers, body
+
+    def base_url(self, api: Dict[str, Any]) -> str:
+        return (api.get("url") or self.default_url).rstrip("/")
+
+    def parse(self, data: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+        """返回 (文本增量, 结束原因)"""
+        choice = (data.get("choices") or [{}])[0]
+        return (choice.get("delta") or {}).get("content") or "", choice.get("finish_reason")
+
+
+class ClaudeAdapter(ProviderAdapter):
+    name = "claude"
+    default_url = "https://api.anthropic.com"
+
+    def build(self, api, messages, temperature, max_tokens):
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        url = f"{self.base_url(api)}/v1/messages"
+        headers = {"x-api-key": api.get("apiKey", ""), "anthropic-version": "2023-06-01"}
+        body = {
+            "model": api.get("model"),
+            "max_tokens": max_tokens,
+            "messages": [m for m in messages if m["role"] != "system"],
+            "temperature": temperature,
+            "stream": True,
+        }
+        if system:
+            body["system"] = system
+        return url, headers, body
+
+    def parse(self, data):
+        kind = data.get("type")
+        if kind == "content_block_delta":
+            return (data.get("delta") or {}).get("text") or "", None
+        if kind == "message_delta":
+            return "", (data.get("delta") or {}).get("stop_reason")
+        if kind == "error":
+            raise GatewayError((data.get("error") or {}).get("message") or "上游返回错误")
+        return "", None
+
+
+class GeminiAdapter(ProviderAdapter):
+    name = "gemini"
+    default_url = "https://generativelanguage.googleapis.com"
+
+    def build(self, api, messages, temperature, max_tokens):
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        url = f"{self.base_url(api)}/v1beta/models/{api.get('model')}:streamGenerateContent?alt=sse"
+        headers = {"x-goog-api-key": api.get("apiKey", "")}
+        body = {
+            "contents": [
+                {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+                for m in messages if m["role"] != "system"
+            ],
+            "generationConfig": {"temperature": temperature, "maxOutputTokens": max_tokens},
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": system}]}
+        return url, headers, body
+
+    def parse(self, data):
+        candidate = (data.get("candidates") or [{}])[0]
+        parts = (candidate.get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts), candidate.get("finishReason")
+
+
+ADAPTERS: Dict[str, ProviderAdapter] = {
+    "openai": ProviderAdapter(),
+    "claude": ClaudeAdapter(),
+    "gemini": GeminiAdapter(),
+}
+
+
+def get_adapter(provider: str) -> ProviderAdapter:
+    """deepseek / custom 等均按 OpenAI 兼容格式处理"""
+    return ADAPTERS.get(provider, ADAPTERS["openai"])
+
+
+async def resolve_user_api(user_id: int, api_id: Optional[str] = None, usage: Optional[str] = None) -> Dict[str, Any]:
+    """从用户保存的 API 配置中取出本次使用的条目：优先 api_id，其次按功能分配，最后为 default"""
+    config = await UserAPIConfig.filter(user_id=user_id).first().values_list("config", flat=True)
+    if not config:
+        raise GatewayError("尚未配置 API", status_code=400)
+    if api_id is None and usage:
+        assignment = next((a for a in config.get("apiAssignments") or [] if a.get("type") == usage), None)
+        api_id = assignment.get("apiId") if assignment else None
+    api_id = api_id or "default"
+    api = next((c for c in config.get("apiConfigs") or [] if c.get("id") == api_id), None)
+    if not api or api.get("enabled") is False:
+        raise GatewayError("API 配置不存在或未启用", status_code=400)
+    if not api.get("model"):
+        raise GatewayError("API 配置缺少模型名称", status_code=400)
+    return api
+
+
+def request_hash(api: Dict[str, Any], messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """规范化请求哈希：(提供商, 上游地址, 模型, 消息, 采样参数)，不含密钥"""
+    adapter = get_adapter(api.get("provider") or "openai")
+    canonical = json.dumps({
+        "provider": adapter.name,
+        "url": adapter.base_url(api),
+        "model": api.get("model"),
+        "messages": [[m["role"], m["content"]] for m in messages],
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def key_fingerprint(api: Dict[str, Any]) -> str:
+    """密钥指纹（截断的 sha256），用于按凭据区分进行中的调用，不泄露密钥本身"""
+    return hashlib.sha256(str(api.get("apiKey") or "").encode("utf-8")).hexdigest()[:16]
+
+
+# === 连接池与并发控制 ===
+_clients: Dict[str, httpx.AsyncClient] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_metrics: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+
+
+def _is_internal(address: str) -> bool:
+    """内网、本机、链路本地、未指定等非公网地址"""
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return not ip.is_global or ip.is_multicast
+
+
+class _PublicNetworkBackend(httpcore.AsyncNetworkBackend):
+    """
+    建立连接时解析主机名，任一解析结果为内网地址即拒绝，并直接连接校验过的地址；
+    可拦截十进制/十六进制等非常规 IP 写法与解析到内网的域名，也避免校验后 DNS 再次解析到其他地址。
+    """
+
+    def __init__(self):
+        self._backend = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        try:
+            infos = await asyncio.wait_for(
+                asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM), timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise httpcore.ConnectError(f"无法解析 {host}: {e}")
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if not addresses or any(_is_internal(address) for address in addresses):
+            raise GatewayError("不允许转发到内网地址", status_code=400)
+        error: Optional[Exception] = None
+        for address in addresses:
+            try:
+                return await self._backend.connect_tcp(address, port, timeout, local_address, socket_options)
+            except (httpcore.ConnectError, httpcore.ConnectTimeout) as e:
+                error = e
+        raise error
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise GatewayError("不允许转发到内网地址", status_code=400)
+
+    async def sleep(self, seconds: float) -> None:
+        await self._backend.sleep(seconds)
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise GatewayError("API 地址无效", status_code=400)
+    if not settings.AI_GATEWAY_ALLOW_PRIVATE_HOSTS:
+        # 字面 IP 与 localhost 提前拒绝；域名及其他写法在连接时由 _PublicNetworkBackend 校验解析结果
+        host = parts.hostname
+        try:
+            private = _is_internal(host)
+        except ValueError:
+            private = host == "localhost" or host.endswith(".localhost")
+        if private:
+            raise GatewayError("不允许转发到内网地址", status_code=400)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def get_client(url: str) -> httpx.AsyncClient:
+    """获取上游主机对应的共享客户端"""
+    origin = _origin(url)
+    client = _clients.get(origin)
+    if client is None or client.is_closed:
+        options: Dict[str, Any] = {
+            "http2": settings.AI_GATEWAY_HTTP2 and HTTP2_AVAILABLE,
+            "limits": httpx.Limits(
+                max_connections=settings.AI_GATEWAY_MAX_CONNECTIONS_PER_HOST,
+                max_keepalive_connections=settings.AI_GATEWAY_MAX_CONNECTIONS_PER_HOST,
+                keepalive_expiry=60.0,
+            ),
+        }
+        if not settings.AI_GATEWAY_ALLOW_PRIVATE_HOSTS:
+            # 直连并在连接时校验地址（不经环境变量中的代理，否则实际目标由代理解析，无法校验）
+            transport = httpx.AsyncHTTPTransport(**options)
+            # httpx 0.26 的传输层不接受 network_backend 参数，在连接池建立连接前替换
+            transport._pool._network_backend = _PublicNetworkBackend()
+            options = {"transport": transport}
+        client = httpx.AsyncClient(
+            **options,
+            timeout=httpx.Timeout(
+                settings.AI_GATEWAY_READ_TIMEOUT,
+                connect=settings.AI_GATEWAY_CONNECT_TIMEOUT,
+                pool=settings.AI_GATEWAY_READ_TIMEOUT,
+            ),
+        )
+        _clients[origin] = client
+    return client
+
+
+def _semaphore(provider: str) -> asyncio.Semaphore:
+    if provider not in _semaphores:
+        _semaphores[provider] = asyncio.Semaphore(settings.AI_GATEWAY_MAX_CONCURRENCY)
+    return _semaphores[provider]
+
+
+async def close() -> None:
+    """关闭全部上游连接"""
+    clients = list(_clients.values())
+    _clients.clear()
+    await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+
+def get_metrics() -> Dict[str, Dict[str, float]]:
+    """各提供商的请求计数、重试、错误与平均首字节耗时"""
+    result = {}
+    for provider, values in _metrics.items():
+        item = dict(values)
+        first_byte_ms = item.pop("first_byte_ms_total", 0)
+        if item.get("first_byte_count"):
+            item["first_byte_ms_avg"] = round(first_byte_ms / item["first_byte_count"], 1)
+        result[provider] = item
+    return result
+
+
+# === 流式转发 ===
+async def _iter_sse(response: httpx.Response) -> AsyncIterator[str]:
+    """逐个产出上游 SSE 事件的 data 内容"""
+    data_lines: List[str] = []
+    async for line in response.aiter_lines():
+        if not line:
+            if data_lines:
+                yield "\n".join(data_lines)
+                data_lines = []
+            continue
+        if line.startswith("data:"):
+            data_lines.append(line[5:].lstrip())
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+def _retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    if response is not None:
+        try:
+            return min(float(response.headers.get("retry-after", "")), MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return RETRY_BACKOFF * (2 ** attempt)
+
+
+async def _open_stream(client: httpx.AsyncClient, request: httpx.Request, provider: str) -> httpx.Response:
+    """发送请求直到拿到 2xx 响应头；首字节之前的连接错误与可重试状态码会退避重试"""
+    metrics = _metrics[provider]
+    for attempt in range(settings.AI_GATEWAY_MAX_RETRIES + 1):
+        last_attempt = attempt == settings.AI_GATEWAY_MAX_RETRIES
+        response = None
+        try:
+            response = await client.send(request, stream=True)
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError) as e:
+            if last_attempt:
+                raise GatewayError(f"无法连接上游: {e}")
+        else:
+            if response.status_code < 400:
+                return response
+            if last_attempt or response.status_code not in RETRY_STATUSES:
+                body = (await response.aread())[:ERROR_BODY_LIMIT].decode("utf-8", "replace")
+                await response.aclose()
+                raise GatewayError(f"上游错误 {response.status_code}: {body}")
+            await response.aclose()
+        metrics["retries"] += 1
+        await asyncio.sleep(_retry_delay(response, attempt))
+    raise GatewayError("上游请求失败")
+
+
+async def generate(
+    api: Dict[str, Any],
+    messages: List[Dict[str, str]],
+    temperature: float,
+    max_tokens: int
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    向上游发起流式生成，逐个产出归一化事件：
+    {"type": "delta", "text": ...}，最后一个为 {"type": "done", "finish_reason": ...}。
+    消费方停止迭代（如客户端断开）时上游连接随之关闭。
+    """
+    provider = api.get("provider") or "openai"
+    adapter = get_adapter(provider)
+    url, headers, body = adapter.build(api, messages, temperature, max_tokens)
+    headers["Accept"] = "text/event-stream"
+    client = get_client(url)
+    request = client.build_request("POST", url, headers=headers, json=body)
+
+    metrics = _metrics[adapter.name]
+    metrics["requests"] += 1
+    started = time.monotonic()
+    finish_reason = None
+    async with _semaphore(adapter.name):
+        metrics["active"] += 1
+        try:
+            response = await _open_stream(client, request, adapter.name)
+            try:
+                first = True
+                async for data in _iter_sse(response):
+                    if data == "[DONE]":
+                        break
+                    try:
+                        text, reason = adapter.parse(json.loads(data))
+                    except ValueError:
+                        continue
+                    finish_reason = reason or finish_reason
+                    if text:
+                        if first:
+                            first = False
+                            metrics["first_byte_ms_total"] += (time.monotonic() - started) * 1000
+                            metrics["first_byte_count"] += 1
+                        yield {"type": "delta", "text": text}
+            finally:
+                await response.aclose()
+        except GatewayError:
+            metrics["errors"] += 1
+            raise
+        except httpx.HTTPError as e:
+            metrics["errors"] += 1
+            logger.warning(f"⚠️ AI 网关上游中断 ({adapter.name}): {e}")
+            raise GatewayError(f"上游连接中断: {e}")
+        finally:
+            metrics["active"] -= 1
+    yield {"type": "done", "finish_reason": finish_reason}
+
+
+async def post_json(url: str, headers: Dict[str, str], body: Dict[str, Any], provider: str) -> Dict[str, Any]:
+    """非流式请求（如 Embedding）：共用连接池与重试策略，返回解析后的 JSON"""
+    client = get_client(url)
+    request = client.build_request("POST", url, headers=headers, json=body)
+    metrics = _metrics[provider]
+    metrics["requests"] += 1
+    try:
+        response = await _open_stream(client, request, provider)
+        try:
+            return json.loads(await response.aread())
+        finally:
+            await response.aclose()
+    except GatewayError:
+        metrics["errors"] += 1
+        raise
+    except (httpx.HTTPError, ValueError) as e:
+        metrics["errors"] += 1
+        raise GatewayError(f"上游响应无效: {e}")
+
+
+def sse_event(event: Dict[str, Any]) -> bytes:
+    """编码为下发给客户端的 SSE 帧"""
+    return f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode("utf-8")
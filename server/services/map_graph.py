@@ -0,0 +1,280 @@
+"""
+世界地图图结构 - 把 WorldInstance.instance_data 中的地图编译为 CSR 邻接数组并按实例缓存
+移动校验查边集合为 O(1)；路径与下一步查询使用按起点惰性计算并缓存的 BFS（步数）/ Dijkstra（路程）表。
+主人编辑地图时按实例失效；缓存未命中时从数据库读取并记录版本（instance_data.revision）。
+"""
+import heapq
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Tuple
+
+from ..models import WorldInstance
+from ..core.config import settings
+
+UNREACHABLE = float("inf")
+
+
+class MapGraphError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+
+class MapGraph:
+    """单张地图：地点按ID排序编号，offsets/targets 为 CSR 邻接，edge_keys 为 (起点编号 * n + 终点编号) 集合"""
+
+    __slots__ = (
+        "map_id", "map_key", "version", "poi_ids", "index", "offsets", "targets", "costs",
+        "edge_keys", "response", "_hops", "_distances",
+    )
+
+    def __init__(self, map_id: int, map_key: str, version: str, pois: List[Dict[str, Any]], edges: List[Dict[str, Any]]):
+        self.map_id = map_id
+        self.map_key = map_key
+        self.version = version
+        self.poi_ids = array("q", sorted(poi["id"] for poi in pois))
+        self.index: Dict[int, int] = {poi_id: position for position, poi_id in enumerate(self.poi_ids)}
+        n = len(self.poi_ids)
+
+        adjacency: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+        for edge in edges:
+            source, target = self.index[edge["from_poi_id"]], self.index[edge["to_poi_id"]]
+            adjacency[source].append((target, edge["travel_cost"]))
+            if not edge["one_way"]:
+                adjacency[target].append((source, edge["travel_cost"]))
+        self.offsets = array("l", [0])
+        self.targets = array("l")
+        self.costs = array("d")
+        self.edge_keys = set()
+        for source, neighbours in enumerate(adjacency):
+            for target, cost in neighbours:
+                self.targets.append(target)
+                self.costs.append(cost)
+                self.edge_keys.add(source * n + target)
+            self.offsets.append(len(self.targets))
+
+        # 接口返回的图结构（编译时生成一次）
+        self.response = {"map_id": map_id, "map_key": map_key, "pois": pois, "edges": edges}
+        # 起点编号 -> (距离表, 前驱表)
+        self._hops: Dict[int, Tuple[array, array]] = {}
+        self._distances: Dict[int, Tuple[array, array]] = {}
+
+    def __len__(self) -> int:
+        return len(self.poi_ids)
+
+    def has_poi(self, poi_id: int) -> bool:
+        return poi_id in self.index
+
+    def can_move(self, from_poi_id: int, to_poi_id: int) -> bool:
+        """是否存在从 from 直达 to 的边"""
+        source, target = self.index.get(from_poi_id), self.index.get(to_poi_id)
+        if source is None or target is None:
+            return False
+        return source * len(self.poi_ids) + target in self.edge_keys
+
+    def neighbours(self, poi_id: int) -> List[int]:
+        source = self.index[poi_id]
+        return [self.poi_ids[target] for target in self.targets[self.offsets[source]:self.offsets[source + 1]]]
+
+    def _bfs(self, source: int) -> Tuple[array, array]:
+        table = self._hops.get(source)
+        if table is None:
+            n = len(self.poi_ids)
+            distance = array("d", [UNREACHABLE]) * n
+            previous = array("l", [-1]) * n
+            distance[source] = 0
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for position in range(self.offsets[node], self.offsets[node + 1]):
+                    target = self.targets[position]
+                    if distance[target] == UNREACHABLE:
+                        distance[target] = distance[node] + 1
+                        previous[target] = node
+                        queue.append(target)
+            table = self._hops[source] = (distance, previous)
+        return table
+
+    def _dijkstra(self, source: int) -> Tuple[array, array]:
+        table = self._distances.get(source)
+        if table is None:
+            n = len(self.poi_ids)
+            distance = array("d", [UNREACHABLE]) * n
+            previous = array("l", [-1]) * n
+            distance[source] = 0.0
+            heap = [(0.0, source)]
+            while heap:
+                current, node = heapq.heappop(heap)
+                if current > distance[node]:
+                    continue
+                for position in range(self.offsets[node], self.offsets[node + 1]):
+                    target = self.targets[position]
+                    candidate = current + self.costs[position]
+                    if candidate < distance[target]:
+                        distance[target] = candidate
+                        previous[target] = node
+                        heapq.heappush(heap, (candidate, target))
+            table = self._distances[source] = (distance, previous)
+        return table
+
+    def path(self, from_poi_id: int, to_poi_id: int, weighted: bool = True) -> Tuple[float, List[int]]:
+        """最短路径 (距离, 途经地点ID)；weighted 为 False 时按步数计算。不可达时返回 (inf, [])"""
+        if not self.has_poi(from_poi_id) or not self.has_poi(to_poi_id):
+            raise MapGraphError("地点不存在", 404)
+        source, target = self.index[from_poi_id], self.index[to_poi_id]
+        distance, previous = self._dijkstra(source) if weighted else self._bfs(source)
+        if distance[target] == UNREACHABLE:
+            return UNREACHABLE, []
+        nodes = [target]
+        while nodes[-1] != source:
+            nodes.append(previous[nodes[-1]])
+        return distance[target], [self.poi_ids[node] for node in reversed(nodes)]
+
+
+class _Instance:
+    """一个世界实例的全部地图（同一版本）"""
+
+    __slots__ = ("version", "maps")
+
+    def __init__(self, version: str, maps: Dict[int, MapGraph]):
+        self.version = version
+        self.maps = maps
+
+
+_cache: "OrderedDict[int, _Instance]" = OrderedDict()
+# 世界实例ID -> 修改代数（每次失效加一）
+_generations: Dict[int, int] = {}
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0, "reloads": 0, "compiled_maps": 0, "invalidated": 0}
+
+
+def _normalize_pois(raw: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    pois, seen = [], set()
+    for poi in raw or []:
+        poi_id = int(poi["id"])
+        if poi_id in seen:
+            raise MapGraphError(f"地点ID重复: {poi_id}")
+        seen.add(poi_id)
+        pois.append({
+            "id": poi_id,
+            "poi_key": str(poi.get("poi_key") or poi_id),
+            "x": poi.get("x", 0),
+            "y": poi.get("y", 0),
+            "type": poi.get("type", "normal"),
+            "tags": poi.get("tags"),
+            "state": poi.get("state"),
+        })
+    return pois
+
+
+def _normalize_edges(raw: List[Dict[str, Any]], poi_ids: set) -> List[Dict[str, Any]]:
+    edges = []
+    for position, edge in enumerate(raw or []):
+        source, target = int(edge["from_poi_id"]), int(edge["to_poi_id"])
+        if source not in poi_ids or target not in poi_ids:
+            raise MapGraphError(f"道路连接了不存在的地点: {source} -> {target}")
+        cost = float(edge.get("travel_cost", 1))
+        if cost < 0:
+            raise MapGraphError("道路消耗不能为负数")
+        edges.append({
+            "id": int(edge.get("id", position + 1)),
+            "from_poi_id": source,
+            "to_poi_id": target,
+            "edge_type": edge.get("edge_type", "road"),
+            "travel_cost": cost,
+            "risk": edge.get("risk", 0),
+            "one_way": bool(edge.get("one_way", False)),
+        })
+    return edges
+
+
+def compile_map(raw: Dict[str, Any], version: str = "") -> MapGraph:
+    """编译一张地图（结构不合法时抛出 MapGraphError）"""
+    try:
+        pois = _normalize_pois(raw.get("pois"))
+        edges = _normalize_edges(raw.get("edges"), {poi["id"] for poi in pois})
+        map_id = int(raw["map_id"])
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise MapGraphError(f"地图数据格式错误: {e}")
+    _metrics["compiled_maps"] += 1
+    return MapGraph(map_id, str(raw.get("map_key") or map_id), version, pois, edges)
+
+
+def _compile_instance(instance_data: Dict[str, Any], version: str) -> _Instance:
+    maps = {}
+    for raw in instance_data.get("maps") or []:
+        graph = compile_map(raw, version)
+        maps[graph.map_id] = graph
+    return _Instance(version, maps)
+
+
+def validate(instance_data: Dict[str, Any]) -> None:
+    """写入前校验世界数据中的全部地图与入口位置（不合法时抛出 MapGraphError，不计入缓存）"""
+    maps = instance_data.get("maps") or []
+    if not isinstance(maps, list):
+        raise MapGraphError("地图数据格式错误: maps 必须是数组")
+    graphs: Dict[int, MapGraph] = {}
+    for raw in maps:
+        graph = compile_map(raw)
+        if graph.map_id in graphs:
+            raise MapGraphError(f"地图ID重复: {graph.map_id}")
+        graphs[graph.map_id] = graph
+    entry = instance_data.get("entry") or {}
+    if not isinstance(entry, dict):
+        raise MapGraphError("入口位置格式错误")
+    if entry.get("map_id") is not None and entry.get("poi_id") is not None:
+        try:
+            graph = graphs.get(int(entry["map_id"]))
+            poi_id = int(entry["poi_id"])
+        except (TypeError, ValueError):
+            raise MapGraphError("入口位置格式错误")
+        if graph is None or not graph.has_poi(poi_id):
+            raise MapGraphError("入口位置不存在")
+
+
+async def _load(world_instance_id: int) -> _Instance:
+    """读取并编译；读取期间实例被修改（代数变化）时重读，不把旧版本放入缓存"""
+    while True:
+        generation = _generations.get(world_instance_id, 0)
+        rows = await WorldInstance.filter(id=world_instance_id).values_list("instance_data", flat=True)
+        if not rows:
+            raise MapGraphError("世界不存在", 404)
+        if _generations.get(world_instance_id, 0) != generation:
+            _metrics["reloads"] += 1
+            continue
+        instance_data = rows[0] or {}
+        instance = _compile_instance(instance_data, str(instance_data.get("revision", 0)))
+        _cache[world_instance_id] = instance
+        while len(_cache) > settings.MAP_GRAPH_CACHE_SIZE:
+            _cache.popitem(last=False)
+        return instance
+
+
+async def get_graph(world_instance_id: int, map_id: int) -> MapGraph:
+    """取编译后的地图（命中缓存时不访问数据库）"""
+    instance = _cache.get(world_instance_id)
+    if instance is not None:
+        _cache.move_to_end(world_instance_id)
+        _metrics["hits"] += 1
+    else:
+        _metrics["misses"] += 1
+        instance = await _load(world_instance_id)
+    graph = instance.maps.get(map_id)
+    if graph is None:
+        raise MapGraphError("地图不存在", 404)
+    return graph
+
+
+def invalidate(world_instance_id: int) -> None:
+    """世界实例的地图被修改后调用（实例不在缓存中时也推进代数，使进行中的读取作废）"""
+    _generations[world_instance_id] = _generations.get(world_instance_id, 0) + 1
+    if _cache.pop(world_instance_id, None) is not None:
+        _metrics["invalidated"] += 1
+
+
+def get_metrics() -> Dict[str, int]:
+    return {
+        **_metrics,
+        "cached_instances": len(_cache),
+        "cached_maps": sum(len(instance.maps) for instance in _cache.values()),
+    }
@@ -0,0 +1,300 @@
+"""
+在线状态 - 心跳只更新进程内存，由哈希时间轮按到期刻度淘汰超时用户
+最后在线时间由后台任务定期批量写入 user_presence 表（用于显示“最后在线”），心跳本身不写库。
+在线状态保存在单个进程内，多进程部署时需把心跳路由到同一实例。
+"""
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from ..models import User, UserPresence
+from ..core.config import settings
+from ..core.security import get_beijing_time
+from . import user_cache
+
+
+class TimingWheel:
+    """
+    哈希时间轮：按到期刻度把键放入对应的桶，推进一格只处理一个桶。
+    重新调度只是把键从旧桶移到新桶，均为 O(1)。
+    """
+
+    def __init__(self, tick: float, span: float):
+        self.tick = tick
+        self.buckets: List[Set[Hashable]] = [set() for _ in range(math.ceil(span / tick) + 2)]
+        self.slot_of: Dict[Hashable, int] = {}
+        self.deadline: Dict[Hashable, float] = {}
+        self.started = time.monotonic()
+        self.cursor = 0
+
+    def _tick_at(self, moment: float) -> int:
+        return int((moment - self.started) / self.tick)
+
+    def schedule(self, key: Hashable, delay: float) -> None:
+        now = time.monotonic()
+        target = self._tick_at(now + delay) + 1
+        slot = target % len(self.buckets)
+        previous = self.slot_of.get(key)
+        if previous != slot:
+            if previous is not None:
+                self.buckets[previous].discard(key)
+            self.buckets[slot].add(key)
+            self.slot_of[key] = slot
+        self.deadline[key] = now + delay
+
+    def cancel(self, key: Hashable) -> None:
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            self.buckets[slot].discard(key)
+            self.deadline.pop(key, None)
+
+    def advance(self) -> List[Hashable]:
+        """推进到当前刻度，返回已到期的键"""
+        now = time.monotonic()
+        current = self._tick_at(now)
+        expired: List[Hashable] = []
+        while self.cursor < current:
+            self.cursor += 1
+            bucket = self.buckets[self.cursor % len(self.buckets)]
+            if not bucket:
+                continue
+            due = list(bucket)
+            bucket.clear()
+            for key in due:
+                del self.slot_of[key]
+                remaining = self.deadline[key] - now
+                if remaining > 0:
+                    # 推进落后于时钟时可能提前绕到此桶，未到期的重新放回
+                    self.schedule(key, remaining)
+                else:
+                    del self.deadline[key]
+                    expired.append(key)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self.slot_of)
+
+
+_wheel: Optional[TimingWheel] = None
+# 在线用户 -> 最后心跳时间
+_online: Dict[int, datetime] = {}
+# 待落库的最后在线时间
+_dirty: Dict[int, datetime] = {}
+# 用户名缓存（心跳响应与按用户名查询使用）
+_names: Dict[int, str] = {}
+_ids: Dict[str, int] = {}
+_metrics: Dict[str, int] = {"heartbeats": 0, "came_online": 0, "expired": 0, "persisted": 0}
+# 上线/下线回调（推送通道在导入时注册）
+_listeners: List[Callable[[int, bool, datetime], None]] = []
+
+
+def _get_wheel() -> TimingWheel:
+    global _wheel
+    if _wheel is None:
+        _wheel = TimingWheel(settings.PRESENCE_TICK, settings.PRESENCE_TIMEOUT)
+    return _wheel
+
+
+def _invalidate_users(user_ids: Set[int]) -> None:
+    for user_id in user_ids:
+        name = _names.pop(user_id, None)
+        if name is not None and _ids.get(name) == user_id:
+            del _ids[name]
+
+
+user_cache.register_invalidator(_invalidate_users)
+
+
+def register_listener(callback: Callable[[int, bool, datetime], None]) -> None:
+    """注册上线/下线回调 callback(user_id, is_online, last_seen)；普通心跳不触发"""
+    _listeners.append(callback)
+
+
+def _notify(user_id: int, online: bool, seen: datetime) -> None:
+    for callback in _listeners:
+        try:
+            callback(user_id, online, seen)
+        except Exception as e:
+            logger.error(f"⚠️ 在线状态回调失败: {e}")
+
+
+async def get_user_name(user_id: int) -> Optional[str]:
+    name = _names.get(user_id)
+    if name is None:
+        name = await User.filter(id=user_id).first().values_list("user_name", flat=True)
+        if name is not None:
+            _names[user_id] = name
+            _ids[name] = user_id
+    return name
+
+
+async def get_user_id(user_name: str) -> Optional[int]:
+    user_id = _ids.get(user_name)
+    if user_id is None:
+        user_id = await User.filter(user_name=user_name).first().values_list("id", flat=True)
+        if user_id is not None:
+            _names[user_id] = user_name
+            _ids[user_name] = user_id
+    return user_id
+
+
+async def get_user_ids(user_names: List[str]) -> Dict[str, int]:
+    """批量按用户名取ID（未命中缓存的一次查询补齐），不存在的用户名不出现在结果中"""
+    result = {name: _ids[name] for name in user_names if name in _ids}
+    missing = [name for name in user_names if name not in result]
+    if missing:
+        for user_id, name in await User.filter(user_name__in=missing).values_list("id", "user_name"):
+            _names[user_id] = name
+            _ids[name] = user_id
+            result[name] = user_id
+    return result
+
+
+async def get_user_names(user_ids: List[int]) -> Dict[int, str]:
+    """批量按ID取用户名，不存在的用户不出现在结果中"""
+    result = {user_id: _names[user_id] for user_id in user_ids if user_id in _names}
+    missing = [user_id for user_id in user_ids if user_id not in result]
+    if missing:
+        for user_id, name in await User.filter(id__in=missing).values_list("id", "user_name"):
+            _names[user_id] = name
+            _ids[name] = user_id
+            result[user_id] = name
+    return result
+
+
+def heartbeat(user_id: int) -> datetime:
+    """记录一次心跳（仅内存操作）"""
+    now = get_beijing_time()
+    came_online = user_id not in _online
+    _online[user_id] = now
+    _dirty[user_id] = now
+    _get_wheel().schedule(user_id, settings.PRESENCE_TIMEOUT)
+    _metrics["heartbeats"] += 1
+    if came_online:
+        _metrics["came_online"] += 1
+        _notify(user_id, True, now)
+    return now
+
+
+def is_online(user_id: int) -> bool:
+    return user_id in _online
+
+
+def online_count() -> int:
+    return len(_online)
+
+
+async def last_seen(user_id: int) -> Optional[datetime]:
+    """最后心跳时间：优先取内存，其次取已落库的快照"""
+    seen = _online.get(user_id) or _dirty.get(user_id)
+    if seen is None:
+        seen = await UserPresence.filter(user_id=user_id).first().values_list("last_seen_at", flat=True)
+    return seen
+
+
+def status(user_id: int, persisted: Optional[datetime] = None) -> Tuple[bool, Optional[datetime]]:
+    """(是否在线, 最后心跳时间)，只读内存；persisted 为调用方已查到的落库值"""
+    return user_id in _online, _online.get(user_id) or _dirty.get(user_id) or persisted
+
+
+async def statuses(user_ids: List[int]) -> Dict[int, Tuple[bool, Optional[datetime]]]:
+    """批量查询在线状态：内存中有记录的直接返回，其余一次查询补齐落库的最后在线时间"""
+    result = {user_id: status(user_id) for user_id in user_ids}
+    missing = [user_id for user_id, (_, seen) in result.items() if seen is None]
+    if missing:
+        for user_id, seen in await UserPresence.filter(user_id__in=missing).values_list("user_id", "last_seen_at"):
+            result[user_id] = (False, seen)
+    return result
+
+
+def forget(user_id: int) -> None:
+    """移除用户的在线状态与待落库记录（删除用户时调用）"""
+    seen = _online.pop(user_id, None)
+    _dirty.pop(user_id, None)
+    _get_wheel().cancel(user_id)
+    _invalidate_users({user_id})
+    if seen is not None:
+        _notify(user_id, False, seen)
+
+
+def expire() -> List[int]:
+    """淘汰超时未心跳的用户，返回本次下线的用户ID"""
+    expired = _get_wheel().advance()
+    for user_id in expired:
+        seen = _online.pop(user_id, None)
+        if seen is not None:
+            _notify(user_id, False, seen)
+    _metrics["expired"] += len(expired)
+    return expired
+
+
+async def flush() -> int:
+    """把最后在线时间批量写入数据库，返回写入条数"""
+    if not _dirty:
+        return 0
+    batch = dict(_dirty)
+    _dirty.clear()
+    try:
+        existing = {
+            record.user_id: record
+            for record in await UserPresence.filter(user_id__in=list(batch))
+        }
+        to_update, to_create = [], []
+        for user_id, seen in batch.items():
+            record = existing.get(user_id)
+            if record:
+                record.last_seen_at = seen
+                to_update.append(record)
+            else:
+                to_create.append(UserPresence(user_id=user_id, last_seen_at=seen))
+        if to_update:
+            await UserPresence.bulk_update(to_update, fields=["last_seen_at"])
+    except Exception:
+        # 未写入的放回（期间若有新心跳则以新值为准）
+        for user_id, seen in batch.items():
+            _dirty.setdefault(user_id, seen)
+        raise
+    if to_create:
+        try:
+            await UserPresence.bulk_create(to_create)
+        except Exception as e:
+            # 读取之后用户被删除等情况：逐条写入，失败的丢弃而不是整批反复重试
+            logger.warning(f"⚠️ 在线状态批量写入失败，改为逐条写入: {e}")
+            for record in to_create:
+                try:
+                    await record.save()
+                except Exception:
+                    del batch[record.user_id]
+    _metrics["persisted"] += len(batch)
+    return len(batch)
+
+
+async def run_expiry_worker():
+    """后台任务：按刻度推进时间轮"""
+    while True:
+        await asyncio.sleep(settings.PRESENCE_TICK)
+        expire()
+
+
+async def run_flush_worker():
+    """后台任务：定期批量落库最后在线时间"""
+    try:
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_INTERVAL)
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"⚠️ 最后在线时间落库失败: {e}")
+    finally:
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"⚠️ 最后在线时间落库失败: {e}")
+
+
+def get_metrics() -> Dict[str, int]:
+    return {**_metrics, "online": len(_online), "pending_writes": len(_dirty)}
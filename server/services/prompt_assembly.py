@@ -0,0 +1,139 @@
+"""
+系统提示词组装 - 按模板拼接默认提示词与用户覆盖，并缓存结果与 token 数
+缓存键为 (默认提示词版本, 模板, 该模板涉及条目的用户覆盖指纹)：
+未覆盖这些条目的用户共享同一份结果；生成网关可用内容哈希引用组装结果。
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from ..models import UserPromptConfig
+from ..core.config import settings
+from . import prompt_defaults, prompt_overrides, tokens, user_cache
+
+
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+_CORE_SECTIONS = ["coreOutputRules", "businessRules", "dataDefinitions", "textFormatRules", "worldStandards"]
+
+# 模板ID -> 按顺序拼接的提示词键（与前端 promptAssembler / 分步生成的拼接顺序一致）
+TEMPLATES: Dict[str, List[str]] = {
+    "core": _CORE_SECTIONS,
+    "core_actions": _CORE_SECTIONS + ["actionOptions"],
+    "core_events": _CORE_SECTIONS + ["eventSystemRules"],
+    "core_actions_events": _CORE_SECTIONS + ["actionOptions", "eventSystemRules"],
+    "split_step1": ["splitGenerationStep1", "textFormatRules", "worldStandards"],
+    "split_step2": ["splitGenerationStep2"] + _CORE_SECTIONS + ["eventSystemRules"],
+    "split_step2_actions": ["splitGenerationStep2"] + _CORE_SECTIONS + ["actionOptions", "eventSystemRules"],
+}
+
+
+class AssembledPrompt:
+    """一份组装好的系统提示词"""
+
+    def __init__(self, template_id: str, content: str):
+        self.template_id = template_id
+        self.content = content
+        self.hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.tokens = tokens.estimate_tokens(content)
+
+    def to_dict(self, include_content: bool = True) -> Dict[str, object]:
+        data = {
+            "template_id": self.template_id,
+            "hash": self.hash,
+            "tokens": self.tokens,
+            "chars": len(self.content),
+        }
+        if include_content:
+            data["content"] = self.content
+        return data
+
+
+_entries: "OrderedDict[Tuple[str, str, str], AssembledPrompt]" = OrderedDict()
+_by_hash: Dict[str, AssembledPrompt] = {}
+# 用户ID -> (默认提示词版本, 规范化后的覆盖条目)
+_user_overrides: "OrderedDict[int, Tuple[str, Dict[str, str]]]" = OrderedDict()
+_metrics: Dict[str, int] = {"hits": 0, "misses": 0}
+
+
+def _invalidate_users(user_ids: Set[int]) -> None:
+    for user_id in user_ids:
+        _user_overrides.pop(user_id, None)
+
+
+user_cache.register_invalidator(_invalidate_users)
+
+
+async def _overrides(user_id: int, defaults: prompt_defaults.PromptDefaults) -> Dict[str, str]:
+    """用户覆盖条目（按当前默认版本规范化后缓存）"""
+    cached = _user_overrides.get(user_id)
+    if cached is not None and cached[0] == defaults.version:
+        _user_overrides.move_to_end(user_id)
+        return cached[1]
+    stored = await UserPromptConfig.filter(user_id=user_id).first().values_list("prompts_json", flat=True)
+    overrides = prompt_overrides.diff(stored or {}, defaults.prompts)
+    _user_overrides[user_id] = (defaults.version, overrides)
+    while len(_user_overrides) > settings.PROMPT_ASSEMBLY_CACHE_USERS:
+        _user_overrides.popitem(last=False)
+    return overrides
+
+
+def _fingerprint(sections: List[str], overrides: Dict[str, str]) -> str:
+    """模板涉及条目的覆盖指纹；未覆盖任何条目时为空串"""
+    relevant = {key: overrides[key] for key in sections if key in overrides}
+    if not relevant:
+        return ""
+    canonical = json.dumps(relevant, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _store(key: Tuple[str, str, str], entry: AssembledPrompt) -> AssembledPrompt:
+    _entries[key] = entry
+    _by_hash[entry.hash] = entry
+    while len(_entries) > settings.PROMPT_ASSEMBLY_CACHE_SIZE:
+        _, evicted = _entries.popitem(last=False)
+        if _by_hash.get(evicted.hash) is evicted:
+            del _by_hash[evicted.hash]
+    return entry
+
+
+async def assemble(user_id: int, template_id: str) -> AssembledPrompt:
+    """获取用户在指定模板下的系统提示词；模板不存在时抛出 KeyError"""
+    sections = TEMPLATES[template_id]
+    defaults = await prompt_defaults.get()
+    overrides = await _overrides(user_id, defaults)
+    key = (defaults.version, template_id, _fingerprint(sections, overrides))
+
+    entry = _entries.get(key)
+    if entry is not None:
+        _entries.move_to_end(key)
+        _metrics["hits"] += 1
+        return entry
+
+    _metrics["misses"] += 1
+    parts = [(overrides.get(name) or defaults.prompts.get(name) or "").strip() for name in sections]
+    return _store(key, AssembledPrompt(template_id, SECTION_SEPARATOR.join(part for part in parts if part)))
+
+
+async def resolve_hash(user_id: int, prompt_hash: str) -> Optional[AssembledPrompt]:
+    """
+    按哈希取回组装结果；只有该哈希仍是此用户当前组装结果时才有效
+    （默认提示词或用户覆盖变化后返回 None，客户端需重新获取）。
+    """
+    entry = _by_hash.get(prompt_hash)
+    if entry is None:
+        return None
+    current = await assemble(user_id, entry.template_id)
+    return current if current.hash == prompt_hash else None
+
+
+def render(content: str, variables: Optional[Dict[str, str]]) -> str:
+    """替换 {{变量}} 占位符"""
+    for name, value in (variables or {}).items():
+        content = content.replace("{{" + name + "}}", value)
+    return content
+
+
+def get_metrics() -> Dict[str, int]:
+    return {**_metrics, "entries": len(_entries), "users": len(_user_overrides)}
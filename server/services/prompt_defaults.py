@@ -0,0 +1,144 @@
+"""
+默认提示词缓存 - 预编码、预压缩的默认提示词响应体
+默认提示词体积大、几乎只读：内存中保留编码后的字节与内容哈希，仅在管理员更新时刷新。
+每个条目另有持久化的内容哈希与版本号，客户端可按清单只拉取变化的条目。
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from tortoise.transactions import in_transaction
+
+from ..models import DefaultPromptConfig, DefaultPromptVersion
+
+
+# 小于该字节数的响应不压缩
+GZIP_MIN_SIZE = 1024
+
+
+def _encode(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def key_hash(text: str) -> str:
+    """单个提示词条目的内容哈希"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EncodedBody:
+    """预编码的 JSON 响应体及其 gzip 版本"""
+
+    def __init__(self, data, etag_prefix: str):
+        self.body = _encode(data)
+        self.digest = hashlib.sha256(self.body).hexdigest()
+        self.etag = f'"{etag_prefix}-{self.digest[:32]}"'
+        self.gzip_body = gzip.compress(self.body, mtime=0) if len(self.body) >= GZIP_MIN_SIZE else None
+
+
+class PromptDefaults:
+    """某一版本默认提示词的内存快照"""
+
+    def __init__(self, prompts: Dict[str, str], versions: Dict[str, int], updated_at: Optional[datetime]):
+        self.prompts = prompts
+        self.hashes = {key: key_hash(text) for key, text in prompts.items()}
+        self.versions = versions
+        self.updated_at = updated_at.isoformat() if updated_at else None
+
+        self.full = EncodedBody({"prompts": prompts}, "prompts")
+        self.version = self.full.digest
+        self.manifest = EncodedBody({
+            "version": self.version,
+            "lastUpdated": self.updated_at,
+            "keys": {
+                key: {"hash": self.hashes[key], "version": versions.get(key, 1)}
+                for key in prompts
+            },
+        }, "prompts-manifest")
+        # 兼容 promptConfig.ts 的完整配置格式
+        self.config = EncodedBody({
+            "version": self.version,
+            "lastUpdated": self.updated_at,
+            "prompts": {key: self.entry(key) for key in prompts},
+        }, "prompts-config")
+
+    def entry(self, key: str) -> Dict[str, object]:
+        """单个条目的完整配置"""
+        return {
+            "content": self.prompts[key],
+            "enabled": True,
+            "hash": self.hashes[key],
+            "version": self.versions.get(key, 1),
+        }
+
+    def batch(self, keys: Iterable[str]) -> Dict[str, object]:
+        """批量获取条目，不存在的键列入 missing"""
+        wanted = list(dict.fromkeys(keys))
+        return {
+            "version": self.version,
+            "prompts": {key: self.entry(key) for key in wanted if key in self.prompts},
+            "missing": [key for key in wanted if key not in self.prompts],
+        }
+
+
+_current: Optional[PromptDefaults] = None
+_lock = asyncio.Lock()
+
+
+async def _sync_versions(prompts: Dict[str, str], conn) -> Dict[str, int]:
+    """按内容哈希更新条目版本号：新条目为 1，内容变化时递增"""
+    rows = {row.key: row for row in await DefaultPromptVersion.all().using_db(conn)}
+    to_create, to_update = [], []
+    for key, text in prompts.items():
+        digest = key_hash(text)
+        row = rows.get(key)
+        if row is None:
+            to_create.append(DefaultPromptVersion(key=key, content_hash=digest, version=1))
+        elif row.content_hash != digest:
+            row.content_hash = digest
+            row.version += 1
+            to_update.append(row)
+    if to_create:
+        await DefaultPromptVersion.bulk_create(to_create, using_db=conn)
+    if to_update:
+        await DefaultPromptVersion.bulk_update(to_update, fields=["content_hash", "version"], using_db=conn)
+    versions = {key: row.version for key, row in rows.items()}
+    versions.update({row.key: row.version for row in to_create})
+    return versions
+
+
+async def get() -> PromptDefaults:
+    """获取当前默认提示词快照（首次访问时从数据库加载）"""
+    if _current is None:
+        async with _lock:
+            if _current is None:
+                await refresh()
+    return _current
+
+
+async def refresh() -> PromptDefaults:
+    """从数据库重新加载默认提示词，并补齐条目版本号"""
+    global _current
+    async with in_transaction() as conn:
+        record = await DefaultPromptConfig.first().using_db(conn)
+        prompts = record.prompts_json if record else {}
+        versions = await _sync_versions(prompts, conn)
+    _current = PromptDefaults(prompts, versions, record.updated_at if record else None)
+    return _current
+
+
+async def save(prompts: Dict[str, str]) -> PromptDefaults:
+    """写入默认提示词并刷新缓存"""
+    global _current
+    async with in_transaction() as conn:
+        record = await DefaultPromptConfig.first().using_db(conn)
+        if record:
+            record.prompts_json = prompts
+            await record.save(using_db=conn)
+        else:
+            record = await DefaultPromptConfig.create(prompts_json=prompts, using_db=conn)
+        versions = await _sync_versions(prompts, conn)
+    _current = PromptDefaults(prompts, versions, record.updated_at)
+    return _current
@@ -0,0 +1,82 @@
+"""
+用户提示词覆盖 - 只存储与默认提示词不同的条目，读取时与缓存的默认提示词合并
+旧数据（完整副本）按同样规则合并，结果不变，因此压缩迁移可随时重复执行。
+"""
+from typing import Any, Dict, Optional
+
+from ..models import UserPromptConfig
+from . import prompt_defaults, stats, user_cache
+
+
+COMPACT_CHUNK_SIZE = 200
+
+
+def diff(prompts: Dict[str, str], defaults: Dict[str, str]) -> Dict[str, str]:
+    """只保留与默认提示词不同（或默认中不存在）的条目"""
+    return {key: text for key, text in prompts.items() if defaults.get(key) != text}
+
+
+def merge(overrides: Optional[Dict[str, str]], defaults: Dict[str, str]) -> Dict[str, str]:
+    """默认提示词叠加用户覆盖"""
+    return {**defaults, **(overrides or {})}
+
+
+async def get_prompts(user_id: int) -> Optional[Dict[str, str]]:
+    """读取用户的完整提示词；用户从未保存过时返回 None"""
+    overrides = await UserPromptConfig.filter(user_id=user_id).first().values_list("prompts_json", flat=True)
+    if overrides is None:
+        return None
+    defaults = await prompt_defaults.get()
+    return merge(overrides, defaults.prompts)
+
+
+async def save_prompts(user_id: int, prompts: Dict[str, str]) -> Dict[str, str]:
+    """以覆盖形式保存用户提示词，返回实际存储的条目"""
+    defaults = await prompt_defaults.get()
+    overrides = diff(prompts, defaults.prompts)
+    record = await UserPromptConfig.get_or_none(user_id=user_id)
+    if record:
+        record.prompts_json = overrides
+        await record.save()
+    else:
+        await UserPromptConfig.create(user_id=user_id, prompts_json=overrides)
+    user_cache.invalidate([user_id])
+    return overrides
+
+
+async def clear_prompts(user_id: int) -> bool:
+    """删除用户提示词，返回是否存在记录"""
+    deleted = await UserPromptConfig.filter(user_id=user_id).delete()
+    user_cache.invalidate([user_id])
+    return bool(deleted)
+
+
+async def compact_all(dry_run: bool = False) -> Dict[str, Any]:
+    """
+    迁移：把已有记录压缩为仅含覆盖条目，分块处理。
+    返回扫描行数、改写行数及节省的字节数。
+    """
+    defaults = (await prompt_defaults.get()).prompts
+    result = {"scanned": 0, "updated": 0, "bytes_before": 0, "bytes_after": 0}
+    last_id = 0
+    while True:
+        rows = await UserPromptConfig.filter(id__gt=last_id).order_by("id").limit(
+            COMPACT_CHUNK_SIZE
+        ).values_list("id", "prompts_json")
+        if not rows:
+            break
+        for row_id, prompts in rows:
+            prompts = prompts or {}
+            overrides = diff(prompts, defaults)
+            before, after = stats.json_size(prompts), stats.json_size(overrides)
+            result["bytes_before"] += before
+            result["bytes_after"] += after
+            if len(overrides) != len(prompts):
+                result["updated"] += 1
+                if not dry_run:
+                    await UserPromptConfig.filter(id=row_id).update(prompts_json=overrides)
+        result["scanned"] += len(rows)
+        last_id = rows[-1][0]
+
+    result["bytes_saved"] = result["bytes_before"] - result["bytes_after"]
+    return result
@@ -0,0 +1,275 @@
+"""
+推送通道 - WebSocket 连接按主题订阅，服务端变化时推送增量，替代客户端轮询
+主题 -> 连接集合的倒排表负责扇出，每条事件只序列化一次；每个连接一个有界发送队列，
+同一主题的状态类事件在队列内合并为最新值，队列满时丢弃最旧的事件并通知客户端重新拉取。
+"""
+import asyncio
+import itertools
+import json
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from loguru import logger
+
+from ..core.config import settings
+from ..core.security import get_beijing_time
+from . import presence, user_cache
+
+# 主题键：(类型, 目标ID)
+TopicKey = Tuple[str, int]
+
+# 自定义关闭码
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_TOO_MANY = 4429
+CLOSE_SLOW_CONSUMER = 4408
+
+
+class PushError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(message)
+
+
+class Connection:
+    """单个 WebSocket 连接：已订阅主题与待发送队列"""
+
+    __slots__ = ("user_id", "websocket", "topics", "pending", "wakeup", "dropped", "close_code")
+
+    def __init__(self, user_id: int, websocket: WebSocket):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.topics: Set[TopicKey] = set()
+        # 合并键 -> 已序列化的消息（按入队顺序发送）
+        self.pending: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.wakeup = asyncio.Event()
+        self.dropped = 0
+        self.close_code: Optional[int] = None
+
+    def offer(self, key: Hashable, message: str) -> None:
+        """入队（不阻塞）：同键合并，队列满时丢弃最旧的一条"""
+        if key in self.pending:
+            self.pending[key] = message
+            _metrics["coalesced"] += 1
+        else:
+            if len(self.pending) >= settings.PUSH_QUEUE_SIZE:
+                self.pending.popitem(last=False)
+                self.dropped += 1
+                _metrics["dropped"] += 1
+            self.pending[key] = message
+        self.wakeup.set()
+
+    def close(self, code: int) -> None:
+        self.close_code = code
+        self.wakeup.set()
+
+
+class _Topic:
+    """主题类型：把客户端给出的参数解析为目标ID，并可提供订阅时的初始快照"""
+
+    def __init__(
+        self,
+        resolve: Callable[[int, str], Awaitable[Optional[int]]],
+        snapshot: Optional[Callable[[int], Awaitable[Optional[Dict[str, Any]]]]] = None
+    ):
+        self.resolve = resolve
+        self.snapshot = snapshot
+
+
+_topic_types: Dict[str, _Topic] = {}
+_subscribers: Dict[TopicKey, Set[Connection]] = defaultdict(set)
+# 主题键 -> 客户端订阅时使用的主题名（推送消息中原样返回）
+_topic_names: Dict[TopicKey, str] = {}
+_connections: Dict[int, Set[Connection]] = defaultdict(set)
+_sequence = itertools.count()
+_metrics: Dict[str, int] = {"published": 0, "delivered": 0, "coalesced": 0, "dropped": 0, "slow_closed": 0}
+
+
+def register_topic(
+    kind: str,
+    resolve: Callable[[int, str], Awaitable[Optional[int]]],
+    snapshot: Optional[Callable[[int], Awaitable[Optional[Dict[str, Any]]]]] = None
+) -> None:
+    """注册主题类型（由各业务模块在导入时注册）；resolve(当前用户ID, 参数) 返回目标ID，无权限或不存在时返回 None"""
+    _topic_types[kind] = _Topic(resolve, snapshot)
+
+
+def _encode(topic: str, event: str, data: Dict[str, Any]) -> str:
+    return json.dumps({"type": "event", "topic": topic, "event": event, "data": data}, ensure_ascii=False, default=str)
+
+
+def publish(kind: str, target_id: int, event: str, data: Dict[str, Any], coalesce: bool = True) -> int:
+    """
+    向主题的所有订阅连接推送事件，返回入队的连接数。
+    coalesce 为 True 时事件视为完整状态，队列中同一主题尚未发出的旧状态会被替换。
+    """
+    key = (kind, target_id)
+    connections = _subscribers.get(key)
+    if not connections:
+        return 0
+    message = _encode(_topic_names[key], event, data)
+    queue_key = key if coalesce else next(_sequence)
+    for connection in connections:
+        connection.offer(queue_key, message)
+    _metrics["published"] += 1
+    return len(connections)
+
+
+def connect(user_id: int, websocket: WebSocket) -> Connection:
+    if len(_connections[user_id]) >= settings.PUSH_MAX_CONNECTIONS_PER_USER:
+        raise PushError("连接数过多")
+    connection = Connection(user_id, websocket)
+    _connections[user_id].add(connection)
+    return connection
+
+
+def disconnect(connection: Connection) -> None:
+    for key in connection.topics:
+        _unsubscribe_key(connection, key)
+    connection.topics.clear()
+    connections = _connections.get(connection.user_id)
+    if connections is not None:
+        connections.discard(connection)
+        if not connections:
+            del _connections[connection.user_id]
+
+
+def _unsubscribe_key(connection: Connection, key: TopicKey) -> None:
+    connections = _subscribers.get(key)
+    if connections is None:
+        return
+    connections.discard(connection)
+    if not connections:
+        del _subscribers[key]
+        _topic_names.pop(key, None)
+
+
+def _parse(topic: str) -> Tuple[str, str]:
+    kind, _, argument = topic.partition(":")
+    return kind, argument
+
+
+async def subscribe(connection: Connection, topics: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """订阅主题，返回 (已订阅, {被拒主题: 原因})；新订阅的主题立即推送一次当前快照"""
+    accepted: List[str] = []
+    rejected: Dict[str, str] = {}
+    for topic in topics:
+        kind, argument = _parse(topic)
+        topic_type = _topic_types.get(kind)
+        if topic_type is None:
+            rejected[topic] = "未知主题"
+            continue
+        target_id = await topic_type.resolve(connection.user_id, argument)
+        if target_id is None:
+            rejected[topic] = "主题不存在或无权订阅"
+            continue
+        key = (kind, target_id)
+        if key not in connection.topics:
+            if len(connection.topics) >= settings.PUSH_MAX_TOPICS:
+                rejected[topic] = "订阅主题数已达上限"
+                continue
+            connection.topics.add(key)
+            _subscribers[key].add(connection)
+            _topic_names.setdefault(key, topic)
+            if topic_type.snapshot is not None:
+                data = await topic_type.snapshot(target_id)
+                if data is not None and key in connection.topics:
+                    connection.offer(key, _encode(_topic_names[key], kind, data))
+        accepted.append(topic)
+    return accepted, rejected
+
+
+async def unsubscribe(connection: Connection, topics: List[str]) -> List[str]:
+    removed = []
+    for topic in topics:
+        kind, argument = _parse(topic)
+        topic_type = _topic_types.get(kind)
+        if topic_type is None:
+            continue
+        target_id = await topic_type.resolve(connection.user_id, argument)
+        key = (kind, target_id)
+        if key in connection.topics:
+            connection.topics.discard(key)
+            _unsubscribe_key(connection, key)
+            removed.append(topic)
+    return removed
+
+
+async def run_sender(connection: Connection) -> None:
+    """连接的发送循环：排空队列；单次发送超时视为慢消费者并断开"""
+    websocket = connection.websocket
+    while True:
+        await connection.wakeup.wait()
+        connection.wakeup.clear()
+        if connection.close_code is not None:
+            await websocket.close(code=connection.close_code)
+            return
+        if connection.dropped:
+            # 先告知客户端丢了多少条，客户端据此通过 HTTP 接口重新拉取完整状态
+            key = next(_sequence)
+            connection.pending[key] = json.dumps({"type": "overflow", "dropped": connection.dropped})
+            connection.pending.move_to_end(key, last=False)
+            connection.dropped = 0
+        while connection.pending:
+            _, message = connection.pending.popitem(last=False)
+            try:
+                await asyncio.wait_for(websocket.send_text(message), settings.PUSH_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                _metrics["slow_closed"] += 1
+                logger.warning(f"⚠️ 推送连接发送超时，已断开: user_id={connection.user_id}")
+                await websocket.close(code=CLOSE_SLOW_CONSUMER)
+                return
+            _metrics["delivered"] += 1
+
+
+def send_direct(connection: Connection, payload: Dict[str, Any]) -> None:
+    """向单个连接发送控制消息（订阅结果、pong 等），同样经过发送队列"""
+    connection.offer(next(_sequence), json.dumps(payload, ensure_ascii=False, default=str))
+
+
+def _close_disabled(user_ids: Set[int]) -> None:
+    for user_id in user_ids:
+        if user_cache.is_disabled(user_id):
+            for connection in _connections.get(user_id, ()):
+                connection.close(CLOSE_FORBIDDEN)
+
+
+user_cache.register_invalidator(_close_disabled)
+
+
+# === 在线状态主题 presence:<用户名> ===
+def _presence_data(user_id: int, online: bool, seen: Optional[datetime]) -> Dict[str, Any]:
+    return {
+        "is_online": online,
+        "last_heartbeat_at": seen.isoformat() if seen else None,
+        "server_time": get_beijing_time().isoformat(),
+    }
+
+
+async def _resolve_presence(user_id: int, user_name: str) -> Optional[int]:
+    return await presence.get_user_id(user_name) if user_name else None
+
+
+async def _presence_snapshot(target_id: int) -> Dict[str, Any]:
+    return _presence_data(target_id, presence.is_online(target_id), await presence.last_seen(target_id))
+
+
+def _on_presence_change(user_id: int, online: bool, seen: datetime) -> None:
+    if ("presence", user_id) in _subscribers:
+        publish("presence", user_id, "presence", _presence_data(user_id, online, seen))
+
+
+register_topic("presence", _resolve_presence, _presence_snapshot)
+presence.register_listener(_on_presence_change)
+
+
+def get_metrics() -> Dict[str, int]:
+    return {
+        **_metrics,
+        "connections": sum(len(connections) for connections in _connections.values()),
+        "users": len(_connections),
+        "topics": len(_subscribers),
+        "queued": sum(len(connection.pending) for connections in _connections.values() for connection in connections),
+    }
@@ -0,0 +1,200 @@
+"""
+管理后台统计 - 写路径增量维护的计数器
+写路径只在内存中累加增量，由后台任务批量落库；/admin/stats 只读一张小表。
+"""
+import asyncio
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict
+
+from loguru import logger
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import F
+from tortoise.functions import Sum
+
+from ..models import StatCounter, User, Character, UserLocalData, RedemptionCode
+from ..core.config import settings
+from ..core.security import get_beijing_time
+
+
+# 计数键
+USERS_TOTAL = "users_total"
+USERS_ENABLED = "users_enabled"
+SAVES_TOTAL = "saves_total"
+LOCAL_DATA_TOTAL = "local_data_total"
+SAVE_BYTES = "save_bytes"
+REDEMPTION_USES = "redemption_uses"
+# 按北京时间日期分键
+LOGINS_DAILY = "logins"
+ACTIVE_USERS_DAILY = "active_users"
+
+TOTAL_KEYS = [USERS_TOTAL, USERS_ENABLED, SAVES_TOTAL, LOCAL_DATA_TOTAL, SAVE_BYTES, REDEMPTION_USES]
+
+# 按天计数保留天数
+DAILY_RETENTION_DAYS = 30
+RECONCILE_CHUNK_SIZE = 200
+
+_pending: Dict[str, int] = defaultdict(int)
+
+
+def daily_key(prefix: str, day: datetime = None) -> str:
+    """按天计数键，如 logins:2024-01-01"""
+    day = day or get_beijing_time()
+    return f"{prefix}:{day.strftime('%Y-%m-%d')}"
+
+
+def json_size(data: Any) -> int:
+    """JSON 数据落库后的字节数（与 Tortoise JSONField 的序列化方式一致）"""
+    if data is None:
+        return 0
+    return len(json.dumps(data, separators=(",", ":")))
+
+
+def incr(key: str, delta: int = 1) -> None:
+    """累加计数（仅内存操作，由后台任务批量落库）"""
+    if delta:
+        _pending[key] += delta
+
+
+def record_login(previous_login: datetime = None) -> None:
+    """记录一次登录；当天首次登录同时计入活跃用户"""
+    now = get_beijing_time()
+    incr(daily_key(LOGINS_DAILY, now))
+    if previous_login is not None and previous_login.tzinfo is not None:
+        previous_login = previous_login.astimezone(now.tzinfo)
+    if previous_login is None or previous_login.date() != now.date():
+        incr(daily_key(ACTIVE_USERS_DAILY, now))
+
+
+async def _write(key: str, delta: int = 0, value: int = None) -> None:
+    """原子写入单个计数器：value 为绝对值，否则按 delta 累加"""
+    update = {"value": value} if value is not None else {"value": F("value") + delta}
+    if await StatCounter.filter(key=key).update(**update):
+        return
+    try:
+        await StatCounter.create(key=key, value=value if value is not None else delta)
+    except IntegrityError:
+        await StatCounter.filter(key=key).update(**update)
+
+
+async def flush() -> None:
+    """把内存中的增量写入计数器表"""
+    if not _pending:
+        return
+    batch = [(key, delta) for key, delta in _pending.items() if delta]
+    _pending.clear()
+    for index, (key, delta) in enumerate(batch):
+        try:
+            await _write(key, delta=delta)
+        except Exception:
+            # 未写入的增量放回，下次重试
+            for rest_key, rest_delta in batch[index:]:
+                _pending[rest_key] += rest_delta
+            raise
+
+
+async def get_stats() -> Dict[str, int]:
+    """读取全部统计（计数器表 + 尚未落库的增量）"""
+    now = get_beijing_time()
+    daily = {
+        "logins_today": daily_key(LOGINS_DAILY, now),
+        "active_users_today": daily_key(ACTIVE_USERS_DAILY, now),
+    }
+    keys = TOTAL_KEYS + list(daily.values())
+    stored = dict(await StatCounter.filter(key__in=keys).values_list("key", "value"))
+    values = {key: stored.get(key, 0) + _pending.get(key, 0) for key in keys}
+
+    result = {key: values[key] for key in TOTAL_KEYS}
+    result.update({name: values[key] for name, key in daily.items()})
+    return result
+
+
+async def _scan_save_bytes() -> int:
+    """分块统计所有存档 JSON 的字节数"""
+    total = 0
+    last_id = 0
+    while True:
+        rows = await Character.filter(id__gt=last_id).order_by("id").limit(
+            RECONCILE_CHUNK_SIZE
+        ).values_list("id", "save_data")
+        if not rows:
+            break
+        total += sum(json_size(data) for _, data in rows)
+        last_id = rows[-1][0]
+
+    last_id = 0
+    while True:
+        rows = await UserLocalData.filter(id__gt=last_id).order_by("id").limit(
+            RECONCILE_CHUNK_SIZE
+        ).values_list("id", "characters_json", "saves_json")
+        if not rows:
+            break
+        total += sum(json_size(chars) + json_size(saves) for _, chars, saves in rows)
+        last_id = rows[-1][0]
+    return total
+
+
+async def reconcile() -> Dict[str, int]:
+    """
+    全量重算计数器并覆盖写入（开销较大，仅由定时任务或管理员触发）。
+    对账期间的并发写入可能产生少量偏差，会在下次对账时修正。
+    """
+    await flush()
+    now = get_beijing_time()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    redemption_uses = await RedemptionCode.annotate(total=Sum("times_used")).first().values_list(
+        "total", flat=True
+    )
+
+    values = {
+        USERS_TOTAL: await User.all().count(),
+        USERS_ENABLED: await User.filter(is_active=True).count(),
+        SAVES_TOTAL: await Character.all().count(),
+        LOCAL_DATA_TOTAL: await UserLocalData.all().count(),
+        SAVE_BYTES: await _scan_save_bytes(),
+        REDEMPTION_USES: redemption_uses or 0,
+        daily_key(ACTIVE_USERS_DAILY, now): await User.filter(last_login__gte=today_start).count(),
+    }
+    for key, value in values.items():
+        await _write(key, value=value)
+
+    # 清理过期的按天计数
+    cutoff = now - timedelta(days=DAILY_RETENTION_DAYS)
+    stale = [
+        key for key in await StatCounter.filter(key__contains=":").values_list("key", flat=True)
+        if key.split(":", 1)[1] < cutoff.strftime("%Y-%m-%d")
+    ]
+    if stale:
+        await StatCounter.filter(key__in=stale).delete()
+    return values
+
+
+async def run_flush_worker():
+    """后台任务：定期落库增量计数"""
+    try:
+        while True:
+            await asyncio.sleep(settings.STATS_FLUSH_INTERVAL)
+            try:
+                await flush()
+            except Exception as e:
+                logger.error(f"⚠️ 统计计数落库失败: {e}")
+    finally:
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"⚠️ 统计计数落库失败: {e}")
+
+
+async def run_reconcile_worker():
+    """后台任务：定期全量对账（计数器表为空时启动即对账一次）"""
+    if await StatCounter.filter(key=USERS_TOTAL).exists():
+        await asyncio.sleep(settings.STATS_RECONCILE_INTERVAL)
+    while True:
+        try:
+            await reconcile()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"⚠️ 统计计数对账失败: {e}")
+        await asyncio.sleep(settings.STATS_RECONCILE_INTERVAL)
@@ -0,0 +1,163 @@
+"""
+Token 计数与上下文预算 - 按模型家族缓存分词器，批量计数并按预算裁剪历史消息
+分词器从 TOKENIZER_DIR/<家族>.json 加载（HuggingFace tokenizers 格式，进程内只加载一次）；
+未安装 tokenizers 或缺少对应文件时，回退为与前端 aiService 一致的估算规则。
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from loguru import logger
+
+from ..core.config import settings
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+
+# 每条消息的格式开销
+MESSAGE_OVERHEAD = 8
+# 上下文窗口未知时的默认值
+DEFAULT_CONTEXT_WINDOW = 32_000
+
+# 模型家族：(匹配关键字, 上下文窗口)，按顺序匹配模型名
+MODEL_FAMILIES: List[Tuple[str, Tuple[str, ...], int]] = [
+    ("claude", ("claude",), 200_000),
+    ("gemini", ("gemini",), 1_000_000),
+    ("deepseek", ("deepseek",), 64_000),
+    ("kimi", ("moonshot", "kimi"), 128_000),
+    ("qwen", ("qwen",), 128_000),
+    ("gpt-4o", ("gpt-4o", "gpt-4.1", "o1", "o3", "o4"), 128_000),
+    ("gpt-4", ("gpt-4",), 128_000),
+    ("gpt-3.5", ("gpt-3.5",), 16_385),
+]
+# 提供商默认家族（模型名无法识别时）
+PROVIDER_FAMILIES = {"claude": "claude", "gemini": "gemini", "deepseek": "deepseek"}
+
+_tokenizers: Dict[str, Optional[Any]] = {}
+_tokenizer_lock = threading.Lock()
+_counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+_counts_lock = threading.Lock()
+
+
+def _is_cjk(ch: str) -> bool:
+    return 0x4E00 <= ord(ch) <= 0x9FFF
+
+
+def estimate_tokens(text: str) -> int:
+    """CJK 字符按 1 token 计，其余字符按 4 个一 token 计"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if _is_cjk(ch))
+    return cjk + -(-(len(text) - cjk) // 4)
+
+
+def estimate_messages(messages: Iterable[Dict[str, str]]) -> int:
+    """估算消息列表的 token 数"""
+    return sum(MESSAGE_OVERHEAD + estimate_tokens(m.get("content") or "") for m in messages)
+
+
+def resolve_family(model: Optional[str], provider: Optional[str] = None) -> Tuple[str, int]:
+    """按模型名（其次提供商）识别模型家族，返回 (家族, 上下文窗口)"""
+    name = (model or "").lower()
+    for family, keywords, window in MODEL_FAMILIES:
+        if any(keyword in name for keyword in keywords):
+            return family, window
+    family = PROVIDER_FAMILIES.get(provider or "")
+    if family:
+        return next((f, w) for f, _, w in MODEL_FAMILIES if f == family)
+    return "default", DEFAULT_CONTEXT_WINDOW
+
+
+def get_tokenizer(family: str):
+    """加载并缓存家族对应的分词器；不可用时返回 None"""
+    if family in _tokenizers:
+        return _tokenizers[family]
+    with _tokenizer_lock:
+        if family not in _tokenizers:
+            tokenizer = None
+            path = os.path.join(settings.TOKENIZER_DIR, f"{family}.json")
+            if Tokenizer is not None and os.path.isfile(path):
+                try:
+                    tokenizer = Tokenizer.from_file(path)
+                    logger.info(f"🔤 已加载分词器: {family}")
+                except Exception as e:
+                    logger.error(f"⚠️ 分词器加载失败 ({path}): {e}")
+            _tokenizers[family] = tokenizer
+    return _tokenizers[family]
+
+
+def count_texts(texts: Sequence[str], family: str) -> List[int]:
+    """批量计数；已计数过的文本直接取缓存，其余一次性批量编码（可在线程中调用）"""
+    keys = [(family, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()) for text in texts]
+    result: List[Optional[int]] = [None] * len(texts)
+    missing: List[int] = []
+    with _counts_lock:
+        for index, key in enumerate(keys):
+            cached = _counts.get(key)
+            if cached is None:
+                missing.append(index)
+            else:
+                _counts.move_to_end(key)
+                result[index] = cached
+
+    if missing:
+        tokenizer = get_tokenizer(family)
+        if tokenizer is not None:
+            encodings = tokenizer.encode_batch([texts[i] for i in missing], add_special_tokens=False)
+            fresh = [len(encoding.ids) for encoding in encodings]
+        else:
+            fresh = [estimate_tokens(texts[i]) for i in missing]
+        with _counts_lock:
+            for index, count in zip(missing, fresh):
+                result[index] = count
+                _counts[keys[index]] = count
+            while len(_counts) > settings.TOKEN_COUNT_CACHE_SIZE:
+                _counts.popitem(last=False)
+    return result
+
+
+def count_messages(messages: Sequence[Dict[str, Any]], family: str) -> List[int]:
+    """每条消息的 token 数（含格式开销）"""
+    return [MESSAGE_OVERHEAD + n for n in count_texts([m.get("content") or "" for m in messages], family)]
+
+
+def is_exact(family: str) -> bool:
+    return get_tokenizer(family) is not None
+
+
+def trim_to_budget(
+    messages: Sequence[Dict[str, Any]],
+    counts: Sequence[int],
+    budget: int,
+    keep_last: int = 1,
+    strategy: str = "oldest"
+) -> Tuple[List[int], int]:
+    """
+    按预算裁剪消息，返回 (保留的下标, 保留后的 token 总数)。
+    system 消息与最后 keep_last 条消息始终保留；
+    其余消息按 strategy 依次移除：oldest 为从旧到新，importance 为按 importance 从低到高（同分先移除旧的）。
+    """
+    total = sum(counts)
+    if total <= budget:
+        return list(range(len(messages))), total
+
+    pinned_from = max(len(messages) - keep_last, 0)
+    candidates = [
+        i for i in range(pinned_from)
+        if messages[i].get("role") != "system"
+    ]
+    if strategy == "importance":
+        candidates.sort(key=lambda i: (messages[i].get("importance") or 0, i))
+
+    dropped = set()
+    for index in candidates:
+        if total <= budget:
+            break
+        dropped.add(index)
+        total -= counts[index]
+    return [i for i in range(len(messages)) if i not in dropped], total
@@ -0,0 +1,475 @@
+"""
+联机穿越会话 - 进行中的会话常驻内存，按穿越者、世界主人与世界实例建立索引
+每个用户同时只能有一个进行中的会话；会话超时由时间轮淘汰，世界主人上线时驱逐其世界内的穿越者。
+开始穿越同步写库（需要会话ID），结束等状态变化只改内存，由后台任务批量落库；状态查询不访问数据库。
+会话事件写入事件日志，结束且状态落库后归档日志并标记为已结算。
+"""
+import asyncio
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from ..models import TravelSession, WorldInstance, Character
+from ..core.config import settings
+from ..core.security import get_beijing_time
+from . import event_log, presence, push, travel_points
+
+# 会话状态
+STATE_ACTIVE = "active"
+STATE_ENDED = "ended"
+STATE_SETTLED = "settled"
+
+# 结束原因
+END_NORMAL = "normal"
+END_OWNER_ONLINE = "owner_online"
+END_KICKED = "kicked"
+END_TIMEOUT = "timeout"
+
+# 可以穿越进入的可见性（hidden 需要邀请码）
+ENTERABLE_VISIBILITY = ("public", "hidden")
+
+
+class TravelError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+
+class _Session:
+    """内存中的会话（进行中或最近结束）"""
+
+    __slots__ = (
+        "id", "traveler_id", "target_id", "world_instance_id", "started_at", "ended_at",
+        "state", "data", "owner_prompt", "owner_character",
+    )
+
+    def __init__(
+        self,
+        session_id: int,
+        traveler_id: int,
+        target_id: int,
+        world_instance_id: int,
+        started_at: datetime,
+        data: Dict[str, Any],
+        owner_prompt: Optional[str] = None,
+        owner_character: Optional[Dict[str, Any]] = None
+    ):
+        self.id = session_id
+        self.traveler_id = traveler_id
+        self.target_id = target_id
+        self.world_instance_id = world_instance_id
+        self.started_at = started_at
+        self.ended_at: Optional[datetime] = None
+        self.state = STATE_ACTIVE
+        # 与 TravelSession.session_data 一致：entry_map_id / entry_poi_id / map_id / poi_id（当前位置） / cost / end_reason
+        self.data = data
+        self.owner_prompt = owner_prompt
+        self.owner_character = owner_character
+
+    @property
+    def end_reason(self) -> Optional[str]:
+        return self.data.get("end_reason")
+
+
+_wheel: Optional[presence.TimingWheel] = None
+_sessions: Dict[int, _Session] = {}
+_by_traveler: Dict[int, int] = {}
+_by_target: Dict[int, Set[int]] = defaultdict(set)
+_by_world: Dict[int, Set[int]] = defaultdict(set)
+# 最近结束的会话（供结束后的状态查询），按结束顺序淘汰
+_recent: "OrderedDict[int, _Session]" = OrderedDict()
+# 正在开始穿越的用户（防止并发重复开始）
+_starting: Set[int] = set()
+# 待落库的状态变化
+_dirty: Dict[int, _Session] = {}
+# 已结束、日志尚未归档的会话
+_unsettled: Set[int] = set()
+_metrics: Dict[str, int] = {"started": 0, "ended": 0, "evicted": 0, "expired": 0, "persisted": 0, "settled": 0}
+
+
+def _get_wheel() -> presence.TimingWheel:
+    global _wheel
+    if _wheel is None:
+        _wheel = presence.TimingWheel(settings.TRAVEL_EXPIRY_TICK, settings.TRAVEL_SESSION_TTL)
+    return _wheel
+
+
+def _register(session: _Session, remaining: float) -> None:
+    _sessions[session.id] = session
+    _by_traveler[session.traveler_id] = session.id
+    _by_target[session.target_id].add(session.id)
+    _by_world[session.world_instance_id].add(session.id)
+    _get_wheel().schedule(session.id, max(remaining, 0.0))
+
+
+def _unregister(session: _Session) -> None:
+    _sessions.pop(session.id, None)
+    if _by_traveler.get(session.traveler_id) == session.id:
+        del _by_traveler[session.traveler_id]
+    for index, key in ((_by_target, session.target_id), (_by_world, session.world_instance_id)):
+        members = index.get(key)
+        if members is not None:
+            members.discard(session.id)
+            if not members:
+                del index[key]
+    _get_wheel().cancel(session.id)
+
+
+def _entry_point(instance_data: Dict[str, Any]) -> Tuple[int, int]:
+    """入口位置：instance_data.entry 指定，否则取第一张地图的第一个地点"""
+    entry = instance_data.get("entry") or {}
+    if entry.get("map_id") is not None and entry.get("poi_id") is not None:
+        return int(entry["map_id"]), int(entry["poi_id"])
+    for game_map in instance_data.get("maps") or []:
+        pois = game_map.get("pois") or []
+        if pois:
+            return int(game_map["map_id"]), int(pois[0]["id"])
+    raise TravelError("该世界尚未配置地图", 409)
+
+
+async def _owner_characters(owner_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """世界主人当前角色（最近更新的激活存档）"""
+    result: Dict[int, Dict[str, Any]] = {}
+    rows = await Character.filter(user_id__in=owner_ids, is_active=True).order_by("updated_at").values_list(
+        "user_id", "char_name"
+    )
+    for owner_id, char_name in rows:
+        result[owner_id] = {"name": char_name}
+    return result
+
+
+async def load() -> None:
+    """启动时把进行中的会话载入内存，已超时的在下一刻度淘汰"""
+    rows = await TravelSession.filter(status=STATE_ACTIVE).order_by("-id").values(
+        "id", "traveler_id", "target_user_id", "world_instance_id", "session_data", "started_at",
+        "world_instance__offline_agent_prompt",
+    )
+    characters = await _owner_characters(list({row["target_user_id"] for row in rows}))
+    now = get_beijing_time()
+    for row in rows:
+        session = _Session(
+            row["id"], row["traveler_id"], row["target_user_id"], row["world_instance_id"], row["started_at"],
+            row["session_data"] or {}, row["world_instance__offline_agent_prompt"],
+            characters.get(row["target_user_id"]),
+        )
+        if row["traveler_id"] in _by_traveler:
+            # 历史数据中同一用户有多个进行中的会话时只保留最新的，其余按超时结束
+            session.state = STATE_ENDED
+            session.ended_at = now
+            session.data["end_reason"] = END_TIMEOUT
+            _dirty[session.id] = session
+            _unsettled.add(session.id)
+            continue
+        await event_log.open_log(session.id)
+        _register(session, settings.TRAVEL_SESSION_TTL - (now - row["started_at"]).total_seconds())
+    # 上次运行中已结束但尚未归档日志的会话
+    _unsettled.update(await TravelSession.filter(status=STATE_ENDED).values_list("id", flat=True))
+    if rows:
+        logger.info(f"📝 已载入 {len(_sessions)} 个进行中的穿越会话")
+
+
+def get(session_id: int) -> Optional[_Session]:
+    """进行中或最近结束的会话"""
+    return _sessions.get(session_id) or _recent.get(session_id)
+
+
+async def find(session_id: int) -> Optional[_Session]:
+    """会话（进行中或最近结束的取内存；重启后或已移出最近结束列表的从数据库读取，只用于查询）"""
+    session = get(session_id)
+    if session is not None:
+        return session
+    record = await TravelSession.filter(id=session_id).first()
+    if record is None:
+        return None
+    session = _Session(
+        record.id, record.traveler_id, record.target_user_id, record.world_instance_id, record.started_at,
+        record.session_data or {},
+    )
+    session.state = record.status
+    session.ended_at = record.ended_at
+    return session
+
+
+def get_active(user_id: int) -> Optional[_Session]:
+    session_id = _by_traveler.get(user_id)
+    return _sessions.get(session_id) if session_id is not None else None
+
+
+def status_payload(session: _Session) -> Dict[str, Any]:
+    return {
+        "session_id": session.id,
+        "state": session.state,
+        "end_reason": session.end_reason,
+        "target_world_instance_id": session.world_instance_id,
+        "entry_map_id": session.data.get("entry_map_id"),
+        "entry_poi_id": session.data.get("entry_poi_id"),
+        "current_map_id": position(session)[0],
+        "current_poi_id": position(session)[1],
+    }
+
+
+async def start(traveler_id: int, target_name: str, invite_code: Optional[str] = None) -> Tuple[_Session, int]:
+    """开始穿越，返回 (会话, 剩余穿越点)"""
+    if traveler_id in _by_traveler or traveler_id in _starting:
+        raise TravelError("已有进行中的穿越，会话结束后才能继续", 409)
+    _starting.add(traveler_id)
+    try:
+        target_id = await presence.get_user_id(target_name)
+        if target_id is None:
+            raise TravelError("目标用户不存在", 404)
+        if target_id == traveler_id:
+            raise TravelError("不能穿越到自己的世界")
+        if presence.is_online(target_id):
+            raise TravelError("世界主人在线，暂时无法穿越", 409)
+        instance = await WorldInstance.filter(owner_id=target_id).order_by("-updated_at").first()
+        if instance is None:
+            raise TravelError("该用户还没有可穿越的世界", 404)
+        if instance.visibility_mode not in ENTERABLE_VISIBILITY:
+            raise TravelError("该世界未开放穿越", 403)
+        instance_data = instance.instance_data or {}
+        if instance.visibility_mode != "public":
+            expected = instance_data.get("invite_code")
+            if not expected or invite_code != expected:
+                raise TravelError("邀请码错误", 403)
+        if not instance.allow_offline_travel:
+            raise TravelError("世界主人未开启离线穿越", 403)
+        entry_map_id, entry_poi_id = _entry_point(instance_data)
+        # 扣点之前取完所需信息，插入会话之后只剩内存操作
+        characters = await _owner_characters([target_id])
+
+        cost = settings.TRAVEL_START_COST
+        points_left = await travel_points.consume_points(traveler_id, cost, reason=f"穿越至 {target_name} 的世界")
+        if points_left is None:
+            raise TravelError("穿越点不足")
+        data = {
+            "entry_map_id": entry_map_id, "entry_poi_id": entry_poi_id,
+            "map_id": entry_map_id, "poi_id": entry_poi_id,
+            "cost": cost, "end_reason": None,
+        }
+        record = session = None
+        try:
+            record = await TravelSession.create(
+                traveler_id=traveler_id,
+                target_user_id=target_id,
+                world_instance_id=instance.id,
+                status=STATE_ACTIVE,
+                session_data=data,
+            )
+            session = _Session(
+                record.id, traveler_id, target_id, instance.id, record.started_at, dict(data),
+                instance.offline_agent_prompt, characters.get(target_id),
+            )
+            event_log.create(session.id)
+            _register(session, settings.TRAVEL_SESSION_TTL)
+        except Exception:
+            # 会话未能载入内存：删除已插入的行（否则重启后会被当作进行中的会话载入）并退还穿越点
+            if session is not None:
+                _unregister(session)
+            if record is not None:
+                await event_log.drop([record.id])
+                await TravelSession.filter(id=record.id).delete()
+            await travel_points.grant_points(traveler_id, cost, reason="穿越失败退还")
+            raise
+    finally:
+        _starting.discard(traveler_id)
+    _metrics["started"] += 1
+    log_event(session, "travel_start", entry_map_id, entry_poi_id, {"target_username": target_name})
+    push.publish("travel", traveler_id, "travel", status_payload(session))
+    # 开始期间主人恰好上线时立即驱逐
+    if presence.is_online(target_id):
+        end(session.id, END_OWNER_ONLINE)
+    return session, points_left
+
+
+def position(session: _Session) -> Tuple[int, int]:
+    """穿越者当前位置 (地图ID, 地点ID)"""
+    data = session.data
+    return data.get("map_id", data.get("entry_map_id")), data.get("poi_id", data.get("entry_poi_id"))
+
+
+def move(session: _Session, map_id: int, poi_id: int) -> None:
+    """更新当前位置（只改内存，由后台任务落库）并写入移动事件；调用方负责校验道路"""
+    from_map_id, from_poi_id = position(session)
+    session.data["map_id"] = map_id
+    session.data["poi_id"] = poi_id
+    _dirty[session.id] = session
+    log_event(session, "move", map_id, poi_id, {"from_map_id": from_map_id, "from_poi_id": from_poi_id})
+
+
+def log_event(
+    session: _Session,
+    event_type: str,
+    map_id: Optional[int] = None,
+    poi_id: Optional[int] = None,
+    payload: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """写入会话事件日志，并推送给订阅了 travel 主题的穿越者"""
+    event = event_log.append(session.id, event_type, map_id, poi_id, payload)
+    if event is not None:
+        push.publish("travel", session.traveler_id, "travel_event", {"session_id": session.id, **event}, coalesce=False)
+    return event
+
+
+def end(session_id: int, reason: str) -> Optional[_Session]:
+    """结束会话（只改内存，由后台任务落库），会话不在进行中时返回 None"""
+    session = _sessions.get(session_id)
+    if session is None:
+        return None
+    _unregister(session)
+    session.state = STATE_ENDED
+    session.ended_at = get_beijing_time()
+    session.data["end_reason"] = reason
+    _recent[session.id] = session
+    while len(_recent) > settings.TRAVEL_RECENT_SESSIONS:
+        _recent.popitem(last=False)
+    _dirty[session.id] = session
+    _unsettled.add(session.id)
+    _metrics["ended"] += 1
+    log_event(
+        session, "travel_evicted" if reason in (END_OWNER_ONLINE, END_KICKED) else "travel_end",
+        payload={"reason": reason},
+    )
+    push.publish("travel", session.traveler_id, "travel", status_payload(session))
+    return session
+
+
+def end_by_traveler(user_id: int, session_id: int) -> _Session:
+    session = _sessions.get(session_id)
+    if session is None or session.traveler_id != user_id:
+        raise TravelError("穿越会话不存在或已结束", 404)
+    return end(session_id, END_NORMAL)
+
+
+def evict_world_owner_sessions(owner_id: int, reason: str = END_OWNER_ONLINE) -> int:
+    """驱逐某个世界主人名下的全部穿越者，返回驱逐人数"""
+    session_ids = list(_by_target.get(owner_id, ()))
+    for session_id in session_ids:
+        end(session_id, reason)
+    _metrics["evicted"] += len(session_ids)
+    return len(session_ids)
+
+
+def _on_presence_change(user_id: int, online: bool, seen: datetime) -> None:
+    if online and user_id in _by_target:
+        evict_world_owner_sessions(user_id)
+
+
+def expire() -> List[int]:
+    """淘汰超时的会话，返回本次结束的会话ID"""
+    expired = [session_id for session_id in _get_wheel().advance() if end(session_id, END_TIMEOUT)]
+    _metrics["expired"] += len(expired)
+    return expired
+
+
+def forget_user(user_id: int) -> None:
+    """移除与该用户相关的内存会话与待落库记录（删除用户时调用，数据库行由级联删除处理）"""
+    related = [
+        session for session in list(_sessions.values()) + list(_recent.values())
+        if user_id in (session.traveler_id, session.target_id)
+    ]
+    for session in related:
+        _unregister(session)
+        _recent.pop(session.id, None)
+        _dirty.pop(session.id, None)
+        _unsettled.discard(session.id)
+
+
+async def flush() -> int:
+    """把会话状态变化批量写入数据库，返回写入条数"""
+    if not _dirty:
+        return 0
+    batch = dict(_dirty)
+    _dirty.clear()
+    try:
+        records = await TravelSession.filter(id__in=list(batch))
+        for record in records:
+            session = batch[record.id]
+            record.status = session.state
+            record.ended_at = session.ended_at
+            record.session_data = session.data
+        if records:
+            await TravelSession.bulk_update(records, fields=["status", "ended_at", "session_data"])
+    except Exception:
+        # 未写入的放回（期间若有新变化则以新值为准）
+        for session_id, session in batch.items():
+            _dirty.setdefault(session_id, session)
+        raise
+    _metrics["persisted"] += len(batch)
+    return len(batch)
+
+
+async def settle() -> int:
+    """归档已结束且状态已落库的会话日志，并标记为已结算，返回本次结算的会话数"""
+    settled_ids: List[int] = []
+    count = 0
+    for session_id in list(_unsettled):
+        if session_id in _dirty:
+            continue
+        try:
+            await event_log.archive(session_id)
+        except Exception as e:
+            logger.error(f"⚠️ 会话事件日志归档失败: session_id={session_id}, {e}")
+            continue
+        _unsettled.discard(session_id)
+        count += 1
+        session = _recent.get(session_id)
+        if session is not None:
+            session.state = STATE_SETTLED
+            _dirty[session_id] = session
+        else:
+            settled_ids.append(session_id)
+    if settled_ids:
+        await TravelSession.filter(id__in=settled_ids, status=STATE_ENDED).update(status=STATE_SETTLED)
+    _metrics["settled"] += count
+    return count
+
+
+async def run_expiry_worker():
+    """后台任务：按刻度推进时间轮"""
+    while True:
+        await asyncio.sleep(settings.TRAVEL_EXPIRY_TICK)
+        expire()
+
+
+async def run_flush_worker():
+    """后台任务：定期批量落库会话状态变化，并结算已结束的会话"""
+    try:
+        while True:
+            await asyncio.sleep(settings.TRAVEL_FLUSH_INTERVAL)
+            try:
+                await flush()
+                await settle()
+            except Exception as e:
+                logger.error(f"⚠️ 穿越会话状态落库失败: {e}")
+    finally:
+        try:
+            await flush()
+        except Exception as e:
+            logger.error(f"⚠️ 穿越会话状态落库失败: {e}")
+
+
+# === 推送主题 travel（当前用户进行中的会话） ===
+async def _resolve_topic(user_id: int, argument: str) -> Optional[int]:
+    return user_id if not argument else None
+
+
+async def _topic_snapshot(user_id: int) -> Optional[Dict[str, Any]]:
+    session = get_active(user_id)
+    return status_payload(session) if session else None
+
+
+push.register_topic("travel", _resolve_topic, _topic_snapshot)
+presence.register_listener(_on_presence_change)
+
+
+def get_metrics() -> Dict[str, int]:
+    return {
+        **_metrics,
+        "active": len(_sessions),
+        "recent": len(_recent),
+        "pending_writes": len(_dirty),
+        "unsettled": len(_unsettled),
+    }
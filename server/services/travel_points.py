@@ -0,0 +1,207 @@
+"""
+穿越点数流水服务 - 原子扣减、发放与余额快照
+"""
+import asyncio
+from datetime import timedelta
+from typing import List, Optional
+
+from loguru import logger
+from tortoise.expressions import F
+from tortoise.transactions import in_transaction
+
+from ..models import User, TravelPointLedger, TravelPointSnapshot
+from ..core.security import get_beijing_time
+from ..core.config import settings
+
+
+# 流水类型
+KIND_GRANT = "grant"
+KIND_CONSUME = "consume"
+KIND_REDEEM = "redeem"
+KIND_SIGNIN = "signin"
+KIND_ADJUST = "adjust"
+
+# 只汇总写入超过该时长的流水，避免跳过尚未提交的事务
+SNAPSHOT_LAG = timedelta(seconds=5)
+SNAPSHOT_BATCH_SIZE = 1000
+
+
+async def _append_entry(conn, user_id: int, kind: str, delta: int, reason: Optional[str]) -> int:
+    """在当前事务内读取最新余额并追加一条流水"""
+    balance = await User.filter(id=user_id).using_db(conn).first().values_list("travel_points", flat=True)
+    await TravelPointLedger.create(
+        user_id=user_id,
+        kind=kind,
+        delta=delta,
+        balance_after=balance,
+        reason=reason,
+        using_db=conn
+    )
+    return balance
+
+
+async def consume_points(user_id: int, amount: int, reason: Optional[str] = None) -> Optional[int]:
+    """
+    原子扣减点数（单条带条件的 UPDATE），返回扣减后余额。
+    余额不足或用户不存在时返回 None。
+    """
+    async with in_transaction() as conn:
+        updated = await User.filter(id=user_id, travel_points__gte=amount).using_db(conn).update(
+            travel_points=F("travel_points") - amount
+        )
+        if not updated:
+            return None
+        return await _append_entry(conn, user_id, KIND_CONSUME, -amount, reason)
+
+
+async def grant_points(
+    user_id: int,
+    amount: int,
+    kind: str = KIND_GRANT,
+    reason: Optional[str] = None
+) -> Optional[int]:
+    """原子增加点数，返回增加后余额；用户不存在时返回 None"""
+    async with in_transaction() as conn:
+        updated = await User.filter(id=user_id).using_db(conn).update(
+            travel_points=F("travel_points") + amount
+        )
+        if not updated:
+            return None
+        return await _append_entry(conn, user_id, kind, amount, reason)
+
+
+async def grant_points_bulk(
+    user_ids: List[int],
+    amount: int,
+    conn,
+    kind: str = KIND_GRANT,
+    reason: Optional[str] = None
+) -> int:
+    """在调用方事务内为一批用户增加点数（单条 UPDATE + 批量写流水），返回影响行数"""
+    updated = await User.filter(id__in=user_ids).using_db(conn).update(
+        travel_points=F("travel_points") + amount
+    )
+    if not updated:
+        return 0
+    balances = await User.filter(id__in=user_ids).using_db(conn).values_list("id", "travel_points")
+    await TravelPointLedger.bulk_create(
+        [
+            TravelPointLedger(user_id=uid, kind=kind, delta=amount, balance_after=balance, reason=reason)
+            for uid, balance in balances
+        ],
+        using_db=conn
+    )
+    return updated
+
+
+async def set_points(user_id: int, points: int, reason: Optional[str] = None, retries: int = 5) -> Optional[int]:
+    """
+    将点数设置为指定值（管理员调整），用户不存在时返回 None。
+    以比较并交换的方式写入，与并发扣减冲突时重试，流水记录实际差值。
+    """
+    for _ in range(retries):
+        async with in_transaction() as conn:
+            current = await User.filter(id=user_id).using_db(conn).first().values_list("travel_points", flat=True)
+            if current is None:
+                return None
+            if current == points:
+                return points
+            updated = await User.filter(id=user_id, travel_points=current).using_db(conn).update(
+                travel_points=points
+            )
+            if updated:
+                return await _append_entry(conn, user_id, KIND_ADJUST, points - current, reason)
+    raise RuntimeError("穿越点数并发修改冲突")
+
+
+def _today_start():
+    return get_beijing_time().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def signed_in_today(user_id: int) -> bool:
+    return await TravelPointLedger.filter(user_id=user_id, kind=KIND_SIGNIN, created_at__gte=_today_start()).exists()
+
+
+# 正在签到的用户（防止同一进程内并发重复签到）
+_signing = set()
+
+
+async def signin(user_id: int, amount: int) -> Optional[int]:
+    """每日签到发放点数，返回发放后余额；今日已签到时返回 None"""
+    if user_id in _signing:
+        return None
+    _signing.add(user_id)
+    try:
+        if await signed_in_today(user_id):
+            return None
+        return await grant_points(user_id, amount, kind=KIND_SIGNIN, reason="每日签到")
+    finally:
+        _signing.discard(user_id)
+
+
+async def record_initial_grant(user_id: int, amount: int, reason: Optional[str] = None):
+    """为创建时已带初始点数的用户补记一条发放流水"""
+    await TravelPointLedger.create(
+        user_id=user_id,
+        kind=KIND_GRANT,
+        delta=amount,
+        balance_after=amount,
+        reason=reason
+    )
+
+
+async def roll_up_snapshots(batch_size: int = SNAPSHOT_BATCH_SIZE) -> int:
+    """将新流水汇总进余额快照，返回本次处理的流水条数"""
+    cursor = await TravelPointSnapshot.all().order_by("-last_entry_id").first().values_list(
+        "last_entry_id", flat=True
+    )
+    deadline = get_beijing_time() - SNAPSHOT_LAG
+
+    entries = await TravelPointLedger.filter(id__gt=cursor or 0, created_at__lt=deadline).order_by("id").limit(
+        batch_size
+    ).values("id", "user_id", "balance_after")
+    if not entries:
+        return 0
+
+    # 同一用户只保留最后一条（流水按ID递增，balance_after 即为当时余额）
+    latest = {}
+    for entry in entries:
+        latest[entry["user_id"]] = entry
+
+    async with in_transaction() as conn:
+        existing = {
+            snap.user_id: snap
+            for snap in await TravelPointSnapshot.filter(user_id__in=list(latest)).using_db(conn)
+        }
+        to_update, to_create = [], []
+        for uid, entry in latest.items():
+            snap = existing.get(uid)
+            if snap:
+                snap.balance = entry["balance_after"]
+                snap.last_entry_id = entry["id"]
+                to_update.append(snap)
+            else:
+                to_create.append(TravelPointSnapshot(
+                    user_id=uid,
+                    balance=entry["balance_after"],
+                    last_entry_id=entry["id"]
+                ))
+        if to_update:
+            await TravelPointSnapshot.bulk_update(to_update, fields=["balance", "last_entry_id"], using_db=conn)
+        if to_create:
+            await TravelPointSnapshot.bulk_create(to_create, using_db=conn)
+
+    return len(entries)
+
+
+async def run_snapshot_worker():
+    """后台任务：定期把新流水汇总进余额快照"""
+    while True:
+        try:
+            while await roll_up_snapshots() >= SNAPSHOT_BATCH_SIZE:
+                pass
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"⚠️ 穿越点数快照汇总失败: {e}")
+        await asyncio.sleep(settings.TRAVEL_POINTS_SNAPSHOT_INTERVAL)
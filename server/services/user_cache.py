@@ -0,0 +1,44 @@
+"""
+用户级缓存 - 已禁用账号集合及其他按用户缓存的统一失效入口
+"""
+from typing import Callable, Iterable, List, Set
+
+from ..models import User
+
+
+_disabled_ids: Set[int] = set()
+_invalidators: List[Callable[[Set[int]], None]] = []
+
+
+async def load() -> None:
+    """启动时加载已禁用账号"""
+    global _disabled_ids
+    _disabled_ids = set(await User.filter(is_active=False).values_list("id", flat=True))
+
+
+def is_disabled(user_id: int) -> bool:
+    return user_id in _disabled_ids
+
+
+def set_active(user_ids: Iterable[int], is_active: bool) -> None:
+    """批量更新账号启用状态并失效相关缓存"""
+    ids = set(user_ids)
+    if is_active:
+        _disabled_ids.difference_update(ids)
+    else:
+        _disabled_ids.update(ids)
+    invalidate(ids)
+
+
+def register_invalidator(callback: Callable[[Set[int]], None]) -> None:
+    """注册按用户失效的回调（由各缓存模块在导入时注册）"""
+    _invalidators.append(callback)
+
+
+def invalidate(user_ids: Iterable[int]) -> None:
+    """批量失效这些用户的所有缓存"""
+    ids = set(user_ids)
+    if not ids:
+        return
+    for callback in _invalidators:
+        callback(ids)
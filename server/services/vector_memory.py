@@ -0,0 +1,466 @@
+"""
+向量记忆 - 按 (用户, 存档) 保存记忆向量，并以一次矩阵运算批量检索 top-k
+向量归一化后按行追加到 float32 矩阵文件，检索时整体读入内存（不保持文件映射，追加截断与压缩替换不受影响）；删除只标记无效行，无效行过多时才压缩重写。
+记忆内容与行号保存在数据库，同时维护关键词倒排索引用于混合检索。安装 numpy 时以矩阵乘法打分，否则逐行计算。
+"""
+import asyncio
+import math
+import os
+import re
+import shutil
+import struct
+import time
+from array import array
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Set, Tuple
+
+from loguru import logger
+from tortoise.transactions import in_transaction
+
+from ..models import VectorMemory
+from ..core.config import settings
+from .keyword_index import KeywordIndex
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# 矩阵文件头：魔数、格式版本、维度、保留字段（16 字节，保证行数据按 float32 对齐）
+_HEADER = struct.Struct("<4sIII")
+_MAGIC = b"TRVM"
+_VERSION = 1
+# 无效行少于该数量时不压缩
+COMPACT_MIN_DEAD_ROWS = 1024
+
+SLOT_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class MemoryStoreError(Exception):
+    """向量记忆操作错误"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def _unit(vector: bytes) -> bytes:
+    """归一化为单位向量，之后点积即余弦相似度"""
+    if np is not None:
+        values = np.frombuffer(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(values))
+        return (values / norm).astype(np.float32).tobytes() if norm else vector
+    values = array("f", vector)
+    norm = math.sqrt(sum(v * v for v in values))
+    return array("f", (v / norm for v in values)).tobytes() if norm else vector
+
+
+def _read_header(path: str) -> Tuple[int, int]:
+    """返回 (维度, 文件中的行数)；文件不存在时为 (0, 0)"""
+    if not os.path.isfile(path):
+        return 0, 0
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        magic, _, dim, _ = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != _MAGIC or not dim:
+        raise MemoryStoreError(f"向量文件已损坏: {path}", status_code=500)
+    return dim, (size - _HEADER.size) // (dim * 4)
+
+
+def _write_matrix(path: str, dim: int, rows: Sequence[bytes]) -> None:
+    """整体写入（新建或压缩）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, dim, 0))
+        for row in rows:
+            f.write(row)
+    os.replace(tmp, path)
+
+
+def _append_rows(path: str, expected_rows: int, dim: int, rows: Sequence[bytes]) -> None:
+    """追加写入；先截掉上次未写完的残行，保证行号与文件对齐"""
+    with open(path, "r+b") as f:
+        f.truncate(_HEADER.size + expected_rows * dim * 4)
+        f.seek(0, os.SEEK_END)
+        for row in rows:
+            f.write(row)
+
+
+class _View:
+    """一次检索使用的只读快照（矩阵复制到内存，不占用文件）"""
+
+    def __init__(self, store: "MemoryStore"):
+        self.path = store.path
+        self.dim = store.dim
+        self.entry_ids = list(store.entry_ids)
+        self.rows = dict(store.rows)
+        self.matrix = None
+        if np is not None:
+            self.alive = np.array([entry_id is not None for entry_id in self.entry_ids], dtype=bool)
+            self.importance = np.asarray(store.importance, dtype=np.float32)
+            self.timestamps = np.asarray(store.timestamps, dtype=np.float64)
+        else:
+            self.importance = list(store.importance)
+            self.timestamps = list(store.timestamps)
+
+    def load(self) -> None:
+        """读取矩阵（在线程中调用，调用方持有存档锁）"""
+        size = len(self.entry_ids) * self.dim * 4
+        data = b""
+        if size:
+            with open(self.path, "rb") as f:
+                f.seek(_HEADER.size)
+                data = f.read(size)
+        if np is not None:
+            self.matrix = np.frombuffer(data, dtype=np.float32).reshape(len(self.entry_ids), self.dim)
+        else:
+            self.matrix = array("f")
+            self.matrix.frombytes(data)
+
+
+class MemoryStore:
+    """单个 (用户, 存档) 的向量记忆"""
+
+    def __init__(self, user_id: int, slot: str):
+        self.user_id = user_id
+        self.slot = slot
+        self.path = os.path.join(settings.VECTOR_MEMORY_DIR, str(user_id), f"{slot}.f32")
+        self.dim = 0
+        self.model: Optional[str] = None
+        # 行号 -> 记忆ID（None 为已删除或未入库的行）
+        self.entry_ids: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+        self.importance: List[float] = []
+        self.timestamps: List[int] = []
+        self.keywords = KeywordIndex()
+        self.lock = asyncio.Lock()
+        self._view: Optional[_View] = None
+        # 正在使用该存档的请求数，大于 0 时不会被移出缓存
+        self.users = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    async def load(self) -> None:
+        self.dim, file_rows = await asyncio.to_thread(_read_header, self.path)
+        self.model = None
+        self.entry_ids = [None] * file_rows
+        self.importance = [0.0] * file_rows
+        self.timestamps = [0] * file_rows
+        self.rows = {}
+        self.keywords = KeywordIndex()
+        records = await VectorMemory.filter(user_id=self.user_id, slot=self.slot).values_list(
+            "entry_id", "row", "importance", "timestamp", "model", "content", "tags", "category"
+        )
+        for entry_id, row, importance, timestamp, model, content, tags, category in records:
+            if row >= file_rows:
+                continue
+            self.keywords.add(entry_id, content, tags, category)
+            self.entry_ids[row] = entry_id
+            self.rows[entry_id] = row
+            self.importance[row] = importance
+            self.timestamps[row] = timestamp
+            self.model = model
+        self._view = None
+
+    async def view(self) -> _View:
+        if self._view is None:
+            async with self.lock:
+                # 持锁读取，期间不会有追加或压缩改动文件
+                if self._view is None:
+                    view = _View(self)
+                    await asyncio.to_thread(view.load)
+                    self._view = view
+        return self._view
+
+    async def add(self, model: str, entries: List[Dict[str, Any]], vectors: List[bytes]) -> None:
+        """追加记忆；entry_id 已存在时替换旧条目"""
+        dim = len(vectors[0]) // 4
+        if any(len(vector) != dim * 4 for vector in vectors):
+            raise MemoryStoreError("向量维度不一致")
+        vectors = [_unit(vector) for vector in vectors]
+        async with self.lock:
+            if self.count and (model != self.model or dim != self.dim):
+                raise MemoryStoreError(
+                    f"与已有记忆的向量模型不一致（{self.model}, {self.dim} 维），请先清空该存档的向量记忆",
+                    status_code=409
+                )
+            start = len(self.entry_ids)
+            if not self.count and (dim != self.dim or not os.path.isfile(self.path)):
+                # 空存档（或只剩无效行）直接按新维度重建文件
+                await asyncio.to_thread(_write_matrix, self.path, dim, vectors)
+                self.entry_ids, self.importance, self.timestamps = [], [], []
+                start = 0
+            else:
+                await asyncio.to_thread(_append_rows, self.path, start, dim, vectors)
+            self.dim = dim
+
+            entry_ids = [entry["entry_id"] for entry in entries]
+            async with in_transaction() as conn:
+                await VectorMemory.filter(
+                    user_id=self.user_id, slot=self.slot, entry_id__in=entry_ids
+                ).using_db(conn).delete()
+                await VectorMemory.bulk_create([
+                    VectorMemory(user_id=self.user_id, slot=self.slot, row=start + offset, model=model, **entry)
+                    for offset, entry in enumerate(entries)
+                ], using_db=conn)
+
+            for entry_id in entry_ids:
+                old_row = self.rows.pop(entry_id, None)
+                if old_row is not None:
+                    self.entry_ids[old_row] = None
+            for offset, entry in enumerate(entries):
+                self.entry_ids.append(entry["entry_id"])
+                self.importance.append(entry["importance"])
+                self.timestamps.append(entry["timestamp"])
+                self.rows[entry["entry_id"]] = start + offset
+                self.keywords.add(entry["entry_id"], entry["content"], entry["tags"], entry["category"])
+            self.model = model
+            self._view = None
+            _metrics["appended"] += len(entries)
+            await self._maybe_compact()
+
+    async def delete(self, entry_ids: List[str]) -> int:
+        """删除记忆（只标记矩阵中的行）"""
+        async with self.lock:
+            removed = await VectorMemory.filter(
+                user_id=self.user_id, slot=self.slot, entry_id__in=entry_ids
+            ).delete()
+            for entry_id in entry_ids:
+                row = self.rows.pop(entry_id, None)
+                if row is not None:
+                    self.entry_ids[row] = None
+                self.keywords.remove(entry_id)
+            self._view = None
+            _metrics["deleted"] += removed
+            await self._maybe_compact()
+            return removed
+
+    async def _maybe_compact(self) -> None:
+        """无效行超过有效行（且不少于 COMPACT_MIN_DEAD_ROWS）时重写矩阵文件（调用方持有锁）"""
+        dead = len(self.entry_ids) - self.count
+        if dead < max(COMPACT_MIN_DEAD_ROWS, self.count):
+            return
+        live_rows = [row for row, entry_id in enumerate(self.entry_ids) if entry_id is not None]
+        stride = self.dim * 4
+
+        def rewrite() -> None:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            rows = [data[_HEADER.size + row * stride:_HEADER.size + (row + 1) * stride] for row in live_rows]
+            tmp_path = f"{self.path}.compact"
+            _write_matrix(tmp_path, self.dim, rows)
+
+        await asyncio.to_thread(rewrite)
+        new_rows = {self.entry_ids[row]: index for index, row in enumerate(live_rows)}
+        records = await VectorMemory.filter(user_id=self.user_id, slot=self.slot).only("id", "entry_id", "row")
+        for record in records:
+            record.row = new_rows.get(record.entry_id, record.row)
+        async with in_transaction() as conn:
+            if records:
+                await VectorMemory.bulk_update(records, fields=["row"], using_db=conn)
+            os.replace(f"{self.path}.compact", self.path)
+
+        self.entry_ids = [self.entry_ids[row] for row in live_rows]
+        self.importance = [self.importance[row] for row in live_rows]
+        self.timestamps = [self.timestamps[row] for row in live_rows]
+        self.rows = {entry_id: index for index, entry_id in enumerate(self.entry_ids)}
+        self._view = None
+        _metrics["compactions"] += 1
+        logger.info(f"🧹 向量记忆已压缩: 用户 {self.user_id} / {self.slot}，移除 {dead} 行")
+
+    async def search(
+        self,
+        queries: List[Optional[bytes]],
+        k: int,
+        importance_weight: float = 0.0,
+        recency_weight: float = 0.0,
+        recency_half_life_hours: float = 168.0,
+        now_ms: Optional[int] = None,
+        min_score: Optional[float] = None,
+        vector_weight: float = 1.0,
+        keyword_scores: Optional[List[Dict[str, float]]] = None,
+        only: Optional[Set[str]] = None
+    ) -> List[List[Tuple[str, float, float]]]:
+        """
+        批量检索，每个查询返回按分数降序的 [(记忆ID, 分数, 相似度)]。
+        分数 = vector_weight × 余弦相似度 + 关键词分数 + importance_weight × 重要度/10
+              + recency_weight × 0.5^(距今时长/半衰期)。
+        keyword_scores 为每个查询已加权的 {记忆ID: 分数}；only 限定候选记忆ID；
+        vector_weight 为 0 时不计算相似度，queries 中可为 None。
+        """
+        if not self.count:
+            return [[] for _ in queries]
+        if vector_weight and any(query is None or len(query) != self.dim * 4 for query in queries):
+            raise MemoryStoreError(f"查询向量维度应为 {self.dim}")
+        _metrics["searches"] += 1
+        _metrics["queries"] += len(queries)
+        view = await self.view()
+        options = _SearchOptions(
+            k=k,
+            importance_weight=importance_weight,
+            recency_weight=recency_weight,
+            half_life_ms=recency_half_life_hours * 3600 * 1000,
+            now_ms=now_ms or int(time.time() * 1000),
+            min_score=min_score,
+            vector_weight=vector_weight,
+            extra=[
+                {view.rows[entry_id]: value for entry_id, value in scores.items() if entry_id in view.rows}
+                for scores in keyword_scores
+            ] if keyword_scores else None,
+            allowed=None if only is None else {view.rows[entry_id] for entry_id in only if entry_id in view.rows},
+        )
+        vectors = [_unit(query) for query in queries] if vector_weight else None
+        score = _score_numpy if np is not None else _score_python
+        return await asyncio.to_thread(score, view, vectors, len(queries), options)
+
+
+class _SearchOptions:
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+def _score_numpy(view: _View, vectors: Optional[List[bytes]], count: int, options: _SearchOptions):
+    rows = len(view.entry_ids)
+    if vectors is not None:
+        similarity = np.frombuffer(b"".join(vectors), dtype=np.float32).reshape(count, view.dim) @ view.matrix.T
+    else:
+        similarity = np.zeros((count, rows), dtype=np.float32)
+    scores = options.vector_weight * similarity
+    if options.importance_weight:
+        scores += options.importance_weight * (view.importance / 10)
+    if options.recency_weight:
+        age = np.maximum(options.now_ms - view.timestamps, 0)
+        scores += (options.recency_weight * np.power(0.5, age / options.half_life_ms)).astype(np.float32)
+    for query_index, extra in enumerate(options.extra or []):
+        if extra:
+            scores[query_index, np.fromiter(extra.keys(), dtype=np.int64, count=len(extra))] += np.fromiter(
+                extra.values(), dtype=np.float32, count=len(extra)
+            )
+    mask = view.alive.copy()
+    if options.allowed is not None:
+        allowed = np.zeros(rows, dtype=bool)
+        allowed[list(options.allowed)] = True
+        mask &= allowed
+    candidates = int(mask.sum())
+    if not candidates:
+        return [[] for _ in range(count)]
+    scores[:, ~mask] = -np.inf
+
+    k = min(options.k, candidates)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    results = []
+    for query_index, picked in enumerate(top):
+        picked = picked[np.argsort(-scores[query_index, picked])]
+        results.append([
+            (view.entry_ids[row], float(scores[query_index, row]), float(similarity[query_index, row]))
+            for row in picked
+            if options.min_score is None or scores[query_index, row] >= options.min_score
+        ])
+    return results
+
+
+def _score_python(view: _View, vectors: Optional[List[bytes]], count: int, options: _SearchOptions):
+    candidates = [
+        row for row, entry_id in enumerate(view.entry_ids)
+        if entry_id is not None and (options.allowed is None or row in options.allowed)
+    ]
+    bonus = {}
+    for row in candidates:
+        value = options.importance_weight * view.importance[row] / 10
+        if options.recency_weight:
+            age = max(options.now_ms - view.timestamps[row], 0)
+            value += options.recency_weight * 0.5 ** (age / options.half_life_ms)
+        bonus[row] = value
+
+    results = []
+    dim = view.dim
+    for query_index in range(count):
+        vector = array("f", vectors[query_index]) if vectors is not None else None
+        extra = options.extra[query_index] if options.extra else {}
+        scored = []
+        for row in candidates:
+            similarity = 0.0
+            if vector is not None:
+                offset = row * dim
+                similarity = sum(q * m for q, m in zip(vector, view.matrix[offset:offset + dim]))
+            score = options.vector_weight * similarity + bonus[row] + extra.get(row, 0.0)
+            scored.append((score, similarity, view.entry_ids[row]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        results.append([
+            (entry_id, score, similarity)
+            for score, similarity, entry_id in scored[:options.k]
+            if options.min_score is None or score >= options.min_score
+        ])
+    return results
+
+
+# === 存档级缓存 ===
+_stores: "OrderedDict[Tuple[int, str], MemoryStore]" = OrderedDict()
+_open_lock = asyncio.Lock()
+_metrics: Dict[str, int] = {"searches": 0, "queries": 0, "appended": 0, "deleted": 0, "compactions": 0}
+
+
+def check_slot(slot: str) -> str:
+    if not SLOT_PATTERN.match(slot):
+        raise MemoryStoreError("存档标识只能包含字母、数字、下划线与连字符（最长 64 位）")
+    return slot
+
+
+def _evict() -> None:
+    """超出上限时移出最久未用且没有请求在使用的存档"""
+    for key in list(_stores):
+        if len(_stores) <= settings.VECTOR_MEMORY_OPEN_STORES:
+            break
+        if not _stores[key].users:
+            del _stores[key]
+
+
+@asynccontextmanager
+async def open_store(user_id: int, slot: str) -> AsyncIterator[MemoryStore]:
+    """获取（必要时加载）存档的向量记忆；使用期间不会被移出缓存，避免同一文件出现两个写入方"""
+    key = (user_id, check_slot(slot))
+    store = _stores.get(key)
+    if store is None:
+        async with _open_lock:
+            store = _stores.get(key)
+            if store is None:
+                store = MemoryStore(user_id, slot)
+                await store.load()
+                _stores[key] = store
+    store.users += 1
+    _stores.move_to_end(key)
+    _evict()
+    try:
+        yield store
+    finally:
+        store.users -= 1
+        _evict()
+
+
+async def clear(user_id: int, slot: str) -> int:
+    """清空存档的全部向量记忆，返回删除条数"""
+    async with open_store(user_id, slot) as store:
+        async with store.lock:
+            removed = await VectorMemory.filter(user_id=user_id, slot=slot).delete()
+            if os.path.isfile(store.path):
+                os.remove(store.path)
+            # 原地重置，仍在使用该对象的请求看到的是空存档
+            await store.load()
+    return removed
+
+
+def drop_user(user_id: int) -> None:
+    """删除用户的全部矩阵文件（数据库记录由级联删除处理）"""
+    for key in [key for key in _stores if key[0] == user_id]:
+        del _stores[key]
+    shutil.rmtree(os.path.join(settings.VECTOR_MEMORY_DIR, str(user_id)), ignore_errors=True)
+
+
+def get_metrics() -> Dict[str, Any]:
+    return {**_metrics, "open_stores": len(_stores), "numpy": np is not None}
@@ -0,0 +1,121 @@
+"""
+世界目录 - 可穿越世界列表的查询与热门首页缓存
+按 (visibility_mode, updated_at) 复合索引倒序取行，翻页使用 (updated_at, id) 游标；主人名搜索为用户名唯一索引上的前缀范围查询。
+不带搜索的前若干行短时缓存（不含调用者过滤，按请求剔除自己的世界），可见性/穿越策略变化或用户失效时清空。
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from tortoise.expressions import Q
+
+from ..models import WorldInstance
+from ..core.config import settings
+from ..core.security import BEIJING_TZ
+from . import user_cache
+
+# 出现在可穿越列表中的可见性（locked 不列出）
+LISTED_VISIBILITY = ("public", "hidden")
+VALUES = (
+    "id", "owner_id", "owner__user_name", "owner__presence__last_seen_at",
+    "visibility_mode", "allow_offline_travel", "created_at", "updated_at",
+)
+
+# 可见性（None 表示全部） -> (过期时间, 行)
+_pages: Dict[Optional[str], Tuple[float, List[Dict[str, Any]]]] = {}
+_metrics: Dict[str, int] = {"cache_hits": 0, "cache_misses": 0, "queries": 0, "invalidated": 0}
+
+
+class CursorError(ValueError):
+    pass
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """游标：更新时间（微秒时间戳）与ID，可直接放入查询串"""
+    return f"{(row['updated_at'] - _EPOCH) // timedelta(microseconds=1)}_{row['id']}"
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        micros, row_id = cursor.split("_", 1)
+        # 与库中存储的时区一致，否则 SQLite 按字符串比较时顺序错乱
+        return (_EPOCH + timedelta(microseconds=int(micros))).astimezone(BEIJING_TZ), int(row_id)
+    except ValueError:
+        raise CursorError("无效的翻页游标")
+
+
+async def _query(
+    visibility: Optional[str],
+    search: Optional[str],
+    cursor: Optional[str],
+    exclude_owner_id: Optional[int],
+    skip: int,
+    limit: int
+) -> List[Dict[str, Any]]:
+    _metrics["queries"] += 1
+    query = WorldInstance.filter(
+        visibility_mode__in=[visibility] if visibility else list(LISTED_VISIBILITY),
+        owner__is_active=True,
+    )
+    if exclude_owner_id is not None:
+        query = query.exclude(owner_id=exclude_owner_id)
+    if search:
+        query = query.filter(owner__user_name__gte=search, owner__user_name__lt=search + "\U0010ffff")
+    if cursor:
+        updated_at, row_id = _decode_cursor(cursor)
+        query = query.filter(Q(updated_at__lt=updated_at) | Q(updated_at=updated_at, id__lt=row_id))
+    return await query.order_by("-updated_at", "-id").offset(skip).limit(limit).values(*VALUES)
+
+
+async def _first_rows(visibility: Optional[str]) -> List[Dict[str, Any]]:
+    cached = _pages.get(visibility)
+    now = time.monotonic()
+    if cached is not None and cached[0] > now:
+        _metrics["cache_hits"] += 1
+        return cached[1]
+    _metrics["cache_misses"] += 1
+    rows = await _query(visibility, None, None, None, 0, settings.WORLD_LIST_CACHE_ROWS)
+    _pages[visibility] = (now + settings.WORLD_LIST_CACHE_TTL, rows)
+    return rows
+
+
+async def list_worlds(
+    user_id: int,
+    skip: int = 0,
+    limit: int = 20,
+    visibility: Optional[str] = None,
+    search: Optional[str] = None,
+    cursor: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """可穿越世界（不含自己的），按最近活跃倒序；给出 cursor 时从游标之后开始并忽略 skip"""
+    if visibility and visibility not in LISTED_VISIBILITY:
+        return []
+    if not search and not cursor and settings.WORLD_LIST_CACHE_TTL > 0:
+        rows = await _first_rows(visibility)
+        others = [row for row in rows if row["owner_id"] != user_id]
+        # 缓存行数不足上限说明已是完整结果
+        if skip + limit <= len(others) or len(rows) < settings.WORLD_LIST_CACHE_ROWS:
+            return others[skip:skip + limit]
+    return await _query(visibility, search, cursor, user_id, 0 if cursor else skip, limit)
+
+
+def invalidate() -> None:
+    """可见性或穿越策略变化后调用"""
+    if _pages:
+        _pages.clear()
+        _metrics["invalidated"] += 1
+
+
+def _invalidate_users(user_ids) -> None:
+    # 用户改名或被禁用时列表中的主人信息随之变化
+    invalidate()
+
+
+user_cache.register_invalidator(_invalidate_users)
+
+
+def get_metrics() -> Dict[str, int]:
+    return {**_metrics, "cached_pages": len(_pages)}
@@ -0,0 +1,274 @@
+"""
+世界实例数据局部更新 - 按 JSON 路径修改 WorldInstance.instance_data，不整体重写
+每次更新是一条 UPDATE：在 SQL 中用 json_set / jsonb_set / JSON_SET 改动指定路径（缺失的上级自动创建），同时把 instance_data.revision 加一；
+给出 expected_revision 时只在版本一致时生效（乐观并发），否则返回冲突。普通列（可见性、策略、提示词）可在同一条语句中一并修改。
+"""
+import json
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from tortoise.transactions import in_transaction
+
+from ..models import WorldInstance
+from ..core.security import get_beijing_time
+from . import map_graph, world_directory
+
+OP_SET = "set"
+OP_REMOVE = "remove"
+REVISION_KEY = "revision"
+# 允许随 JSON 修改一并更新的列
+COLUMNS = ("visibility_mode", "allow_offline_travel", "offline_agent_prompt")
+# 影响可穿越列表的列
+LISTED_COLUMNS = ("visibility_mode", "allow_offline_travel")
+MAX_PATH_DEPTH = 16
+# 修改后需整体校验地图结构的顶层键（地图与入口位置）
+MAP_KEYS = ("maps", "entry")
+
+_KEY = re.compile(r"^[\w-]{1,64}$")
+
+PathPart = Union[str, int]
+Op = Tuple[str, Sequence[PathPart], Any]
+
+_metrics: Dict[str, int] = {"updates": 0, "ops": 0, "conflicts": 0}
+
+
+class WorldStateError(Exception):
+    def __init__(self, message: str, status_code: int = 400):
+        self.message = message
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def _check_path(path: Sequence[PathPart]) -> None:
+    if not path or len(path) > MAX_PATH_DEPTH:
+        raise WorldStateError("路径为空或层级过深")
+    if path[0] == REVISION_KEY:
+        raise WorldStateError("版本号由服务端维护，不能直接修改")
+    for part in path:
+        if isinstance(part, bool) or not (
+            (isinstance(part, int) and part >= 0) or (isinstance(part, str) and _KEY.match(part))
+        ):
+            raise WorldStateError(f"无效的路径片段: {part!r}")
+
+
+class _Dialect:
+    """各数据库的 JSON 函数与占位符"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.values: List[Any] = []
+
+    def param(self, value: Any) -> str:
+        self.values.append(value)
+        if self.name == "postgres":
+            return f"${len(self.values)}"
+        return "%s" if self.name == "mysql" else "?"
+
+    def path(self, path: Sequence[PathPart]) -> str:
+        if self.name == "postgres":
+            return f"{self.param([str(part) for part in path])}::text[]"
+        text = "$" + "".join(f"[{part}]" if isinstance(part, int) else f'."{part}"' for part in path)
+        return self.param(text)
+
+    def set(self, expr: str, path: Sequence[PathPart], value: Any) -> str:
+        encoded = json.dumps(value, ensure_ascii=False)
+        if self.name == "postgres":
+            return f"jsonb_set({expr}, {self.path(path)}, {self.param(encoded)}::jsonb, true)"
+        if self.name == "mysql":
+            return f"JSON_SET({expr}, {self.path(path)}, CAST({self.param(encoded)} AS JSON))"
+        return f"json_set({expr}, {self.path(path)}, json({self.param(encoded)}))"
+
+    def remove(self, expr: str, path: Sequence[PathPart]) -> str:
+        if self.name == "postgres":
+            return f"({expr} #- {self.path(path)})"
+        if self.name == "mysql":
+            return f"JSON_REMOVE({expr}, {self.path(path)})"
+        return f"json_remove({expr}, {self.path(path)})"
+
+    def ensure(self, expr: str, path: Sequence[PathPart], container: str) -> str:
+        """path 不存在时建为空对象/数组（按原文档取值，语句长度随层数线性增长）"""
+        if self.name == "postgres":
+            current = f"instance_data #> {self.path(path)}"
+            return f"jsonb_set({expr}, {self.path(path)}, COALESCE({current}, '{container}'::jsonb), true)"
+        empty = "JSON_OBJECT()" if container == "{}" else "JSON_ARRAY()"
+        return f"JSON_SET({expr}, {self.path(path)}, COALESCE(JSON_EXTRACT(instance_data, {self.path(path)}), {empty}))"
+
+    def exists(self, path: Sequence[PathPart]) -> str:
+        if self.name == "postgres":
+            return f"(instance_data #> {self.path(path)}) IS NOT NULL"
+        if self.name == "mysql":
+            return f"JSON_CONTAINS_PATH(instance_data, 'one', {self.path(path)})"
+        return f"json_type(instance_data, {self.path(path)}) IS NOT NULL"
+
+    def document(self) -> str:
+        if self.name == "postgres":
+            return "COALESCE(instance_data, '{}'::jsonb)"
+        if self.name == "mysql":
+            return "COALESCE(instance_data, JSON_OBJECT())"
+        return "COALESCE(instance_data, '{}')"
+
+    def revision(self) -> str:
+        if self.name == "postgres":
+            return f"COALESCE((instance_data->>'{REVISION_KEY}')::int, 0)"
+        if self.name == "mysql":
+            return f"COALESCE(JSON_EXTRACT(instance_data, '$.{REVISION_KEY}'), 0)"
+        return f"COALESCE(json_extract(instance_data, '$.{REVISION_KEY}'), 0)"
+
+    def bump(self, expr: str) -> str:
+        if self.name == "postgres":
+            return f"jsonb_set({expr}, '{{{REVISION_KEY}}}', to_jsonb({self.revision()} + 1), true)"
+        if self.name == "mysql":
+            return f"JSON_SET({expr}, '$.{REVISION_KEY}', {self.revision()} + 1)"
+        return f"json_set({expr}, '$.{REVISION_KEY}', {self.revision()} + 1)"
+
+    def column_value(self, value: Any) -> Any:
+        # 与 Tortoise 在 SQLite 中的存储格式一致
+        if self.name == "sqlite":
+            if isinstance(value, datetime):
+                return value.isoformat(" ")
+            if isinstance(value, bool):
+                return int(value)
+        return value
+
+
+def _parents(ops: Sequence[Op]) -> List[Tuple[Sequence[PathPart], str]]:
+    """set 路径上的各级上级（由短到长去重），及其应有的容器类型"""
+    parents: Dict[Tuple[PathPart, ...], str] = {}
+    for op, path, _ in ops:
+        if op == OP_SET:
+            for depth in range(1, len(path)):
+                parents.setdefault(tuple(path[:depth]), "[]" if isinstance(path[depth], int) else "{}")
+    return sorted(parents.items(), key=lambda item: len(item[0]))
+
+
+def _checked_paths(ops: Sequence[Op]) -> List[Sequence[PathPart]]:
+    """写入后应当存在的 set 路径（之后被同批 remove 覆盖的不检查）"""
+    paths = []
+    for position, (op, path, _) in enumerate(ops):
+        if op != OP_SET:
+            continue
+        removed = any(
+            later_op == OP_REMOVE and tuple(path[:len(later_path)]) == tuple(later_path)
+            for later_op, later_path, _ in ops[position + 1:]
+        )
+        if not removed:
+            paths.append(path)
+    return paths
+
+
+def _returning(dialect: _Dialect, checks: List[Sequence[PathPart]], with_data: bool) -> str:
+    fields = [f"{dialect.revision()} AS revision"]
+    fields += [f"{dialect.exists(path)} AS ok{index}" for index, path in enumerate(checks)]
+    if with_data:
+        fields.append("instance_data AS data")
+    return ", ".join(fields)
+
+
+def _build(dialect: _Dialect, world_instance_id: int, ops: Sequence[Op], columns: Dict[str, Any],
+           expected_revision: Optional[int], owner_id: Optional[int], checks: List[Sequence[PathPart]],
+           with_data: bool) -> str:
+    expr = dialect.document()
+    # PostgreSQL / MySQL 只会创建路径的最后一级，先补齐缺失的上级（SQLite 的 json_set 会自动创建）
+    if dialect.name != "sqlite":
+        for parent, container in _parents(ops):
+            expr = dialect.ensure(expr, parent, container)
+    for op, path, value in ops:
+        expr = dialect.set(expr, path, value) if op == OP_SET else dialect.remove(expr, path)
+    assignments = [f"instance_data = {dialect.bump(expr)}"]
+    for name, value in {**columns, "updated_at": get_beijing_time()}.items():
+        assignments.append(f"{name} = {dialect.param(dialect.column_value(value))}")
+    conditions = [f"id = {dialect.param(world_instance_id)}"]
+    if owner_id is not None:
+        conditions.append(f"owner_id = {dialect.param(owner_id)}")
+    if expected_revision is not None:
+        conditions.append(f"{dialect.revision()} = {dialect.param(expected_revision)}")
+    sql = f"UPDATE world_instances SET {', '.join(assignments)} WHERE {' AND '.join(conditions)}"
+    if dialect.name != "mysql":
+        sql += f" RETURNING {_returning(dialect, checks, with_data)}"
+    return sql
+
+
+async def _execute(connection, world_instance_id: int, ops: Sequence[Op], columns: Dict[str, Any],
+                   expected_revision: Optional[int], owner_id: Optional[int]) -> Optional[int]:
+    """在事务中执行更新并确认各 set 路径已写入、修改后的地图仍能编译；未命中行时返回 None"""
+    checks = _checked_paths(ops)
+    with_data = any(path[0] in MAP_KEYS for _, path, _ in ops)
+    dialect = _Dialect(connection.capabilities.dialect)
+    sql = _build(dialect, world_instance_id, ops, columns, expected_revision, owner_id, checks, with_data)
+    if dialect.name == "mysql":
+        changed, _ = await connection.execute_query(sql, dialect.values)
+        if not changed:
+            return None
+        # MySQL 不支持 RETURNING，在同一事务内读回
+        check = _Dialect(dialect.name)
+        fields = _returning(check, checks, with_data)
+        rows = await connection.execute_query_dict(
+            f"SELECT {fields} FROM world_instances WHERE id = {check.param(world_instance_id)}", check.values
+        )
+    else:
+        rows = await connection.execute_query_dict(sql, dialect.values)
+    if not rows:
+        return None
+    row = rows[0]
+    if not all(row[f"ok{index}"] for index in range(len(checks))):
+        # 上级是标量等无法写入的情况：抛出使事务回滚，不报告成功
+        raise WorldStateError("路径的上级不是对象或数组，无法写入")
+    if with_data:
+        data = row["data"]
+        try:
+            # 地图不合法时整条更新回滚，避免之后每次读取地图都失败
+            map_graph.validate(json.loads(data) if isinstance(data, (str, bytes)) else data or {})
+        except map_graph.MapGraphError as e:
+            raise WorldStateError(e.message)
+    return int(row["revision"])
+
+
+async def update(
+    world_instance_id: int,
+    ops: Sequence[Op] = (),
+    columns: Optional[Dict[str, Any]] = None,
+    expected_revision: Optional[int] = None,
+    owner_id: Optional[int] = None
+) -> int:
+    """
+    在一条语句中应用 JSON 路径修改（ops 为 (set/remove, 路径, 值)，按顺序执行）与列修改，返回新版本号。
+    缺失的上级对象/数组自动创建；给出 owner_id 时只修改该用户的实例；版本不一致时抛出 409。
+    """
+    columns = columns or {}
+    ops = list(ops)
+    for op, path, _ in ops:
+        if op not in (OP_SET, OP_REMOVE):
+            raise WorldStateError(f"不支持的操作: {op}")
+        _check_path(path)
+    unknown = set(columns) - set(COLUMNS)
+    if unknown:
+        raise WorldStateError(f"不能修改的字段: {', '.join(sorted(unknown))}")
+
+    async with in_transaction() as connection:
+        revision = await _execute(connection, world_instance_id, ops, columns, expected_revision, owner_id)
+
+    if revision is None:
+        query = WorldInstance.filter(id=world_instance_id)
+        if owner_id is not None:
+            query = query.filter(owner_id=owner_id)
+        if not await query.exists():
+            raise WorldStateError("世界不存在", 404)
+        _metrics["conflicts"] += 1
+        raise WorldStateError("世界数据已被修改，请刷新后重试", 409)
+
+    _metrics["updates"] += 1
+    _metrics["ops"] += len(ops)
+    if any(path[0] == "maps" for _, path, _ in ops):
+        map_graph.invalidate(world_instance_id)
+    if any(name in LISTED_COLUMNS for name in columns):
+        world_directory.invalidate()
+    return revision
+
+
+def revision_of(instance_data: Optional[Dict[str, Any]]) -> int:
+    return int((instance_data or {}).get(REVISION_KEY, 0))
+
+
+def get_metrics() -> Dict[str, int]:
+    return dict(_metrics)
@@ -62,6 +62,6 @@ echo.
 echo 按 Ctrl+C 停止服务
 echo.
 
-server\venv\Scripts\python.exe -m uvicorn server.main:app --host 0.0.0.0 --port 12345
+server\venv\Scripts\python.exe -m uvicorn server.main:app --host 0.0.0.0 --port 12345 --ws-per-message-deflate false
 
 pause
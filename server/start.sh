@@ -28,4 +28,4 @@ fi
 cd "$ROOT_DIR"
 
 echo "[Backend] Starting on :${PORT}"
-exec "$SCRIPT_DIR/venv/bin/python" -m uvicorn server.main:app --host 0.0.0.0 --port "$PORT"
+exec "$SCRIPT_DIR/venv/bin/python" -m uvicorn server.main:app --host 0.0.0.0 --port "$PORT" --ws-per-message-deflate false
@@ -0,0 +1,45 @@
+"""
+测试公共夹具 - 每个用例使用临时目录中的独立 SQLite 数据库与日志/向量目录
+"""
+import asyncio
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret-key-" + "x" * 32)
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-" + "x" * 32)
+
+import pytest
+from tortoise import Tortoise
+
+from server.core.config import settings
+from server.database.config import TORTOISE_ORM
+from server.models import User
+
+
+@pytest.fixture
+def run():
+    """在同一个事件循环中执行协程（用例本身保持同步）"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def db(run, tmp_path, monkeypatch):
+    """初始化空的 SQLite 数据库，并把文件目录指向临时目录"""
+    monkeypatch.setattr(settings, "TRAVEL_LOG_DIR", str(tmp_path / "travel_logs"))
+    monkeypatch.setattr(settings, "VECTOR_MEMORY_DIR", str(tmp_path / "vector_memory"))
+    config = {**TORTOISE_ORM, "connections": {"default": f"sqlite://{tmp_path / 'test.db'}"}}
+    run(Tortoise.init(config=config))
+    run(Tortoise.generate_schemas())
+    yield
+    run(Tortoise.close_connections())
+
+
+@pytest.fixture
+def make_user(run, db):
+    counter = iter(range(1, 10_000))
+
+    def factory(travel_points: int = 0) -> User:
+        return run(User.create(user_name=f"user{next(counter)}", password_hash="x", travel_points=travel_points))
+
+    return factory
@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+from server.core.config import settings
+from server.models import AdminJob, Character, TravelPointLedger, TravelSession, User, World, WorldInstance
+from server.services import cascade_delete, event_log, user_cache
+
+
+class _Crash(Exception):
+    pass
+
+
+@pytest.fixture
+def victim(run, make_user, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_JOB_CHUNK_SIZE", 1)
+    monkeypatch.setattr(settings, "ADMIN_JOB_CHUNK_PAUSE", 0)
+    monkeypatch.setattr(user_cache, "_disabled_ids", set())
+    monkeypatch.setattr(event_log, "_logs", {})
+    user, traveler = make_user(), make_user()
+    world = run(World.create(name="w", description="d"))
+    instance = run(WorldInstance.create(owner=user, world=world))
+    for _ in range(2):
+        session = run(TravelSession.create(traveler=traveler, target_user=user, world_instance=instance))
+        event_log.create(session.id)
+        event_log.append(session.id, "start")
+    run(event_log.flush())
+    event_log._logs.clear()
+    run(Character.create(user=user, char_name="c", save_data={"hp": 1}))
+    run(TravelPointLedger.create(user_id=user.id, kind="grant", delta=1, balance_after=1))
+    return user, traveler
+
+
+def _job(user_ids):
+    # 直接建任务行，不经 admin_jobs 调度，由用例自行执行
+    return AdminJob.create(kind=cascade_delete.JOB_KIND, params={"user_ids": user_ids}, total=len(user_ids))
+
+
+def _crash_at(monkeypatch, step_name):
+    delete_chunk = cascade_delete._delete_chunk
+
+    async def crashing(step, user_id, job):
+        if step.name == step_name:
+            raise _Crash(step_name)
+        return await delete_chunk(step, user_id, job)
+
+    monkeypatch.setattr(cascade_delete, "_delete_chunk", crashing)
+    return delete_chunk
+
+
+def test_resume_after_sessions_deleted_still_drops_logs(run, victim, monkeypatch):
+    user, traveler = victim
+    session_ids = run(TravelSession.all().order_by("id").values_list("id", flat=True))
+    assert sorted(os.listdir(settings.TRAVEL_LOG_DIR)) == sorted(str(session_id) for session_id in session_ids)
+    job = run(_job([user.id]))
+    delete_chunk = _crash_at(monkeypatch, "characters")
+
+    with pytest.raises(_Crash):
+        run(cascade_delete.run_delete_users(run(AdminJob.get(id=job.id))))
+
+    # 会话行已删除，但其ID随进度落库；账号已禁用
+    saved = run(AdminJob.get(id=job.id))
+    assert saved.progress["session_ids"] == session_ids
+    assert saved.progress["deleted"] == {"travel_sessions": 2, "world_instances": 1}
+    assert run(TravelSession.all().count()) == 0
+    assert not run(User.get(id=user.id)).is_active
+    assert user_cache.is_disabled(user.id)
+
+    monkeypatch.setattr(cascade_delete, "_delete_chunk", delete_chunk)
+    run(cascade_delete.run_delete_users(run(AdminJob.get(id=job.id))))
+
+    saved = run(AdminJob.get(id=job.id))
+    assert saved.processed == 1
+    assert "session_ids" not in saved.progress
+    assert saved.progress["deleted"]["characters"] == 1
+    assert saved.progress["deleted"]["travel_point_ledger"] == 1
+    assert not run(User.exists(id=user.id))
+    assert run(User.exists(id=traveler.id))
+    assert os.listdir(settings.TRAVEL_LOG_DIR) == []
+    assert user_cache.is_disabled(user.id)
+
+
+def test_load_keeps_deleted_users_disabled_after_restart(run, victim, monkeypatch):
+    user, traveler = victim
+    job = run(_job([user.id]))
+    run(cascade_delete.run_delete_users(job))
+    assert not run(User.exists(id=user.id))
+
+    # 重启后禁用集合只从现存用户加载，已删除的ID由删除任务恢复
+    monkeypatch.setattr(user_cache, "_disabled_ids", set())
+    run(cascade_delete.load())
+    assert user_cache.is_disabled(user.id)
+    assert not user_cache.is_disabled(traveler.id)
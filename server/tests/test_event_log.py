@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from server.core.config import settings
+from server.services import event_log
+
+SESSION_ID = 7
+
+
+@pytest.fixture
+def logs(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "TRAVEL_LOG_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "TRAVEL_LOG_SEGMENT_EVENTS", 4)
+    monkeypatch.setattr(settings, "TRAVEL_LOG_TAIL_EVENTS", 3)
+    monkeypatch.setattr(event_log, "_logs", {})
+    return tmp_path
+
+
+def _append(count):
+    return [event_log.append(SESSION_ID, "move", payload={"n": n})["seq"] for n in range(count)]
+
+
+def _seqs(events):
+    return [event["seq"] for event in events]
+
+
+def test_flush_splits_into_fixed_size_segments(run, logs):
+    event_log.create(SESSION_ID)
+    assert _append(6) == list(range(6))
+    assert run(event_log.flush()) == 6
+    assert event_log._logs[SESSION_ID].segments == [[0, 4], [4, 2]]
+
+    # 未满的分段先补满，再按首个序号新建分段
+    _append(5)
+    assert run(event_log.flush()) == 5
+    assert event_log._logs[SESSION_ID].segments == [[0, 4], [4, 4], [8, 3]]
+    assert sorted(os.listdir(logs / str(SESSION_ID))) == [
+        "0000000000.ndjson", "0000000004.ndjson", "0000000008.ndjson",
+    ]
+    assert len(event_log._logs[SESSION_ID].tail) == 3
+
+
+def test_read_spans_segments_and_tail(run, logs):
+    event_log.create(SESSION_ID)
+    _append(10)
+    run(event_log.flush())
+    _append(2)
+
+    # 内存只保留 3 条已落盘事件和 2 条未落盘事件：seq 7..11
+    events, next_seq = run(event_log.read(SESSION_ID, after_seq=-1, limit=100))
+    assert _seqs(events) == list(range(12))
+    assert next_seq == 12
+    events, _ = run(event_log.read(SESSION_ID, after_seq=2, limit=6))
+    assert _seqs(events) == list(range(3, 9))
+    events, _ = run(event_log.read(SESSION_ID, after_seq=8, limit=2))
+    assert _seqs(events) == [9, 10]
+    events, _ = run(event_log.read(SESSION_ID, after_seq=11))
+    assert events == []
+
+
+def test_reopen_truncates_partial_line(run, logs):
+    event_log.create(SESSION_ID)
+    _append(6)
+    run(event_log.flush())
+    with open(logs / str(SESSION_ID) / "0000000004.ndjson", "a", encoding="utf-8") as f:
+        f.write('{"seq": 6, "event_ty')
+
+    # 模拟重启：内存中的日志丢失，从分段文件恢复并续写
+    event_log._logs.clear()
+    run(event_log.open_log(SESSION_ID))
+    assert event_log._logs[SESSION_ID].segments == [[0, 4], [4, 2]]
+    assert _append(1) == [6]
+    run(event_log.flush())
+    events, next_seq = run(event_log.read(SESSION_ID, after_seq=3, limit=10))
+    assert _seqs(events) == [4, 5, 6]
+    assert next_seq == 7
+
+
+def test_closed_logs_read_from_segments_then_archive(run, logs):
+    event_log.create(SESSION_ID)
+    _append(9)
+    run(event_log.flush())
+    event_log._logs.clear()
+
+    events, next_seq = run(event_log.read(SESSION_ID, after_seq=2, limit=3))
+    assert (_seqs(events), next_seq) == ([3, 4, 5], 9)
+
+    run(event_log.archive(SESSION_ID))
+    assert not os.path.exists(logs / str(SESSION_ID))
+    events, next_seq = run(event_log.read(SESSION_ID, after_seq=6))
+    assert (_seqs(events), next_seq) == ([7, 8], 9)
+
+    run(event_log.drop([SESSION_ID]))
+    assert run(event_log.read(SESSION_ID)) == ([], 0)
+
+
+def test_append_without_open_log_is_dropped(logs):
+    assert event_log.append(SESSION_ID, "move") is None
@@ -0,0 +1,72 @@
+import pytest
+
+from server.services import presence
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(presence.time, "monotonic", clock)
+    return clock
+
+
+def _advance(wheel, clock, seconds):
+    clock.now += seconds
+    return sorted(wheel.advance())
+
+
+def test_expires_after_delay(clock):
+    wheel = presence.TimingWheel(tick=1.0, span=10.0)
+    wheel.schedule("a", 3.0)
+    wheel.schedule("b", 5.0)
+
+    assert _advance(wheel, clock, 2.9) == []
+    assert _advance(wheel, clock, 1.2) == ["a"]
+    assert len(wheel) == 1
+    assert _advance(wheel, clock, 2.0) == ["b"]
+    assert len(wheel) == 0
+
+
+def test_reschedule_and_cancel(clock):
+    wheel = presence.TimingWheel(tick=1.0, span=10.0)
+    wheel.schedule("a", 3.0)
+    wheel.schedule("b", 3.0)
+    clock.now += 2.0
+    wheel.schedule("a", 3.0)
+    wheel.cancel("b")
+    wheel.cancel("missing")
+
+    assert _advance(wheel, clock, 2.0) == []
+    assert _advance(wheel, clock, 2.0) == ["a"]
+    assert wheel.deadline == {}
+
+
+def test_lagging_advance_keeps_keys_that_are_not_due(clock):
+    wheel = presence.TimingWheel(tick=1.0, span=4.0)
+    wheel.schedule("soon", 1.0)
+    # 推进落后超过一整圈：绕回到的桶里尚未到期的键应重新放回
+    clock.now += 7.0
+    wheel.schedule("late", 1.0)
+    assert sorted(wheel.advance()) == ["soon"]
+    assert len(wheel) == 1
+
+    assert _advance(wheel, clock, 0.5) == []
+    assert _advance(wheel, clock, 1.5) == ["late"]
+
+
+def test_delay_longer_than_span_waits_full_delay(clock):
+    wheel = presence.TimingWheel(tick=1.0, span=3.0)
+    wheel.schedule("a", 9.0)
+
+    # 途中多次绕回该桶，都应放回而不是提前到期；到期后最多晚一个刻度
+    for _ in range(9):
+        assert _advance(wheel, clock, 1.0) == []
+    assert _advance(wheel, clock, 1.0) == ["a"]
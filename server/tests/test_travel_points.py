@@ -0,0 +1,76 @@
+import asyncio
+from datetime import timedelta
+
+from server.models import User, TravelPointLedger, TravelPointSnapshot
+from server.services import travel_points
+
+
+def _balance(run, user_id):
+    return run(User.filter(id=user_id).first().values_list("travel_points", flat=True))
+
+
+def test_consume_only_when_balance_suffices(run, make_user):
+    user = make_user(travel_points=10)
+
+    assert run(travel_points.consume_points(user.id, 4, "穿越")) == 6
+    assert run(travel_points.consume_points(user.id, 7)) is None
+    assert _balance(run, user.id) == 6
+
+    entries = run(TravelPointLedger.filter(user_id=user.id).values("kind", "delta", "balance_after"))
+    assert entries == [{"kind": travel_points.KIND_CONSUME, "delta": -4, "balance_after": 6}]
+
+
+def test_consume_missing_user(run, db):
+    assert run(travel_points.consume_points(12345, 1)) is None
+    assert run(TravelPointLedger.all().count()) == 0
+
+
+def test_concurrent_consumes_never_overdraw(run, make_user):
+    user = make_user(travel_points=10)
+
+    async def spend():
+        return await asyncio.gather(*(travel_points.consume_points(user.id, 3) for _ in range(5)))
+
+    results = run(spend())
+    assert sorted(result for result in results if result is not None) == [1, 4, 7]
+    assert results.count(None) == 2
+    assert _balance(run, user.id) == 1
+    assert run(TravelPointLedger.filter(user_id=user.id).count()) == 3
+
+
+def test_grant_and_set_record_actual_delta(run, make_user):
+    user = make_user(travel_points=5)
+
+    assert run(travel_points.grant_points(user.id, 10)) == 15
+    assert run(travel_points.grant_points(12345, 10)) is None
+    assert run(travel_points.set_points(user.id, 8, "调整")) == 8
+    # 与当前值相同时不写流水
+    assert run(travel_points.set_points(user.id, 8)) == 8
+    assert run(travel_points.set_points(12345, 8)) is None
+
+    deltas = run(TravelPointLedger.filter(user_id=user.id).order_by("id").values_list("kind", "delta"))
+    assert deltas == [(travel_points.KIND_GRANT, 10), (travel_points.KIND_ADJUST, -7)]
+
+
+def test_signin_once_per_day(run, make_user):
+    user = make_user()
+
+    assert run(travel_points.signin(user.id, 3)) == 3
+    assert run(travel_points.signin(user.id, 3)) is None
+    assert run(travel_points.signed_in_today(user.id))
+
+
+def test_roll_up_keeps_latest_balance_per_user(run, make_user, monkeypatch):
+    monkeypatch.setattr(travel_points, "SNAPSHOT_LAG", timedelta(0))
+    first, second = make_user(travel_points=10), make_user(travel_points=10)
+    run(travel_points.consume_points(first.id, 2))
+    run(travel_points.consume_points(first.id, 3))
+    run(travel_points.grant_points(second.id, 1))
+
+    assert run(travel_points.roll_up_snapshots()) == 3
+    assert run(travel_points.roll_up_snapshots()) == 0
+    run(travel_points.consume_points(second.id, 11))
+    assert run(travel_points.roll_up_snapshots(batch_size=10)) == 1
+
+    snapshots = dict(run(TravelPointSnapshot.all().values_list("user_id", "balance")))
+    assert snapshots == {first.id: 5, second.id: 0}
@@ -0,0 +1,114 @@
+import pytest
+
+from server.models import World, WorldInstance
+from server.services import world_state
+from server.services.world_state import OP_REMOVE, OP_SET, WorldStateError, _Dialect, _build, _checked_paths
+
+MAP = {
+    "map_id": 1,
+    "pois": [{"id": 1}, {"id": 2}],
+    "edges": [{"from_poi_id": 1, "to_poi_id": 2}],
+}
+
+
+def _sql(name, ops, expected_revision=None, owner_id=None):
+    dialect = _Dialect(name)
+    sql = _build(dialect, 5, ops, {}, expected_revision, owner_id, _checked_paths(ops), False)
+    return sql, dialect.values
+
+
+def test_sqlite_sets_path_without_ensuring_parents():
+    sql, values = _sql("sqlite", [(OP_SET, ["a", "b", 0], 1), (OP_REMOVE, ["c"], None)])
+
+    assert sql.startswith("UPDATE world_instances SET instance_data = json_set(json_remove(json_set(")
+    assert "JSON_OBJECT" not in sql
+    assert values[:3] == ['$."a"."b"[0]', "1", '$."c"']
+    assert sql.endswith(f"RETURNING {_Dialect('sqlite').revision()} AS revision, "
+                        "json_type(instance_data, ?) IS NOT NULL AS ok0")
+    assert sql.count("?") == len(values)
+
+
+def test_postgres_ensures_each_parent_with_matching_container():
+    sql, values = _sql("postgres", [(OP_SET, ["a", "b", 0], {"x": 1})], expected_revision=3, owner_id=9)
+
+    assert sql.count("jsonb_set(") == 4  # 两级上级 + 目标路径 + 版本号
+    assert ["a"] in values and ["a", "b"] in values
+    assert "'{}'::jsonb" in sql and "'[]'::jsonb" in sql
+    # WHERE 条件（id、owner_id、版本号）之后是 RETURNING 中检查路径的参数
+    assert values[-4:] == [5, 9, 3, ["a", "b", "0"]]
+    assert f"${len(values)}" in sql and f"${len(values) + 1}" not in sql
+
+
+def test_mysql_uses_percent_placeholders_and_no_returning():
+    sql, values = _sql("mysql", [(OP_SET, ["a", "b"], True)])
+
+    assert "RETURNING" not in sql
+    assert "JSON_SET(" in sql and "CAST(%s AS JSON)" in sql
+    assert "?" not in sql and "$1" not in sql
+    assert sql.count("%s") == len(values)
+
+
+def test_removed_set_paths_are_not_checked():
+    ops = [(OP_SET, ["a", "b"], 1), (OP_SET, ["c"], 2), (OP_REMOVE, ["a"], None)]
+    assert _checked_paths(ops) == [["c"]]
+
+
+@pytest.fixture
+def instance(run, make_user):
+    owner = make_user()
+    world = run(World.create(name="w", description="d"))
+    return run(WorldInstance.create(owner=owner, world=world, instance_data={"maps": [MAP]}))
+
+
+def _data(run, instance):
+    return run(WorldInstance.get(id=instance.id)).instance_data
+
+
+def test_update_creates_parents_and_bumps_revision(run, instance):
+    revision = run(world_state.update(instance.id, [(OP_SET, ["npc", "names", 0], "甲")]))
+    assert revision == 1
+    revision = run(world_state.update(
+        instance.id, [(OP_SET, ["npc", "mood"], "calm"), (OP_REMOVE, ["npc", "names"], None)],
+        columns={"visibility_mode": "public"}, expected_revision=1
+    ))
+
+    assert revision == 2
+    data = _data(run, instance)
+    assert data["npc"] == {"mood": "calm"}
+    assert data["maps"] == [MAP]
+    assert run(WorldInstance.get(id=instance.id)).visibility_mode == "public"
+
+
+def test_update_conflict_and_ownership(run, instance):
+    with pytest.raises(WorldStateError) as error:
+        run(world_state.update(instance.id, [(OP_SET, ["a"], 1)], expected_revision=4))
+    assert error.value.status_code == 409
+    with pytest.raises(WorldStateError) as error:
+        run(world_state.update(instance.id, [(OP_SET, ["a"], 1)], owner_id=instance.owner_id + 1))
+    assert error.value.status_code == 404
+    assert world_state.revision_of(_data(run, instance)) == 0
+
+
+@pytest.mark.parametrize("ops", [
+    [(OP_SET, ["maps", 0], 1), (OP_SET, ["maps", 0, "x"], 1)],
+    [(OP_SET, ["maps", 0, "edges", 0, "to_poi_id"], 99)],
+    [(OP_SET, ["entry"], {"map_id": 1, "poi_id": 5})],
+    [(OP_SET, ["maps", 1], MAP)],
+])
+def test_rejected_updates_roll_back(run, instance, ops):
+    with pytest.raises(WorldStateError) as error:
+        run(world_state.update(instance.id, ops))
+
+    assert error.value.status_code == 400
+    assert _data(run, instance) == {"maps": [MAP]}
+
+
+def test_invalid_paths_and_columns(run, instance):
+    for ops, columns in (
+        ([(OP_SET, ["revision"], 5)], None),
+        ([(OP_SET, ["bad key"], 1)], None),
+        ([("append", ["a"], 1)], None),
+        ([], {"owner_id": 2}),
+    ):
+        with pytest.raises(WorldStateError):
+            run(world_state.update(instance.id, ops, columns=columns))
@@ -46,3 +46,22 @@ export async function getMyPresence(): Promise<PresenceStatusResponse> {
 export async function getPresenceStatus(username: string): Promise<PresenceStatusResponse> {
   return request.get<PresenceStatusResponse>(`/api/v1/presence/status/${encodeURIComponent(username)}`);
 }
+
+export type PresenceBatchResponse = {
+  statuses: Array<{
+    user_id: number;
+    user_name: string;
+    is_online: boolean;
+    last_heartbeat_at: string | null;
+  }>;
+  not_found: { user_ids: number[]; user_names: string[] };
+  server_time: string;
+};
+
+// 批量查询（单次最多 500 个用户）
+export async function getPresenceBatch(
+  user_names: string[] = [],
+  user_ids: number[] = []
+): Promise<PresenceBatchResponse> {
+  return request.post<PresenceBatchResponse>('/api/v1/presence/batch', { user_names, user_ids });
+}
@@ -13,11 +13,83 @@ export interface RemotePromptConfig {
     content: string;
     enabled: boolean;
     description?: string;
+    hash?: string;
+    version?: number;
   }>;
   version: string;
   lastUpdated?: string;
 }
 
+// 提示词清单：各条目的内容哈希与版本号
+interface RemotePromptManifest {
+  version: string;
+  lastUpdated?: string;
+  keys: Record<string, { hash: string; version: number }>;
+}
+
+interface RemotePromptBatch {
+  version: string;
+  prompts: RemotePromptConfig['prompts'];
+  missing: string[];
+}
+
+const LOCAL_CACHE_KEY = 'remote_prompt_config';
+const BATCH_SIZE = 500;
+
+function loadLocalConfig(): RemotePromptConfig | null {
+  try {
+    const raw = localStorage.getItem(LOCAL_CACHE_KEY);
+    return raw ? (JSON.parse(raw) as RemotePromptConfig) : null;
+  } catch {
+    return null;
+  }
+}
+
+function saveLocalConfig(config: RemotePromptConfig): void {
+  try {
+    localStorage.setItem(LOCAL_CACHE_KEY, JSON.stringify(config));
+  } catch (error) {
+    console.warn('[提示词配置] 本地缓存写入失败:', error);
+  }
+}
+
+/**
+ * 按清单增量同步：只下载哈希与本地缓存不一致的条目
+ */
+async function syncRemotePromptConfig(): Promise<RemotePromptConfig> {
+  const manifest = await request.get<RemotePromptManifest>('/api/v1/prompts/config/manifest');
+  const local = loadLocalConfig();
+  if (local && local.version === manifest.version) {
+    return local;
+  }
+  const localPrompts = local?.prompts ?? {};
+
+  const prompts: RemotePromptConfig['prompts'] = {};
+  const stale: string[] = [];
+  for (const [key, meta] of Object.entries(manifest.keys)) {
+    const cached = localPrompts[key];
+    if (cached && cached.hash === meta.hash) {
+      prompts[key] = { ...cached, version: meta.version };
+    } else {
+      stale.push(key);
+    }
+  }
+
+  for (let i = 0; i < stale.length; i += BATCH_SIZE) {
+    const batch = await request.post<RemotePromptBatch>('/api/v1/prompts/config/batch', {
+      keys: stale.slice(i, i + BATCH_SIZE),
+    });
+    Object.assign(prompts, batch.prompts);
+  }
+  if (stale.length) {
+    console.log(`[提示词配置] 增量下载 ${stale.length} 个提示词`);
+  }
+
+  const config: RemotePromptConfig = { prompts, version: manifest.version, lastUpdated: manifest.lastUpdated };
+  saveLocalConfig(config);
+  return config;
+}
+
 // 缓存远程配置
 let cachedRemoteConfig: RemotePromptConfig | null = null;
 let lastFetchTime = 0;
@@ -41,7 +113,7 @@ export async function fetchRemotePromptConfig(): Promise<RemotePromptConfig | nu
   }
 
   try {
-    const config = await request<RemotePromptConfig>('/api/v1/prompts/config', { method: 'GET' });
+    const config = await syncRemotePromptConfig();
     cachedRemoteConfig = config;
     lastFetchTime = now;
     console.log('[提示词配置] 成功获取远程配置:', config.version);
@@ -100,6 +172,7 @@ export function getAllRemotePrompts(): Record<string, { content: string; enabled
 export function clearRemotePromptCache(): void {
   cachedRemoteConfig = null;
   lastFetchTime = 0;
+  localStorage.removeItem(LOCAL_CACHE_KEY);
   console.log('[提示词配置] 已清除远程配置缓存');
 }
 